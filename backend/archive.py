@@ -0,0 +1,118 @@
+"""
+Hot/cold lifecycle: move long-expired batches out of the hot tables
+
+archive_expired() moves every batch that expired more than ARCHIVE_AFTER_DAYS
+ago, together with its offers, their reservations and pickups, and its impact
+rows, into the matching *_archive tables (models.py). Live-offer, feed,
+no-show and repricing queries then only ever see recent data, however much
+history has built up.
+
+Batches move in chunks of ARCHIVE_CHUNK_SIZE, longest expired first, each
+chunk in one transaction: copy into the archive tables, delete from the hot
+ones. A run that stops half way leaves whole batches in one place or the
+other, and the next run carries on from there. Batches with a reservation still open
+stay hot until the relist job has closed it.
+
+The impact rollups are left as they are, so /impact and /impact/series do
+not change, and rebuild_impact_rollups() reads the archived impact rows too.
+GET /batches and GET /reservations take include_archived=true to read the
+archive alongside the hot rows, in the same keyset order.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from cache import offer_cache
+from models import *
+from schemas import BatchResponse, ReservationResponse
+from services import _filter_batches, _keyset_page, _list_rows, batches_query
+from versions import BATCHES, bump_versions
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+# Batches per transaction, with everything that hangs off them
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "500"))
+
+def _move(db: Session, model, archive_model, condition, now: datetime):
+    """Copy model's rows matching condition into archive_model, then delete them"""
+    columns = [column.name for column in archive_model.__table__.columns if column.name != "archived_at"]
+    db.execute(insert(archive_model).from_select(
+        columns + ["archived_at"],
+        select(*(model.__table__.c[name] for name in columns), literal(now, archive_model.archived_at.type))
+        .where(condition)
+    ))
+    return db.execute(delete(model).where(condition).execution_options(synchronize_session=False)).rowcount
+
+def archive_expired(db: Session, since: Optional[datetime] = None, max_batches: Optional[int] = None,
+                    chunk_size: int = ARCHIVE_CHUNK_SIZE, after_days: float = ARCHIVE_AFTER_DAYS):
+    """
+    Archive batches that expired more than after_days ago, with their
+    offers, reservations, pickups and impact. since is accepted for the
+    scheduler and ignored: a batch becomes old by time passing, not by a write.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    # Few reservations are open at a time: one small set, not a probe per batch
+    open_batches = (
+        select(Offer.batch_id)
+        .join(Reservation, Reservation.offer_id == Offer.id)
+        .where(Reservation.status == ReservationStatus.RESERVED, Offer.batch_id.is_not(None))
+    )
+    counts = {"archived_batches": 0, "archived_offers": 0, "archived_reservations": 0,
+              "archived_pickups": 0, "archived_impact": 0}
+    while max_batches is None or counts["archived_batches"] < max_batches:
+        limit = chunk_size if max_batches is None else min(chunk_size, max_batches - counts["archived_batches"])
+        batch_ids = db.execute(
+            select(Batch.id)
+            .where(Batch.expiry_ts < cutoff, Batch.id.not_in(open_batches))
+            .order_by(Batch.expiry_ts, Batch.id)
+            .limit(limit)
+        ).scalars().all()
+        if not batch_ids:
+            break
+
+        now = datetime.utcnow()
+        offer_ids = select(Offer.id).where(Offer.batch_id.in_(batch_ids))
+        reservation_ids = select(Reservation.id).where(Reservation.offer_id.in_(offer_ids))
+        # Children first: each step finds its rows through the parents still in place
+        counts["archived_pickups"] += _move(db, Pickup, PickupArchive,
+                                            Pickup.reservation_id.in_(reservation_ids), now)
+        counts["archived_reservations"] += _move(db, Reservation, ReservationArchive,
+                                                 Reservation.offer_id.in_(offer_ids), now)
+        counts["archived_impact"] += _move(db, Impact, ImpactArchive, Impact.batch_id.in_(batch_ids), now)
+        counts["archived_offers"] += _move(db, Offer, OfferArchive, Offer.batch_id.in_(batch_ids), now)
+        counts["archived_batches"] += _move(db, Batch, BatchArchive, Batch.id.in_(batch_ids), now)
+        bump_versions(db, BATCHES)
+        db.commit()
+        if len(batch_ids) < limit:
+            break
+
+    if counts["archived_offers"]:
+        offer_cache.invalidate()
+    return counts
+
+# Historical reads: hot and archived rows merged in id order. A batch's ids
+# never change when it moves, so the two id-ordered pages merge into one.
+def _merge_by_id(hot, archived, limit: Optional[int] = None):
+    rows = sorted(hot + archived, key=lambda row: row.id)
+    return rows[:limit] if limit is not None else rows
+
+def archived_batches_query(db: Session, after_id: Optional[int] = None, limit: Optional[int] = None,
+                           store_id: Optional[int] = None, category: Optional[str] = None,
+                           expires_after: Optional[datetime] = None, expires_before: Optional[datetime] = None):
+    query = _filter_batches(db.query(BatchArchive), store_id, category, expires_after, expires_before,
+                            model=BatchArchive)
+    return _keyset_page(query, BatchArchive.id, after_id, limit)
+
+def get_batch_history_rows(db: Session, **filters):
+    """A keyset page of batches, archived ones included, as BatchResponse rows"""
+    return _merge_by_id(_list_rows(batches_query(db, **filters), BatchResponse),
+                        _list_rows(archived_batches_query(db, **filters), BatchResponse), filters.get("limit"))
+
+def get_user_reservation_history_rows(db: Session, user_id: int):
+    """A user's reservations, archived ones included, as ReservationResponse rows"""
+    return _merge_by_id(
+        _list_rows(db.query(Reservation).filter(Reservation.user_id == user_id), ReservationResponse),
+        _list_rows(db.query(ReservationArchive).filter(ReservationArchive.user_id == user_id), ReservationResponse),
+    )
@@ -0,0 +1,232 @@
+"""
+Async versions of the services used by the API routes
+
+Each function runs its counterpart from services.py, so the service code
+stays the single implementation. By default it runs on a worker thread with
+a sync session bound to the matching engine (primary or replica), so the
+event loop keeps serving other requests while the database works, as it did
+for the sync routes before the async layer. With ASYNC_DB_ENABLED it runs on
+the route's AsyncSession through run_sync instead: every statement goes
+through the async driver (aiosqlite or asyncpg).
+
+With SHARD_DATABASE_URLS set (see sharding.py), writes go to the shard that
+owns the store or id, catalog writes are copied to every shard, and reads
+that span stores run through sharded_services on every shard at once.
+"""
+import asyncio
+import contextvars
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import RouteDB, SessionLocal, engine
+from group_commit import GroupCommitter, group_commit_enabled
+from schemas import *
+from sharding import merge_counts, shard_router
+import archive
+import services
+import sharded_services
+import versions
+
+# SQLite has a single writer. Writes from several threads would queue on its
+# lock, and on the async driver a write transaction would stay open while
+# other requests run on the loop, so queued writers starve or fail with
+# "database is locked". Instead SQLite writes run start to finish on one
+# dedicated thread with a sync session, in arrival order. Each shard has its
+# own writer (shard 0's is this one).
+_sqlite_writer = shard_router.shards[0].writer
+
+def _run_sync(session_factory, service, args, kwargs):
+    # Not expired on commit, like the async sessions: the route serializes
+    # the result after the session is closed
+    db = session_factory(expire_on_commit=False)
+    try:
+        return service(db, *args, **kwargs)
+    finally:
+        db.close()
+
+async def _run(db: RouteDB, service, *args, **kwargs):
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(service, *args, **kwargs)
+    return await asyncio.to_thread(_run_sync, db, service, args, kwargs)
+
+async def _write(db: RouteDB, service, *args, **kwargs):
+    if engine.dialect.name != "sqlite":
+        return await _run(db, service, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the request's context so its metrics see the statements
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_sqlite_writer, context.run, _run_sync, SessionLocal, service, args, kwargs)
+
+# With GROUP_COMMIT on, reservations and pickups are committed in groups. The
+# groups run on the SQLite writer thread too, so all writes stay serialized.
+group_committer = GroupCommitter(_sqlite_writer)
+group_committers = [group_committer] + [
+    GroupCommitter(shard.writer, session_factory=shard.SessionLocal) for shard in shard_router.shards[1:]
+]
+
+async def _write_catalog(db: RouteDB, service, *args):
+    # Created on the catalog shard, then copied to the others
+    obj = await _write(db, service, *args)
+    if shard_router.sharded:
+        await asyncio.to_thread(shard_router.replicate, obj)
+    return obj
+
+async def _write_sharded(db: RouteDB, shard, service, *args, **kwargs):
+    if shard_router.sharded:
+        return await shard_router.write(shard, service, *args, **kwargs)
+    return await _write(db, service, *args, **kwargs)
+
+async def _write_everywhere(db: RouteDB, service, *args, **kwargs):
+    # Jobs over every store: each shard in its own transaction, counts summed
+    if shard_router.sharded:
+        return merge_counts(await shard_router.write_all(service, *args, **kwargs))
+    return await _write(db, service, *args, **kwargs)
+
+# Collection versions for conditional GET
+async def get_collection_versions(db: RouteDB, collections):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_versions, collections)
+    return await _run(db, versions.get_versions, collections)
+
+# Product services
+async def get_all_products(db: RouteDB, **filters):
+    return await _run(db, services.get_all_products, **filters)
+
+async def get_all_products_json(db: RouteDB, **filters):
+    return await _run(db, services.get_all_products_json, **filters)
+
+async def create_product_service(db: RouteDB, product: ProductCreate):
+    return await _write_catalog(db, services.create_product_service, product)
+
+# Batch services
+async def get_all_batches(db: RouteDB, **filters):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_all_batches, **filters)
+    return await _run(db, services.get_all_batches, **filters)
+
+async def get_all_batches_json(db: RouteDB, **filters):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_all_batches_json, **filters)
+    return await _run(db, services.get_all_batches_json, **filters)
+
+async def get_batch_history(db: RouteDB, **filters):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_batch_history, **filters)
+    return await _run(db, archive.get_batch_history_rows, **filters)
+
+async def create_batch_service(db: RouteDB, batch: BatchCreate):
+    return await _write_sharded(db, shard_router.for_store(batch.store_id), services.create_batch_service, batch)
+
+# Offer services
+async def get_offers_for_user(db: RouteDB, user_type: str, **filters):
+    return await _run(db, services.get_offers_for_user, user_type, **filters)
+
+async def get_cached_offers(db: RouteDB, user_type: str, **filters):
+    # Cache hits return before the session checks out a connection
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_cached_offers, user_type, **filters)
+    return await _run(db, services.get_cached_offers, user_type, **filters)
+
+async def get_offer_feed(db: RouteDB, user_type: str = "public", **filters):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_offer_feed, user_type, **filters)
+    return await _run(db, services.get_offer_feed, user_type, **filters)
+
+async def get_offer_feed_json(db: RouteDB, user_type: str = "public", **filters):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_offer_feed_json, user_type, **filters)
+    return await _run(db, services.get_offer_feed_json, user_type, **filters)
+
+async def create_offer_service(db: RouteDB, offer: OfferCreate):
+    return await _write_sharded(db, shard_router.for_id(offer.batch_id), services.create_offer_service, offer)
+
+# Store services
+async def create_store_service(db: RouteDB, store: StoreCreate):
+    return await _write_catalog(db, services.create_store_service, store)
+
+async def get_all_stores(db: RouteDB):
+    return await _run(db, services.get_all_stores)
+
+async def search_offers(db: RouteDB, latitude: float, longitude: float, radius_km: float, **filters):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.search_offers, latitude, longitude, radius_km, **filters)
+    return await _run(db, services.search_offers, latitude, longitude, radius_km, **filters)
+
+async def search_offers_json(db: RouteDB, latitude: float, longitude: float, radius_km: float, **filters):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.search_offers_json, latitude, longitude, radius_km,
+                                       **filters)
+    return await _run(db, services.search_offers_json, latitude, longitude, radius_km, **filters)
+
+# Reservation services
+async def create_reservation(db: RouteDB, reservation: ReservationCreate):
+    shard = shard_router.for_id(reservation.offer_id)
+    if group_commit_enabled():
+        return await group_committers[shard.index].submit(services.stage_reservation, reservation)
+    return await _write_sharded(db, shard, services.create_reservation, reservation)
+
+async def get_user_reservations(db: RouteDB, user_id: int):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_user_reservations, user_id)
+    return await _run(db, services.get_user_reservations, user_id)
+
+async def get_user_reservations_json(db: RouteDB, user_id: int):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_user_reservations_json, user_id)
+    return await _run(db, services.get_user_reservations_json, user_id)
+
+async def get_user_reservation_history(db: RouteDB, user_id: int):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_user_reservation_history, user_id)
+    return await _run(db, archive.get_user_reservation_history_rows, user_id)
+
+# Pickup services
+async def confirm_pickup_service(db: RouteDB, pickup: PickupCreate):
+    shard = shard_router.for_id(pickup.reservation_id)
+    if group_commit_enabled():
+        return await group_committers[shard.index].submit(services.stage_pickup, pickup)
+    return await _write_sharded(db, shard, services.confirm_pickup_service, pickup)
+
+async def confirm_pickups_batch_service(db: RouteDB, pickups: PickupBatchCreate):
+    if not shard_router.sharded:
+        return await _write(db, services.confirm_pickups_batch_service, pickups)
+    # One transaction per shard: a failure on one shard leaves the others confirmed
+    requests = sharded_services.split_pickup_batch(pickups)
+    results = await asyncio.gather(*(
+        shard_router.write(shard, services.confirm_pickups_batch_service, request)
+        for shard, request in zip(shard_router.shards, requests) if request is not None
+    ))
+    return sharded_services.merge_pickup_batches(pickups, results)
+
+async def handle_no_shows(db: RouteDB, max_reservations: Optional[int] = None,
+                          since: Optional[datetime] = None):
+    # With shards, max_reservations bounds each shard's run
+    return await _write_everywhere(db, services.handle_no_shows, max_reservations=max_reservations, since=since)
+
+# Impact services
+async def get_impact_metrics(db: RouteDB):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_impact_metrics)
+    return await _run(db, services.get_impact_metrics)
+
+async def get_impact_series(db: RouteDB, bucket: str = "day", store_id: Optional[int] = None,
+                            category: Optional[str] = None, start: Optional[date] = None,
+                            end: Optional[date] = None):
+    if shard_router.sharded:
+        return await asyncio.to_thread(sharded_services.get_impact_series, bucket, store_id, category, start, end)
+    return await _run(db, services.get_impact_series, bucket, store_id, category, start, end)
+
+# Markdown engine
+async def apply_markdown_engine(db: RouteDB, since: Optional[datetime] = None):
+    return await _write_everywhere(db, services.apply_markdown_engine, since)
+
+async def reprice_offers(db: RouteDB):
+    import pricing  # NumPy loads on first use, not at worker startup
+    return await _write_everywhere(db, pricing.reprice_offers)
+
+# Archiving
+async def archive_expired(db: RouteDB, max_batches: Optional[int] = None):
+    # With shards, max_batches bounds each shard's run
+    return await _write_everywhere(db, archive.archive_expired, max_batches=max_batches)
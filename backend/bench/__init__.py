@@ -0,0 +1,4 @@
+"""
+Benchmarks, one standalone script each. They import the app modules, so run
+them from backend/ as modules: python -m bench.bench_<name> --help
+"""
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Hot-query latency as history grows, with and without archiving
+
+For each history length in --days, the script generates a fresh SQLite
+database with synthetic_data.py at --batches-per-day, so every run has the
+same recent traffic and only the amount of history differs. It times the
+queries behind the hot endpoints and scheduled jobs (median of --repeat
+runs each), then runs archive.archive_expired() with --after-days and times
+them again.
+
+Without archiving the hot tables keep every batch ever received, and the
+queries that read a store's, a user's or a category's recent rows walk more
+of them as history grows. Archived, the hot tables hold about --after-days
+of batches whatever the history, so the latencies after archiving should
+stay flat from one history length to the next.
+
+Usage: python -m bench.bench_archive [--days 30,90,180,360] [--batches-per-day 300] [--after-days 30] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from database import create_db_engine
+from models import *
+from synthetic_data import SyntheticConfig, generate
+import archive
+import pricing
+import services
+
+def queries(now, user_id, store_id):
+    """(name, func(db)) for the reads behind the hot endpoints and jobs"""
+    return [
+        ("GET /offers page", lambda db: services.get_offers_for_user(db, "public", limit=100)),
+        ("GET /offers store", lambda db: services.get_offers_for_user(db, "public", store_id=store_id)),
+        ("GET /offers/feed", lambda db: services.get_offer_feed(db, "public", limit=100)),
+        ("GET /batches expiring", lambda db: services.get_all_batches(
+            db, expires_after=now, expires_before=now + timedelta(hours=24))),
+        ("GET /reservations", lambda db: services.get_user_reservations(db, user_id)),
+        ("reprice snapshot", lambda db: pricing.load_snapshot(db, now)),
+        ("pickup rates", lambda db: pricing.pickup_rates(db, now)),
+        # Both jobs write nothing once the warm-up run has caught up
+        ("markdown job", lambda db: services.apply_markdown_engine(db)),
+        ("relist job", lambda db: services.handle_no_shows(db)),
+    ]
+
+def time_queries(Session, named_queries, repeat):
+    timings = {}
+    for name, query in named_queries:
+        samples = []
+        for attempt in range(repeat + 1):
+            db = Session()
+            try:
+                start = time.perf_counter()
+                query(db)
+                elapsed = time.perf_counter() - start
+            finally:
+                db.close()
+            if attempt:  # the first run warms the page cache
+                samples.append(elapsed)
+        timings[name] = statistics.median(samples) * 1000
+    return timings
+
+def hot_batches(Session):
+    db = Session()
+    try:
+        return db.execute(select(func.count()).select_from(Batch)).scalar()
+    finally:
+        db.close()
+
+def busiest(Session, column):
+    db = Session()
+    try:
+        return db.execute(select(column).group_by(column).order_by(func.count().desc()).limit(1)).scalar()
+    finally:
+        db.close()
+
+def run(days, args, directory):
+    engine = create_db_engine(f"sqlite:///{os.path.join(directory, f'history{days}.db')}")
+    generate(engine, SyntheticConfig(stores=args.stores, products=1000, users=args.users,
+                                     batches=int(args.batches_per_day * days), days=days),
+             log=lambda message: None)
+    Session = sessionmaker(bind=engine)
+    now = datetime.utcnow()
+    named_queries = queries(now, busiest(Session, Reservation.user_id),
+                            busiest(Session, Batch.store_id))
+
+    before_rows = hot_batches(Session)
+    before = time_queries(Session, named_queries, args.repeat)
+    db = Session()
+    try:
+        start = time.perf_counter()
+        moved = archive.archive_expired(db, after_days=args.after_days)
+        archive_seconds = time.perf_counter() - start
+    finally:
+        db.close()
+    after = time_queries(Session, named_queries, args.repeat)
+    after_rows = hot_batches(Session)
+    engine.dispose()
+    return before_rows, after_rows, moved, archive_seconds, before, after
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", default="30,90,180,360", help="history lengths to compare")
+    parser.add_argument("--batches-per-day", type=float, default=300)
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--after-days", type=float, default=30, help="archive batches expired this long ago")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for days in (int(value) for value in args.days.split(",")):
+            print(f"{days} days of history ({int(args.batches_per_day * days)} batches)...")
+            results[days] = run(days, args, directory)
+            before_rows, after_rows, moved, archive_seconds, _, _ = results[days]
+            print(f"  archived {moved['archived_batches']} batches, {moved['archived_offers']} offers, "
+                  f"{moved['archived_reservations']} reservations in {archive_seconds:.1f}s; "
+                  f"hot batches {before_rows} -> {after_rows}")
+
+    history = list(results)
+    names = list(results[history[0]][4])
+    print(f"\nMedian latency in ms, before -> after archiving batches expired over {args.after_days:g} days ago")
+    print(f"{'query':<24}" + "".join(f"{f'{days} days':>20}" for days in history))
+    for name in names:
+        print(f"{name:<24}" + "".join(
+            f"{f'{results[days][4][name]:.2f} -> {results[days][5][name]:.2f}':>20}" for days in history))
+
+if __name__ == "__main__":
+    main()
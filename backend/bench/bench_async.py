@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Throughput and tail latency of the API under many concurrent clients
+
+Runs the same request mix against three servers, each in its own uvicorn
+process on a freshly seeded database (a throwaway SQLite file, or PostgreSQL
+with --postgres: BENCH_POSTGRES_URL or an embedded pgserver):
+- sync: async def routes calling the synchronous Session, the way main.py
+  worked before the async data layer (every query blocks the event loop)
+- default: main.app as deployed, services on worker threads with sync sessions
+- async: main.app with ASYNC_DB_ENABLED, services on the async driver
+
+The mix is mostly small offer reads and reservations plus a share of large
+batch listings, so a slow query can hold up the fast ones.
+
+Usage: python -m bench.bench_async [--clients 500] [--seconds 15] [--offers 5000] [--postgres]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+STORES = 50
+# (weight, name) of each request type in the mix
+MIX = [(50, "GET /offers"), (20, "GET /offers/feed"), (20, "POST /reserve"), (10, "GET /batches")]
+
+def legacy_app():
+    """main.py's routes for the mix, with the sync Session they used before"""
+    from typing import List
+    from fastapi import Depends, FastAPI, Response
+    from sqlalchemy.orm import Session
+    from database import get_db, get_read_db
+    from schemas import BatchResponse, OfferFeedItem, ReservationCreate, ReservationResponse
+    import services
+
+    app = FastAPI()
+
+    @app.get("/")
+    async def root():
+        return {}
+
+    @app.get("/offers")
+    async def get_offers(store_id: int = None, limit: int = None, db: Session = Depends(get_read_db)):
+        payload, _ = services.get_cached_offers(db, "public", store_id=store_id, limit=limit)
+        return Response(content=payload, media_type="application/json")
+
+    @app.get("/offers/feed", response_model=List[OfferFeedItem])
+    async def get_offers_feed(store_id: int = None, limit: int = None, db: Session = Depends(get_read_db)):
+        return services.get_offer_feed(db, "public", store_id=store_id, limit=limit)
+
+    @app.get("/batches", response_model=List[BatchResponse])
+    async def get_batches(limit: int = None, db: Session = Depends(get_read_db)):
+        return services.get_all_batches(db, limit=limit)
+
+    @app.post("/reserve", response_model=ReservationResponse)
+    async def reserve_offer(reservation: ReservationCreate, db: Session = Depends(get_db)):
+        return services.create_reservation(db, reservation)
+
+    return app
+
+def seed(url, n_offers):
+    from sqlalchemy import insert
+    from database import Base, create_db_engine
+    from models import Batch, Offer, OfferAudience, Product
+
+    now = datetime.utcnow()
+    engine = create_db_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"ASY{i:05d}", "name": f"Product {i}", "category": random.choice(["Dairy", "Bakery", "Produce"]),
+             "size": "1 unit", "base_price": 3.0, "weight_grams": 500}
+            for i in range(1, 201)
+        ])
+        conn.execute(insert(Batch), [
+            {"product_id": random.randint(1, 200), "qty_total": 10 ** 6, "qty_available": 10 ** 6,
+             "expiry_ts": now + timedelta(days=2), "store_id": random.randint(1, STORES)}
+            for _ in range(n_offers)
+        ])
+        conn.execute(insert(Offer), [
+            {"batch_id": i, "discount_pct": 30, "start_ts": now, "end_ts": now + timedelta(days=1),
+             "audience": OfferAudience.PUBLIC}
+            for i in range(1, n_offers + 1)
+        ])
+    engine.dispose()
+
+def request_for(name, n_offers):
+    store_id = random.randint(1, STORES)
+    if name == "GET /offers":
+        return "GET", f"/offers?store_id={store_id}&limit=50", None
+    if name == "GET /offers/feed":
+        return "GET", f"/offers/feed?store_id={store_id}&limit=50", None
+    if name == "GET /batches":
+        return "GET", "/batches?limit=1000", None
+    now = datetime.utcnow()
+    return "POST", "/reserve", json.dumps({
+        "offer_id": random.randint(1, n_offers), "user_id": random.randint(1, 1000), "qty_reserved": 1,
+        "pickup_start_ts": now.isoformat(), "pickup_end_ts": (now + timedelta(hours=2)).isoformat()}).encode()
+
+async def send(reader, writer, method, path, body):
+    """One keep-alive HTTP/1.1 exchange; returns the status code"""
+    head = f"{method} {path} HTTP/1.1\r\nHost: bench\r\n"
+    if body is not None:
+        head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+    writer.write(head.encode() + b"\r\n" + (body or b""))
+    status_line, *headers = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    length = next(int(h.split(":", 1)[1]) for h in headers if h.lower().startswith("content-length:"))
+    await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+async def load(port, clients, seconds, n_offers):
+    # A bare asyncio client: on a small machine a full HTTP client library
+    # would use more CPU than the server under test
+    names = [name for _, name in MIX]
+    weights = [weight for weight, _ in MIX]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                name = random.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    ok = await send(reader, writer, *request_for(name, n_offers)) == 200
+                except (OSError, asyncio.IncompleteReadError):
+                    errors[name] += 1
+                    writer.close()
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    continue
+                if ok:
+                    latencies[name].append(time.perf_counter() - start)
+                else:
+                    errors[name] += 1
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return latencies, errors
+
+def wait_for_server(base_url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+def postgres_url(tmp):
+    url = os.getenv("BENCH_POSTGRES_URL")
+    if url:
+        return url, None
+    import pgserver
+    server = pgserver.get_server(os.path.join(tmp, "pg"), cleanup_mode="stop")
+    return server.get_uri().replace("postgresql://", "postgresql+psycopg2://", 1), server
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+def report(label, latencies, errors, seconds):
+    total = sum(len(v) for v in latencies.values())
+    print(f"{label}: {total / seconds:.0f} req/sec, errors={sum(errors.values())}")
+    rows = sorted(latencies.items()) + [("all", [x for v in latencies.values() for x in v])]
+    for name, values in rows:
+        values = sorted(values)
+        if values:
+            print(f"  {name:18} n={len(values):6}  p50={percentile(values, 0.50):8.1f}ms  "
+                  f"p95={percentile(values, 0.95):8.1f}ms  p99={percentile(values, 0.99):8.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--offers", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--postgres", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(0)
+    tmp = tempfile.TemporaryDirectory()
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pg_url, pg_server = postgres_url(tmp.name) if args.postgres else (None, None)
+    for label, target in (("sync", "bench.bench_async:legacy_app"), ("default", "main:app"), ("async", "main:app")):
+        url = pg_url or f"sqlite:///{os.path.join(tmp.name, f'{label}.db')}"
+        seed(url, args.offers)
+        env = dict(os.environ, DATABASE_URL=url, OFFER_CACHE_TTL_SECONDS="0", SCHEDULER_ENABLED="false",
+                   ASYNC_DB_ENABLED=str(label == "async").lower())
+        if label == "sync":
+            # Sync dependencies check out connections on the 40-thread pool;
+            # a smaller pool stalls them until pool_timeout
+            env.update(DB_POOL_SIZE="50", DB_MAX_OVERFLOW="0")
+        command = [sys.executable, "-m", "uvicorn", target, "--port", str(args.port), "--log-level", "warning",
+                   "--backlog", str(args.clients * 2), "--timeout-keep-alive", "60"]
+        if target.endswith("legacy_app"):
+            command.append("--factory")
+        process = subprocess.Popen(command, cwd=backend, env=env)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            wait_for_server(base_url, process)
+            latencies, errors = asyncio.run(load(args.port, args.clients, args.seconds, args.offers))
+        finally:
+            process.terminate()
+            process.wait()
+        report(f"{label} ({args.clients} clients)", latencies, errors, args.seconds)
+    if pg_server is not None:
+        pg_server.cleanup()
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
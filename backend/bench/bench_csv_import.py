@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Measure CSV batch import throughput (rows/sec) against a fresh SQLite file
+
+Usage: python -m bench.bench_csv_import [--rows 10000 200000] [--skus 5000] [--chunk-size 5000]
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from csv_import import CHUNK_SIZE, import_batches_stream
+
+CATEGORIES = ["Dairy", "Bakery", "Produce", "Meat", "Frozen"]
+
+def make_csv(n_rows, n_skus):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["sku", "name", "category", "size", "base_price", "weight_grams", "qty_total", "expiry_hours"])
+    for _ in range(n_rows):
+        sku = random.randint(1, n_skus)
+        writer.writerow([f"SKU{sku:06d}", f"Product {sku}", CATEGORIES[sku % len(CATEGORIES)], "1 unit",
+                         round(random.uniform(1, 10), 2), random.choice([200, 500, 1000]),
+                         random.randint(1, 40), random.randint(1, 72)])
+    return out.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 200000])
+    parser.add_argument("--skus", type=int, default=5000)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'seconds':>9} {'rows/sec':>10} {'errors':>7}")
+    for n in args.rows:
+        random.seed(n)
+        content = make_csv(n, args.skus)
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind=engine)
+            db = sessionmaker(bind=engine)()
+            try:
+                start = time.perf_counter()
+                result = import_batches_stream(csv.DictReader(io.StringIO(content)), store_id=1,
+                                               db=db, chunk_size=args.chunk_size)
+                elapsed = time.perf_counter() - start
+            finally:
+                db.close()
+                engine.dispose()
+        assert result["created_batches"] == n, result
+        print(f"{n:>10} {elapsed:>9.2f} {n / elapsed:>10.0f} {result['error_count']:>7}")
+
+if __name__ == "__main__":
+    main()
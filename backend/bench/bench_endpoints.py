@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Per-endpoint latency and query baseline for every route in main.py
+
+Runs main.app in-process (TestClient with the lifespan, scheduler off)
+against a synthetic dataset. By default the dataset is generated into a
+throwaway SQLite file with synthetic_data.py; with --database-url the
+harness uses data you loaded before. Each route is called --requests times
+with seeded parameters. For each route the harness records throughput,
+p50/p95/p99 latency and SQL statements per request, and writes them as JSON.
+
+With --compare the run is checked against an earlier JSON file. The
+harness exits 1 if a route issues more queries per request than before, or
+if its p95 grew more than --tolerance and --min-delta-ms, so CI can gate on
+it. Query counts are deterministic for a seed; latency is not, so the p95
+defaults only catch coarse regressions:
+
+    python -m bench.bench_endpoints --scale small --output baseline.json        # on main
+    python -m bench.bench_endpoints --scale small --compare baseline.json       # on the branch
+
+Every API route must have a scenario below or be listed in EXCLUDED; a
+new route without one fails the run.
+
+Usage: python -m bench.bench_endpoints [--scale small] [--requests 200] [--seed 0] [--database-url URL]
+       [--output bench_endpoints.json] [--compare baseline.json] [--tolerance 0.5]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Routes the harness does not call, with the reason
+EXCLUDED = {
+    ("GET", "/events"): "server-sent event stream that stays open until the client leaves",
+}
+
+class State:
+    """Ids from the dataset that the scenarios draw parameters from"""
+
+    def __init__(self, engine, rng):
+        from sqlalchemy import func, select
+        from models import Batch, Offer, OfferAudience, Product, Reservation, ReservationStatus, Store, User, UserRole
+
+        now = datetime.utcnow()
+        self.rng = rng
+        with engine.connect() as conn:
+            self.stores = conn.execute(select(func.max(Batch.store_id))).scalar() or 1
+            self.max_batch_id = conn.execute(select(func.max(Batch.id))).scalar() or 1
+            self.product_ids = conn.execute(select(Product.id).limit(1000)).scalars().all()
+            self.categories = conn.execute(select(Product.category).distinct()).scalars().all()
+            self.store_points = conn.execute(select(Store.latitude, Store.longitude)).all() or [(40.5, -74.45)]
+            self.customer_ids = conn.execute(
+                select(User.id).where(User.role == UserRole.CUSTOMER).limit(5000)).scalars().all()
+            self.staff_id = conn.execute(select(User.id).where(User.role == UserRole.STORE).limit(1)).scalar() or 1
+            # Live public offers with stock to reserve against
+            self.live_offer_ids = conn.execute(
+                select(Offer.id).join(Batch, Batch.id == Offer.batch_id)
+                .where(Offer.audience == OfferAudience.PUBLIC, Offer.start_ts <= now, Offer.end_ts > now,
+                       Batch.qty_available >= 5)
+                .limit(5000)).scalars().all()
+            # Users with the most reservations, so /reservations reads real lists
+            self.reserving_user_ids = conn.execute(
+                select(Reservation.user_id).group_by(Reservation.user_id)
+                .order_by(func.count().desc()).limit(100)).scalars().all() or [1]
+            self.reserved = [tuple(row) for row in conn.execute(
+                select(Reservation.id, Reservation.confirmation_code)
+                .where(Reservation.status == ReservationStatus.RESERVED))]
+        if not self.live_offer_ids or not self.customer_ids or not self.product_ids:
+            raise SystemExit("Dataset has no live offers, customers or products; load it with synthetic_data.py")
+        self.sku_counter = 0
+
+    def new_sku(self):
+        self.sku_counter += 1
+        return f"BENCH{self.sku_counter:07d}"
+
+    def take_reserved(self, n):
+        taken, self.reserved = self.reserved[:n], self.reserved[n:]
+        return taken
+
+# Scenarios: (name, method, route template, build, share of --requests).
+# build(state) returns the TestClient request keyword arguments, or None
+# once the state it consumes (reservations to confirm) has run out.
+def _pickup_window():
+    now = datetime.utcnow()
+    return now.isoformat(), (now + timedelta(hours=2)).isoformat()
+
+def _reserve(state):
+    start, end = _pickup_window()
+    return {"url": "/reserve", "json": {
+        "offer_id": state.rng.choice(state.live_offer_ids), "user_id": state.rng.choice(state.customer_ids),
+        "qty_reserved": 1, "pickup_start_ts": start, "pickup_end_ts": end}}
+
+def _confirm(state):
+    taken = state.take_reserved(1)
+    if taken:
+        return {"url": "/pickup/confirm", "json": {"reservation_id": taken[0][0], "staff_id": state.staff_id}}
+
+def _confirm_batch(state):
+    taken = state.take_reserved(10)
+    if taken:
+        return {"url": "/pickup/confirm/batch",
+                "json": {"staff_id": state.staff_id, "confirmation_codes": [code for _, code in taken]}}
+
+def _products_csv(state, rows=10):
+    lines = ["sku,name,category,size,base_price,weight_grams"]
+    lines += [f"{state.new_sku()},Bench product,{state.rng.choice(state.categories)},1 unit,3.49,400"
+              for _ in range(rows)]
+    return "\n".join(lines) + "\n"
+
+def _batches_csv(state, rows=10):
+    lines = ["sku,name,category,size,base_price,weight_grams,qty_total,expiry_hours"]
+    lines += [f"{state.new_sku()},Bench product,{state.rng.choice(state.categories)},1 unit,3.49,400,20,48"
+              for _ in range(rows)]
+    return "\n".join(lines) + "\n"
+
+def _store(state):
+    return state.rng.randint(1, state.stores)
+
+def _category(state):
+    return state.rng.choice(state.categories)
+
+def _search(state):
+    # Around a store, as a shopper in its neighbourhood would search
+    lat, lon = state.rng.choice(state.store_points)
+    return {"url": f"/offers/search?lat={lat:.5f}&lon={lon:.5f}&radius_km=5&limit=50"}
+
+SCENARIOS = [
+    ("GET /", "GET", "/", lambda s: {"url": "/"}, 1),
+    ("GET /products", "GET", "/products",
+     lambda s: {"url": f"/products?limit=100&category={_category(s)}"}, 1),
+    ("GET /products ndjson", "GET", "/products", lambda s: {"url": "/products?format=ndjson&limit=500"}, 0.25),
+    ("GET /batches", "GET", "/batches", lambda s: {"url": f"/batches?store_id={_store(s)}&limit=100"}, 1),
+    ("GET /batches ndjson", "GET", "/batches",
+     lambda s: {"url": f"/batches?format=ndjson&store_id={_store(s)}&limit=500"}, 0.25),
+    ("GET /offers", "GET", "/offers", lambda s: {"url": f"/offers?store_id={_store(s)}&limit=50"}, 1),
+    ("GET /offers nonprofit", "GET", "/offers",
+     lambda s: {"url": f"/offers?user_type=nonprofit&category={_category(s)}&limit=50"}, 1),
+    ("GET /offers ndjson", "GET", "/offers",
+     lambda s: {"url": f"/offers?format=ndjson&store_id={_store(s)}&limit=500"}, 0.25),
+    ("GET /offers/feed", "GET", "/offers/feed", lambda s: {"url": f"/offers/feed?store_id={_store(s)}&limit=50"}, 1),
+    ("GET /offers/search", "GET", "/offers/search", _search, 1),
+    ("GET /offers/search filtered", "GET", "/offers/search",
+     lambda s: {"url": f"{_search(s)['url']}&category={_category(s)}&min_discount=40&expiring_within_hours=24"}, 1),
+    ("GET /stores", "GET", "/stores", lambda s: {"url": "/stores"}, 0.25),
+    ("GET /offers/cache/stats", "GET", "/offers/cache/stats", lambda s: {"url": "/offers/cache/stats"}, 1),
+    ("GET /reservations", "GET", "/reservations",
+     lambda s: {"url": f"/reservations?user_id={s.rng.choice(s.reserving_user_ids)}"}, 1),
+    ("GET /impact", "GET", "/impact", lambda s: {"url": "/impact"}, 1),
+    ("GET /impact/series", "GET", "/impact/series",
+     lambda s: {"url": f"/impact/series?bucket={s.rng.choice(['day', 'week', 'month'])}&store_id={_store(s)}"}, 1),
+    ("GET /events/stats", "GET", "/events/stats", lambda s: {"url": "/events/stats"}, 1),
+    ("GET /scheduler/metrics", "GET", "/scheduler/metrics", lambda s: {"url": "/scheduler/metrics"}, 1),
+    ("GET /metrics", "GET", "/metrics", lambda s: {"url": "/metrics"}, 0.25),
+    # Writes run after the reads so they do not change what the reads see
+    ("POST /products", "POST", "/products", lambda s: {"url": "/products", "json": {
+        "sku": s.new_sku(), "name": "Bench product", "category": _category(s), "size": "1 unit",
+        "base_price": 3.49, "weight_grams": 400}}, 1),
+    ("POST /stores", "POST", "/stores", lambda s: {"url": "/stores", "json": {
+        "name": "Bench store", "latitude": s.rng.uniform(40.3, 40.7), "longitude": s.rng.uniform(-74.7, -74.2)}}, 0.1),
+    ("POST /batches", "POST", "/batches", lambda s: {"url": "/batches", "json": {
+        "product_id": s.rng.choice(s.product_ids), "qty_total": 20, "qty_available": 20,
+        "expiry_ts": (datetime.utcnow() + timedelta(days=2)).isoformat(), "store_id": _store(s)}}, 1),
+    ("POST /offers", "POST", "/offers", lambda s: {"url": "/offers", "json": {
+        "batch_id": s.rng.randint(1, s.max_batch_id), "discount_pct": 30, "start_ts": datetime.utcnow().isoformat(),
+        "end_ts": (datetime.utcnow() + timedelta(days=1)).isoformat(), "audience": "public"}}, 1),
+    ("POST /reserve", "POST", "/reserve", _reserve, 1),
+    ("POST /pickup/confirm", "POST", "/pickup/confirm", _confirm, 1),
+    ("POST /pickup/confirm/batch", "POST", "/pickup/confirm/batch",
+     _confirm_batch, 0.25),
+    ("POST /pickup/relist", "POST", "/pickup/relist", lambda s: {"url": "/pickup/relist?max_reservations=100"}, 0.1),
+    ("POST /markdown/calculate", "POST", "/markdown/calculate", lambda s: {"url": "/markdown/calculate"}, 0.1),
+    ("POST /markdown/reprice", "POST", "/markdown/reprice", lambda s: {"url": "/markdown/reprice"}, 0.1),
+    ("POST /import/products", "POST", "/import/products",
+     lambda s: {"url": "/import/products", "json": {"csv_content": _products_csv(s)}}, 0.25),
+    ("POST /import/batches", "POST", "/import/batches",
+     lambda s: {"url": "/import/batches", "json": {"csv_content": _batches_csv(s), "store_id": _store(s)}}, 0.25),
+    ("POST /import/products/upload", "POST", "/import/products/upload",
+     lambda s: {"url": "/import/products/upload",
+                "files": {"file": ("products.csv", io.BytesIO(_products_csv(s).encode()), "text/csv")}}, 0.25),
+    ("POST /import/batches/upload", "POST", "/import/batches/upload",
+     lambda s: {"url": "/import/batches/upload", "data": {"store_id": str(_store(s))},
+                "files": {"file": ("batches.csv", io.BytesIO(_batches_csv(s).encode()), "text/csv")}}, 0.25),
+]
+
+# Responses the later scenarios build on: new reservations are confirmed by the pickup routes
+RECORDERS = {
+    "POST /reserve": lambda state, body: state.reserved.append((body["id"], body["confirmation_code"])),
+}
+
+def check_coverage(app):
+    from fastapi.routing import APIRoute
+    routes = {(method, route.path) for route in app.routes if isinstance(route, APIRoute) for method in route.methods}
+    covered = {(method, route) for _, method, route, _, _ in SCENARIOS}
+    missing = sorted(routes - covered - set(EXCLUDED))
+    if missing:
+        raise SystemExit("No benchmark scenario for: " + ", ".join(f"{m} {p}" for m, p in missing))
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+def run(client, engines, state, n_requests, warmup):
+    from sqlalchemy import event
+
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    for engine in engines:
+        event.listen(engine, "after_cursor_execute", count)
+
+    results = {}
+    for name, method, route, build, share in SCENARIOS:
+        n = max(1, int(n_requests * share))
+        if method == "GET":
+            for _ in range(min(warmup, n)):
+                client.request(method, **build(state))
+        latencies, errors, queries = [], 0, 0
+        started = time.perf_counter()
+        for _ in range(n):
+            kwargs = build(state)
+            if kwargs is None:
+                break
+            before = statements
+            start = time.perf_counter()
+            response = client.request(method, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            queries += statements - before
+            if response.status_code >= 400:
+                errors += 1
+            elif name in RECORDERS:
+                RECORDERS[name](state, response.json())
+        elapsed = time.perf_counter() - started
+        if not latencies:
+            print(f"  {name:30} skipped: no data left to drive it")
+            continue
+        latencies.sort()
+        results[name] = {
+            "route": f"{method} {route}",
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "queries_per_request": round(queries / len(latencies), 2),
+        }
+        r = results[name]
+        print(f"  {name:30} n={r['requests']:5}  {r['throughput_rps']:8.1f} req/s  p50={r['p50_ms']:8.2f}ms  "
+              f"p95={r['p95_ms']:8.2f}ms  p99={r['p99_ms']:8.2f}ms  q/req={r['queries_per_request']:6.2f}"
+              + (f"  errors={errors}" if errors else ""))
+
+    for engine in engines:
+        event.remove(engine, "after_cursor_execute", count)
+    return results
+
+def compare(current, baseline, tolerance, min_delta_ms, query_tolerance):
+    """Regressions of current against baseline, as printable lines"""
+    regressions = []
+    for key in ("dialect", "scale", "dataset", "requests", "seed"):
+        if current["meta"][key] != baseline["meta"][key]:
+            print(f"  warning: {key} differs from the baseline ({baseline['meta'][key]} -> {current['meta'][key]})")
+    for name, before in baseline["endpoints"].items():
+        after = current["endpoints"].get(name)
+        if after is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance) and after["p95_ms"] - before["p95_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {after['p95_ms']:.2f}ms")
+        if after["queries_per_request"] > before["queries_per_request"] + query_tolerance:
+            regressions.append(f"{name}: queries/request {before['queries_per_request']} -> "
+                               f"{after['queries_per_request']}")
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+    for name in current["endpoints"].keys() - baseline["endpoints"].keys():
+        print(f"  new endpoint (no baseline): {name}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="use an already loaded database instead of generating one")
+    parser.add_argument("--scale", default="small", help="synthetic_data.py preset to generate")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint (some run a share)")
+    parser.add_argument("--warmup", type=int, default=5, help="unrecorded requests per read endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_endpoints.json")
+    parser.add_argument("--compare", help="baseline JSON to check this run against")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative p95 growth")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="p95 growth always allowed, for noise")
+    parser.add_argument("--query-tolerance", type=float, default=0.0, help="allowed growth in queries/request")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    url = args.database_url or f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    # Configure before main.py builds its engines
+    os.environ.update(DATABASE_URL=url, SCHEDULER_ENABLED="false")
+    os.environ.pop("DATABASE_REPLICA_URL", None)
+
+    from sqlalchemy import func, select
+    from fastapi.testclient import TestClient
+    from database import SQLITE_PRAGMAS, create_db_engine
+    from models import Batch, Offer, Reservation
+    import synthetic_data
+
+    loader = create_db_engine(url, sqlite_pragmas={**SQLITE_PRAGMAS, "synchronous": "OFF"})
+    if args.database_url is None:
+        print(f"Generating the {args.scale} dataset...")
+        config = synthetic_data.SyntheticConfig(**synthetic_data.SCALES[args.scale], seed=args.seed)
+        synthetic_data.generate(loader, config, log=lambda line: None)
+    with loader.connect() as conn:
+        dataset = {name: conn.execute(select(func.count()).select_from(model)).scalar()
+                   for name, model in (("batches", Batch), ("offers", Offer), ("reservations", Reservation))}
+    state = State(loader, random.Random(args.seed))
+    loader.dispose()
+
+    # The queries/request column already shows repeated statements
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+    import sqlalchemy
+    import database
+    import main as api
+    check_coverage(api.app)
+    engines = [database.engine, database.read_engine,
+               *(e.sync_engine for e in (database.async_engines() if database.async_db_enabled() else ()))]
+    print(f"{args.requests} requests per endpoint against {database.engine.dialect.name} ({dataset})")
+    with TestClient(api.app) as client:
+        endpoints = run(client, set(engines), state, args.requests, args.warmup)
+
+    current = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "dialect": database.engine.dialect.name,
+            "scale": None if args.database_url else args.scale,
+            "dataset": dataset,
+            "requests": args.requests,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "endpoints": endpoints,
+        "excluded": {f"{m} {p}": reason for (m, p), reason in EXCLUDED.items()},
+    }
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Wrote {args.output}")
+    tmp.cleanup()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance, args.min_delta_ms, args.query_tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write load test against different database engine setups
+
+Writer threads reserve units with the same conditional UPDATE as POST /reserve
+while reader threads run the GET /offers query. Compares SQLite in its default
+rollback-journal mode, SQLite with the WAL pragmas from database.py, and
+PostgreSQL when one is available (BENCH_POSTGRES_URL, or an embedded server
+if the pgserver package is installed).
+
+Usage: python -m bench.bench_engine [--readers 8] [--writers 4] [--seconds 5] [--offers 2000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, create_db_engine
+from models import *
+from schemas import ReservationCreate
+import services
+
+def seed(engine, n_offers):
+    now = datetime.utcnow()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"ENG{i:05d}", "name": f"Product {i}", "category": "Dairy",
+             "size": "1 unit", "base_price": 3.0, "weight_grams": 500}
+            for i in range(1, 101)
+        ])
+        conn.execute(insert(Batch), [
+            {"product_id": random.randint(1, 100), "qty_total": 10 ** 6, "qty_available": 10 ** 6,
+             "expiry_ts": now + timedelta(days=2), "store_id": random.randint(1, 20)}
+            for _ in range(n_offers)
+        ])
+        conn.execute(insert(Offer), [
+            {"batch_id": i, "discount_pct": 30, "start_ts": now, "end_ts": now + timedelta(days=1),
+             "audience": OfferAudience.PUBLIC}
+            for i in range(1, n_offers + 1)
+        ])
+
+def run(engine, readers, writers, seconds, n_offers):
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    deadline = time.perf_counter() + seconds
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    now = datetime.utcnow()
+
+    def read():
+        db = Session()
+        try:
+            services.get_offers_for_user(db, "public", store_id=random.randint(1, 20))
+        finally:
+            db.close()
+
+    def write():
+        db = Session()
+        try:
+            services.create_reservation(db, ReservationCreate(
+                offer_id=random.randint(1, n_offers), user_id=1, qty_reserved=1,
+                pickup_start_ts=now, pickup_end_ts=now + timedelta(hours=2)))
+        finally:
+            db.close()
+
+    def worker(kind, call):
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                call()
+            except OperationalError:
+                # "database is locked" and friends
+                failed += 1
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies[kind].extend(local)
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=("read", read)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=("write", write)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+def report(label, latencies, errors, seconds):
+    print(label)
+    for kind in ("read", "write"):
+        values = sorted(latencies[kind])
+        if not values:
+            print(f"  {kind:5}: no successful operations, errors={errors[kind]}")
+            continue
+        p = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+        print(f"  {kind:5}: {len(values) / seconds:8.0f} ops/sec  p50={p(0.50):.2f}ms p99={p(0.99):.2f}ms  "
+              f"errors={errors[kind]}")
+
+def postgres_url(tmp):
+    url = os.getenv("BENCH_POSTGRES_URL")
+    if url:
+        return url, None
+    try:
+        import pgserver
+    except ImportError:
+        return None, None
+    server = pgserver.get_server(os.path.join(tmp, "pg"), cleanup_mode="stop")
+    return server.get_uri().replace("postgresql://", "postgresql+psycopg2://", 1), server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--offers", type=int, default=2000)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    pool = args.readers + args.writers
+    setups = [
+        ("sqlite, rollback journal", f"sqlite:///{os.path.join(tmp.name, 'default.db')}",
+         {"journal_mode": "DELETE"}),
+        ("sqlite, WAL pragmas", f"sqlite:///{os.path.join(tmp.name, 'wal.db')}", None),
+    ]
+    pg_url, pg_server = postgres_url(tmp.name)
+    if pg_url:
+        setups.append(("postgresql", pg_url, None))
+    else:
+        print("Skipping PostgreSQL: set BENCH_POSTGRES_URL or install pgserver")
+
+    print(f"readers={args.readers} writers={args.writers} seconds={args.seconds} offers={args.offers}")
+    for label, url, pragmas in setups:
+        random.seed(0)
+        engine = create_db_engine(url, pool_size=pool, max_overflow=0, sqlite_pragmas=pragmas)
+        seed(engine, args.offers)
+        latencies, errors = run(engine, args.readers, args.writers, args.seconds, args.offers)
+        with engine.connect() as conn:
+            reserved = conn.execute(text("SELECT COALESCE(SUM(qty_reserved), 0) FROM reservations")).scalar()
+        report(f"{label} ({reserved} units reserved)", latencies, errors, args.seconds)
+        engine.dispose()
+
+    if pg_server is not None:
+        pg_server.cleanup()
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Event bus fan-out load test: many subscribers on one worker's event loop
+
+Each subscriber is a task draining its queue the way GET /events does.
+Fan-out latency is the time from publish() until the last subscriber
+has received the event.
+
+Usage: python -m bench.bench_events [--subscribers 5000] [--events 200] [--stores 50]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from events import EventBus
+
+async def run(n_subscribers, n_events, n_stores, from_thread):
+    bus = EventBus(queue_size=100)
+    received = {}
+    done = {}
+
+    async def consume(subscriber):
+        while True:
+            message = await subscriber.queue.get()
+            seq = json.loads(message)["seq"]
+            received[seq] += 1
+            if received[seq] == expected[seq]:
+                done[seq] = time.perf_counter()
+
+    # A mix of network-wide, per-store and per-store-per-audience subscribers
+    subscribers = []
+    for i in range(n_subscribers):
+        if i % 10 == 0:
+            subscribers.append(bus.subscribe())
+        elif i % 2:
+            subscribers.append(bus.subscribe(store_id=i % n_stores))
+        else:
+            subscribers.append(bus.subscribe(store_id=i % n_stores, audience="public"))
+    tasks = [asyncio.create_task(consume(s)) for s in subscribers]
+
+    expected = {}
+    published = {}
+    loop = asyncio.get_running_loop()
+    for seq in range(n_events):
+        store_id = seq % n_stores
+        expected[seq] = len(bus._targets(store_id, "public"))
+        received[seq] = 0
+        published[seq] = time.perf_counter()
+        if from_thread:
+            # Services publish from the threadpool
+            await loop.run_in_executor(None, lambda: bus.publish("inventory", store_id=store_id, audience="public", seq=seq))
+        else:
+            bus.publish("inventory", store_id=store_id, audience="public", seq=seq)
+        await asyncio.sleep(0)
+
+    deadline = time.perf_counter() + 30
+    while len(done) < n_events and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = sorted((done[seq] - published[seq]) * 1000 for seq in done)
+    deliveries = sum(expected.values())
+    return latencies, deliveries, bus.stats()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--from-thread", action="store_true", help="publish from a worker thread")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    latencies, deliveries, stats = asyncio.run(run(args.subscribers, args.events, args.stores, args.from_thread))
+    elapsed = time.perf_counter() - start
+
+    print(f"subscribers={args.subscribers} events={args.events} deliveries={deliveries} dropped={stats['dropped']}")
+    print(f"completed events: {len(latencies)}/{args.events}")
+    if latencies:
+        p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+        print(f"fan-out latency ms: p50={p(0.50):.2f} p95={p(0.95):.2f} p99={p(0.99):.2f} "
+              f"max={latencies[-1]:.2f} mean={statistics.mean(latencies):.2f}")
+    print(f"{deliveries / elapsed:.0f} deliveries/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Compare the /offers/feed endpoint with the client-side fan-out it replaces
+
+The fan-out is what CustomerApp/NonprofitPortal/AdminDashboard do today:
+GET /offers, /batches and /products, then join in the browser.
+
+Usage: python -m bench.bench_feed [--batches 20000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+os.environ["OFFER_CACHE_TTL_SECONDS"] = "0"  # measure the query path, not the cache
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from database import SessionLocal, engine
+from init_db import create_schema
+from models import Product, Batch
+from services import apply_markdown_engine
+from main import app
+
+FAN_OUT = ["/offers?user_type=public", "/batches", "/products"]
+FEED = ["/offers/feed?user_type=public"]
+
+def seed(n_batches):
+    create_schema()
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"FEED{i:05d}", "name": f"Product {i}", "category": random.choice(["Dairy", "Bakery", "Produce"]),
+             "size": "1 unit", "base_price": round(random.uniform(1, 10), 2), "weight_grams": 500}
+            for i in range(1, 2001)
+        ])
+        conn.execute(insert(Batch), [
+            {"product_id": random.randint(1, 2000), "qty_total": 20, "qty_available": random.randint(0, 20),
+             "expiry_ts": now + timedelta(hours=random.uniform(1, 48)), "store_id": random.randint(1, 100)}
+            for _ in range(n_batches)
+        ])
+    db = SessionLocal()
+    try:
+        apply_markdown_engine(db)
+    finally:
+        db.close()
+
+def measure(client, paths, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total_bytes = sum(len(client.get(path).content) for path in paths)
+        timings.append(time.perf_counter() - start)
+    return total_bytes, statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batches", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(args.batches)
+    seed(args.batches)
+    client = TestClient(app)
+    fan_bytes, fan_time = measure(client, FAN_OUT, args.repeat)
+    feed_bytes, feed_time = measure(client, FEED, args.repeat)
+
+    print(f"{'pattern':<10} {'bytes':>12} {'median ms':>10}")
+    print(f"{'fan-out':<10} {fan_bytes:>12} {fan_time * 1000:>10.1f}")
+    print(f"{'feed':<10} {feed_bytes:>12} {feed_time * 1000:>10.1f}")
+    print(f"feed is {fan_bytes / feed_bytes:.1f}x smaller and {fan_time / feed_time:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Sustained write throughput and latency with and without group commit
+
+Starts main.app in its own uvicorn process twice on freshly seeded SQLite
+databases: once committing every POST /reserve and POST /pickup/confirm on
+its own, and once with GROUP_COMMIT=true. Each time --clients keep-alive
+clients reserve an offer and then confirm the pickup of one of their earlier
+reservations, for --seconds. The script prints writes/sec and p50/p95/p99
+latency per endpoint for each mode.
+
+SQLite runs in WAL with synchronous=NORMAL by default, which does not fsync
+on commit. --synchronous FULL fsyncs every commit, the case group commit
+helps most.
+
+Usage: python -m bench.bench_group_commit [--clients 200] [--seconds 15] [--offers 5000] [--synchronous NORMAL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from database import Base, create_db_engine
+from models import Batch, Offer, OfferAudience, Product
+
+def seed(url, n_offers):
+    now = datetime.utcnow()
+    engine = create_db_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"GRP{i:05d}", "name": f"Product {i}", "category": random.choice(["Dairy", "Bakery", "Produce"]),
+             "size": "1 unit", "base_price": 3.0, "weight_grams": 500}
+            for i in range(1, 201)
+        ])
+        conn.execute(insert(Batch), [
+            {"product_id": random.randint(1, 200), "qty_total": 10 ** 6, "qty_available": 10 ** 6,
+             "expiry_ts": now + timedelta(days=2), "store_id": random.randint(1, 50)}
+            for _ in range(n_offers)
+        ])
+        conn.execute(insert(Offer), [
+            {"batch_id": i, "discount_pct": 30, "start_ts": now, "end_ts": now + timedelta(days=1),
+             "audience": OfferAudience.PUBLIC}
+            for i in range(1, n_offers + 1)
+        ])
+    engine.dispose()
+
+async def send(reader, writer, path, payload):
+    """One keep-alive JSON POST; returns (status, decoded body)"""
+    body = json.dumps(payload).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    status_line, *headers = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    length = next(int(h.split(":", 1)[1]) for h in headers if h.lower().startswith("content-length:"))
+    return int(status_line.split()[1]), json.loads(await reader.readexactly(length))
+
+async def load(port, clients, seconds, n_offers):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = time.perf_counter() + seconds
+
+    async def timed(name, reader, writer, path, payload):
+        start = time.perf_counter()
+        status, body = await send(reader, writer, path, payload)
+        if status == 200:
+            latencies[name].append(time.perf_counter() - start)
+            return body
+        errors[name] += 1
+        return None
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        reserved = []
+        try:
+            while time.perf_counter() < deadline:
+                now = datetime.utcnow()
+                reservation = await timed("POST /reserve", reader, writer, "/reserve", {
+                    "offer_id": random.randint(1, n_offers), "user_id": random.randint(1, 1000), "qty_reserved": 1,
+                    "pickup_start_ts": now.isoformat(), "pickup_end_ts": (now + timedelta(hours=2)).isoformat()})
+                if reservation is not None:
+                    reserved.append(reservation["id"])
+                if len(reserved) > 1:
+                    await timed("POST /pickup/confirm", reader, writer, "/pickup/confirm",
+                                {"reservation_id": reserved.pop(0), "staff_id": 1})
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return latencies, errors
+
+def wait_for_server(base_url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+def metric(base_url, name):
+    for line in urllib.request.urlopen(base_url + "/metrics", timeout=5).read().decode().splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    return 0.0
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+def report(label, latencies, errors, seconds, groups):
+    writes = sum(len(v) for v in latencies.values())
+    print(f"{label}: {writes / seconds:.0f} writes/sec, errors={sum(errors.values())}"
+          + (f", {writes / groups:.1f} writes per commit" if groups else ""))
+    rows = sorted(latencies.items()) + [("all", [x for v in latencies.values() for x in v])]
+    for name, values in rows:
+        values = sorted(values)
+        if values:
+            print(f"  {name:22} n={len(values):6}  p50={percentile(values, 0.50):7.1f}ms  "
+                  f"p95={percentile(values, 0.95):7.1f}ms  p99={percentile(values, 0.99):7.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--offers", type=int, default=5000)
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    random.seed(0)
+    tmp = tempfile.TemporaryDirectory()
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for label, group_commit in (("per-request commits", "false"), ("group commit", "true")):
+        url = f"sqlite:///{os.path.join(tmp.name, f'{group_commit}.db')}"
+        seed(url, args.offers)
+        env = dict(os.environ, DATABASE_URL=url, GROUP_COMMIT=group_commit, SCHEDULER_ENABLED="false",
+                   SQLITE_SYNCHRONOUS=args.synchronous)
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning",
+                   "--backlog", str(args.clients * 2), "--timeout-keep-alive", "60"]
+        process = subprocess.Popen(command, cwd=backend, env=env)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            wait_for_server(base_url, process)
+            latencies, errors = asyncio.run(load(args.port, args.clients, args.seconds, args.offers))
+            groups = metric(base_url, "group_commit_groups_total")
+        finally:
+            process.terminate()
+            process.wait()
+        report(f"{label} ({args.clients} clients, synchronous={args.synchronous})", latencies, errors,
+               args.seconds, groups)
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the set-based markdown engine against the original per-batch loop
+
+Usage: python -m bench.bench_markdown [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Product, Batch, Offer, OfferAudience
+from services import apply_markdown_engine
+
+def legacy_apply_markdown_engine(db):
+    """The original loop: one Offer lookup and two ORM inserts per batch"""
+    now = datetime.utcnow()
+    batches = db.query(Batch).filter(Batch.expiry_ts > now).all()
+
+    created_offers = 0
+    for batch in batches:
+        hours_left = (batch.expiry_ts - now).total_seconds() / 3600
+
+        if hours_left < 6:
+            discount_pct = 60
+        elif hours_left < 12:
+            discount_pct = 40
+        elif hours_left < 18:
+            discount_pct = 30
+        else:
+            discount_pct = 20
+
+        existing_offer = db.query(Offer).filter(
+            Offer.batch_id == batch.id,
+            Offer.audience == OfferAudience.NONPROFIT
+        ).first()
+
+        if not existing_offer:
+            db.add(Offer(
+                batch_id=batch.id,
+                discount_pct=discount_pct,
+                start_ts=now,
+                end_ts=now + timedelta(hours=2),
+                audience=OfferAudience.NONPROFIT
+            ))
+            db.add(Offer(
+                batch_id=batch.id,
+                discount_pct=discount_pct,
+                start_ts=now + timedelta(hours=2),
+                end_ts=batch.expiry_ts,
+                audience=OfferAudience.PUBLIC
+            ))
+            created_offers += 2
+
+    db.commit()
+    return {"created_offers": created_offers}
+
+def make_session(path, n_batches):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"BENCH{i:04d}", "name": f"Product {i}", "category": "Dairy",
+             "size": "1 unit", "base_price": 3.99, "weight_grams": 500}
+            for i in range(1, 101)
+        ])
+        conn.execute(insert(Batch), [
+            {"product_id": random.randint(1, 100), "qty_total": 10, "qty_available": 10,
+             "expiry_ts": now + timedelta(hours=random.uniform(-12, 36)), "store_id": random.randint(1, 50)}
+            for _ in range(n_batches)
+        ])
+    return engine, sessionmaker(bind=engine)()
+
+def run(fn, n_batches):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, db = make_session(os.path.join(tmp, "bench.db"), n_batches)
+        try:
+            start = time.perf_counter()
+            result = fn(db)
+            elapsed = time.perf_counter() - start
+        finally:
+            db.close()
+            engine.dispose()
+    return elapsed, result["created_offers"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'batches':>10} {'legacy (s)':>12} {'set-based (s)':>14} {'speedup':>8}")
+    for n in args.sizes:
+        random.seed(n)
+        legacy_time, legacy_created = run(legacy_apply_markdown_engine, n)
+        random.seed(n)
+        set_time, set_created = run(apply_markdown_engine, n)
+        assert legacy_created == set_created, (legacy_created, set_created)
+        print(f"{n:>10} {legacy_time:>12.3f} {set_time:>14.3f} {legacy_time / set_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Measure GET /offers/search latency at a million live offers
+
+Seeds a throwaway SQLite database with --stores stores spread over a 30 km
+disc, Zipf-skewed like synthetic_data.py, and --offers live offers on their
+own batches, plus as many expired ones as history. Then it times
+services.search_offers for random searches around the stores: the plain
+radius search and the filtered variants. Each search gets a fresh session.
+It prints p50/p95/p99 per variant and exits non-zero when any p95 is over
+--target-ms.
+
+Usage: python -m bench.bench_offer_search [--offers 1000000] [--stores 300] [--searches 300] [--target-ms 20]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from database import create_db_engine, Base
+from models import *
+import geo
+import services
+
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Meat", "Deli", "Frozen"]
+CENTER, AREA_RADIUS_KM = (40.5, -74.45), 30
+
+# (name, search keyword arguments besides the centre)
+VARIANTS = [
+    ("radius 2 km", {"radius_km": 2}),
+    ("radius 5 km", {"radius_km": 5}),
+    ("radius 25 km", {"radius_km": 25}),
+    ("category", {"radius_km": 5, "category": "Bakery"}),
+    ("min discount 60", {"radius_km": 5, "min_discount": 60}),
+    ("expiring within 6 h", {"radius_km": 5, "expiring_within_hours": 6}),
+    ("nonprofit", {"radius_km": 10, "user_type": "nonprofit"}),
+]
+
+def seed(engine, n_stores, n_offers, chunk=50000):
+    now = datetime.utcnow()
+    stores = []
+    for store_id in range(1, n_stores + 1):
+        distance, bearing = AREA_RADIUS_KM * math.sqrt(random.random()), random.uniform(0, 2 * math.pi)
+        lat = CENTER[0] + distance * math.cos(bearing) / geo.KM_PER_DEGREE
+        lon = CENTER[1] + distance * math.sin(bearing) / (geo.KM_PER_DEGREE * math.cos(math.radians(CENTER[0])))
+        stores.append({"id": store_id, "name": f"Store {store_id}", "latitude": lat, "longitude": lon,
+                       "geohash": geo.encode(lat, lon)})
+    weights = list(accumulate(1 / rank ** 1.1 for rank in range(1, n_stores + 1)))
+    with engine.begin() as conn:
+        conn.execute(insert(Store), stores)
+        conn.execute(insert(Product), [
+            {"id": i, "sku": f"GEO{i:05d}", "name": f"Product {i}", "category": random.choice(CATEGORIES),
+             "size": "1 unit", "base_price": round(random.uniform(1, 10), 2), "weight_grams": 500}
+            for i in range(1, 2001)
+        ])
+    # Half the batches are live, half history; one offer each
+    n_batches = 2 * n_offers
+    for first in range(1, n_batches + 1, chunk):
+        ids = range(first, min(first + chunk, n_batches + 1))
+        store_ids = random.choices(range(1, n_stores + 1), cum_weights=weights, k=len(ids))
+        batches, offers = [], []
+        for batch_id, store_id in zip(ids, store_ids):
+            live = batch_id % 2 == 0
+            expiry = now + timedelta(hours=random.uniform(1, 240) if live else -random.uniform(1, 24 * 90))
+            batches.append({"id": batch_id, "product_id": random.randint(1, 2000), "qty_total": 10,
+                            "qty_available": random.randint(1, 10) if live else 0, "expiry_ts": expiry,
+                            "store_id": store_id, "created_at": expiry - timedelta(days=5)})
+            offers.append({"id": batch_id, "batch_id": batch_id, "discount_pct": random.choice([20, 30, 40, 60]),
+                           "start_ts": expiry - timedelta(days=5), "end_ts": expiry,
+                           "audience": OfferAudience.NONPROFIT if random.random() < 0.05 else OfferAudience.PUBLIC})
+        with engine.begin() as conn:
+            conn.execute(insert(Batch), batches)
+            conn.execute(insert(Offer), offers)
+    return stores
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=1000000, help="live offers; as many expired ones are added")
+    parser.add_argument("--stores", type=int, default=300)
+    parser.add_argument("--searches", type=int, default=300, help="searches per variant")
+    parser.add_argument("--target-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    tmp = tempfile.TemporaryDirectory()
+    engine = create_db_engine(f"sqlite:///{os.path.join(tmp.name, 'search.db')}")
+    Base.metadata.create_all(bind=engine)
+    print(f"Seeding {args.offers} live offers at {args.stores} stores...")
+    start = time.perf_counter()
+    stores = seed(engine, args.stores, args.offers)
+    print(f"  done in {time.perf_counter() - start:.0f}s")
+
+    Session = sessionmaker(bind=engine)
+    print(f"{'variant':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rows':>6}")
+    failures = []
+    for name, search in VARIANTS:
+        timings, rows = [], 0
+        for _ in range(args.searches):
+            # A shopper somewhere near a store
+            store = random.choice(stores)
+            lat, lon = store["latitude"] + random.uniform(-0.02, 0.02), store["longitude"] + random.uniform(-0.02, 0.02)
+            db = Session()
+            try:
+                begin = time.perf_counter()
+                rows += len(services.search_offers(db, lat, lon, **search))
+                timings.append((time.perf_counter() - begin) * 1000)
+            finally:
+                db.close()
+        timings.sort()
+        p95 = percentile(timings, 95)
+        print(f"{name:<22} {percentile(timings, 50):>8.2f} {p95:>8.2f} {percentile(timings, 99):>8.2f} "
+              f"{rows / args.searches:>6.0f}")
+        if p95 > args.target_ms:
+            failures.append(f"{name}: p95 {p95:.1f} ms over the {args.target_ms:g} ms target")
+    engine.dispose()
+
+    if failures:
+        print("\n".join(failures))
+        sys.exit(1)
+    print(f"Every variant's p95 is within {args.target_ms:g} ms")
+
+if __name__ == "__main__":
+    main()
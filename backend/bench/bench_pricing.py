@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Measure pricing.reprice_offers at a million live batches
+
+Seeds a throwaway SQLite database with --batches live batches, one offer
+each, priced at creation by the tier ladder, plus a week of reservations for
+pickup history. Each run then reprices as if time had moved on. It runs once
+with the default curve and once with the sell-through curve registered for
+every category, and prints how long the snapshot, the NumPy pass and the
+write-back took. It exits non-zero when a run is over --target-s.
+
+--legacy N also times the old way at N batches: load ORM objects, compute
+each discount in Python, and flush every object.
+
+Usage: python -m bench.bench_pricing [--batches 1000000] [--target-s 10] [--legacy 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from database import create_db_engine, Base
+from models import *
+import pricing
+
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Meat", "Deli", "Frozen"]
+SHIFT_HOURS = 3  # how far the clock moves between runs
+
+def ladder(hours_left):
+    if hours_left < 6:
+        return 60
+    elif hours_left < 12:
+        return 40
+    elif hours_left < 18:
+        return 30
+    return 20
+
+def seed(engine, n_batches, now, chunk=50000):
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"id": i, "sku": f"PRICE{i:05d}", "name": f"Product {i}", "category": random.choice(CATEGORIES),
+             "size": "1 unit", "base_price": round(random.uniform(1, 10), 2), "weight_grams": 500}
+            for i in range(1, 2001)
+        ])
+    for first in range(1, n_batches + 1, chunk):
+        batches, offers = [], []
+        for batch_id in range(first, min(first + chunk, n_batches + 1)):
+            hours_left = random.uniform(SHIFT_HOURS * 3 + 0.1, 72)
+            expiry = now + timedelta(hours=hours_left)
+            qty_total = random.randint(5, 20)
+            batches.append({"id": batch_id, "product_id": random.randint(1, 2000), "qty_total": qty_total,
+                            "qty_available": random.randint(0, qty_total), "expiry_ts": expiry, "store_id": 1,
+                            "created_at": expiry - timedelta(days=random.uniform(3, 10))})
+            offers.append({"id": batch_id, "batch_id": batch_id, "discount_pct": ladder(hours_left),
+                           "start_ts": now, "end_ts": expiry, "audience": OfferAudience.PUBLIC})
+        with engine.begin() as conn:
+            conn.execute(insert(Batch), batches)
+            conn.execute(insert(Offer), offers)
+    # Pickup history on the first offers, so pickup_rates has rows to scan
+    with engine.begin() as conn:
+        conn.execute(insert(Reservation), [
+            {"offer_id": random.randint(1, n_batches), "user_id": 1, "qty_reserved": random.randint(1, 3),
+             "status": random.choice([ReservationStatus.PICKED_UP] * 4 + [ReservationStatus.NO_SHOW]),
+             "pickup_start_ts": now - timedelta(days=d), "pickup_end_ts": now - timedelta(days=d, hours=-1),
+             "created_at": now - timedelta(days=d)}
+            for d in (random.uniform(0, 7) for _ in range(20000))
+        ])
+
+def timed_reprice(Session, now):
+    """reprice_offers, phase by phase; returns (seconds per phase, offers changed)"""
+    db = Session()
+    try:
+        timings = {}
+        begin = time.perf_counter()
+        snapshot = pricing.load_snapshot(db, now)
+        rates = pricing.pickup_rates(db, now) if pricing._curves else {}
+        timings["snapshot"] = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        discounts = np.fmax(pricing.compute_discounts(snapshot, rates), snapshot.discounts)
+        changed = np.flatnonzero(discounts != snapshot.discounts)
+        timings["compute"] = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        pricing.write_discounts(db, snapshot.offer_ids[changed], discounts[changed])
+        db.commit()
+        timings["write"] = time.perf_counter() - begin
+        return timings, len(changed)
+    finally:
+        db.close()
+
+def legacy_reprice(Session, now):
+    """One ORM object at a time, the way offers were priced before"""
+    db = Session()
+    try:
+        begin = time.perf_counter()
+        offers = (db.query(Offer).options(joinedload(Offer.batch))
+                  .filter(Offer.end_ts > now, Offer.audience == OfferAudience.PUBLIC).all())
+        changed = 0
+        for offer in offers:
+            discount = ladder((offer.batch.expiry_ts - now).total_seconds() / 3600)
+            if offer.discount_pct != discount:
+                offer.discount_pct = discount
+                changed += 1
+        db.commit()
+        return time.perf_counter() - begin, changed
+    finally:
+        db.close()
+
+def new_database(tmp, name, n_batches, now):
+    engine = create_db_engine(f"sqlite:///{os.path.join(tmp, name)}")
+    Base.metadata.create_all(bind=engine)
+    seed(engine, n_batches, now)
+    return engine
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=1000000)
+    parser.add_argument("--target-s", type=float, default=10)
+    parser.add_argument("--legacy", type=int, default=0, metavar="N", help="also time the ORM loop at N batches")
+    args = parser.parse_args()
+
+    random.seed(0)
+    tmp = tempfile.TemporaryDirectory()
+    now = datetime.utcnow()
+    print(f"Seeding {args.batches} live batches...")
+    begin = time.perf_counter()
+    engine = new_database(tmp.name, "pricing.db", args.batches, now)
+    print(f"  done in {time.perf_counter() - begin:.0f}s")
+
+    Session = sessionmaker(bind=engine)
+    print(f"{'run':<14} {'snapshot s':>10} {'compute s':>10} {'write s':>8} {'total s':>8} {'changed':>9}")
+    failures = []
+    runs = [("tier ladder", None), ("sell-through", pricing.sell_through_curve())]
+    for i, (name, curve) in enumerate(runs, start=1):
+        for category in CATEGORIES:
+            if curve:
+                pricing.register_curve(category, curve)
+        timings, changed = timed_reprice(Session, now + timedelta(hours=SHIFT_HOURS * i))
+        total = sum(timings.values())
+        print(f"{name:<14} {timings['snapshot']:>10.2f} {timings['compute']:>10.2f} {timings['write']:>8.2f} "
+              f"{total:>8.2f} {changed:>9}")
+        if total > args.target_s:
+            failures.append(f"{name}: {total:.1f}s over the {args.target_s:g}s target")
+    pricing._curves.clear()
+    engine.dispose()
+
+    if args.legacy:
+        engine = new_database(tmp.name, "legacy.db", args.legacy, now)
+        Session = sessionmaker(bind=engine)
+        later = now + timedelta(hours=SHIFT_HOURS)
+        legacy, changed = legacy_reprice(Session, later)
+        print(f"{'ORM loop':<14} {'':>10} {'':>10} {'':>8} {legacy:>8.2f} {changed:>9}  ({args.legacy} batches)")
+        engine.dispose()
+
+    if failures:
+        print("\n".join(failures))
+        sys.exit(1)
+    print(f"Every run repriced {args.batches} batches within {args.target_s:g}s")
+
+if __name__ == "__main__":
+    main()
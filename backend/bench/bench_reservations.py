@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Multi-threaded reservation load test against one hot batch
+
+Fires more reservation attempts than there is stock and checks that the
+batch is never oversold: successes must equal the starting quantity and
+qty_available must end at exactly zero.
+
+Usage: python -m bench.bench_reservations [--threads 32] [--stock 500] [--attempts 1500]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Product, Batch, Offer, OfferAudience, Reservation
+from schemas import ReservationCreate
+from services import create_reservation
+
+def setup(engine, stock):
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime.utcnow()
+    product = Product(sku="HOT001", name="Hot Item", category="Dairy", size="1 unit",
+                      base_price=2.99, weight_grams=500)
+    batch = Batch(product=product, qty_total=stock, qty_available=stock,
+                  expiry_ts=now + timedelta(hours=6), store_id=1)
+    offer = Offer(batch=batch, discount_pct=50, start_ts=now, end_ts=now + timedelta(hours=6),
+                  audience=OfferAudience.PUBLIC)
+    db.add(offer)
+    db.commit()
+    ids = offer.id, batch.id
+    db.close()
+    return ids
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--attempts", type=int, default=1500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                               connect_args={"check_same_thread": False, "timeout": 30})
+        offer_id, batch_id = setup(engine, args.stock)
+        Session = sessionmaker(bind=engine)
+        now = datetime.utcnow()
+
+        def attempt(user_id):
+            db = Session()
+            try:
+                create_reservation(db, ReservationCreate(
+                    offer_id=offer_id, user_id=user_id, qty_reserved=1,
+                    pickup_start_ts=now, pickup_end_ts=now + timedelta(hours=2)
+                ))
+                return "reserved"
+            except HTTPException as e:
+                return f"http {e.status_code}"
+            except OperationalError:
+                db.rollback()
+                return "locked"
+            finally:
+                db.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            outcomes = list(pool.map(attempt, range(args.attempts)))
+        elapsed = time.perf_counter() - start
+
+        with Session() as db:
+            qty_available = db.get(Batch, batch_id).qty_available
+            reserved_units = db.scalar(select(func.sum(Reservation.qty_reserved)))
+            codes = db.scalar(select(func.count(func.distinct(Reservation.confirmation_code))))
+        engine.dispose()
+
+    counts = {outcome: outcomes.count(outcome) for outcome in set(outcomes)}
+    print(f"attempts={args.attempts} threads={args.threads} stock={args.stock}")
+    print(f"outcomes: {counts}")
+    print(f"qty_available={qty_available} reserved_units={reserved_units} unique_codes={codes}")
+    print(f"{args.attempts / elapsed:.0f} attempts/sec, {counts.get('reserved', 0) / elapsed:.0f} reservations/sec")
+
+    assert qty_available >= 0, "batch oversold"
+    assert reserved_units + qty_available == args.stock, "inventory and reservations disagree"
+    assert codes == counts.get("reserved", 0), "duplicate confirmation codes"
+    print("OK: no oversell")
+
+if __name__ == "__main__":
+    main()
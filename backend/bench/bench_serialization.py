@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Per-row cost of list responses with and without FAST_JSON_RESPONSES
+
+For each list endpoint, over --rows live offers (and their batches), it
+measures two things:
+- serialize: turning rows that are already loaded into the response body.
+  The schema path validates ORM objects into the response model and dumps
+  them with Pydantic. The fast path encodes projected rows with orjson.
+- end to end: the full GET through the app, query included, once with the
+  fast path off and once with it on.
+
+Usage: python -m bench.bench_serialization [--rows 50000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'bench.db')}"
+os.environ["OFFER_CACHE_TTL_SECONDS"] = "0"  # measure building the body, not the cache
+os.environ.pop("FAST_JSON_RESPONSES", None)
+
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+
+from database import SessionLocal, engine
+from fast_json import dumps_rows, response_columns
+from init_db import create_schema
+from models import *
+from schemas import BatchResponse, OfferFeedItem, OfferResponse, ReservationResponse
+from settings import get_settings
+import services
+from main import app
+
+USER_ID = 7
+
+def seed(n_rows):
+    create_schema()
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"SER{i:05d}", "name": f"Product {i}", "category": random.choice(["Dairy", "Bakery", "Produce"]),
+             "size": "1 unit", "base_price": round(random.uniform(1, 10), 2), "weight_grams": 500}
+            for i in range(1, 2001)
+        ])
+        conn.execute(insert(Batch), [
+            {"product_id": random.randint(1, 2000), "qty_total": 20, "qty_available": random.randint(0, 20),
+             "expiry_ts": now + timedelta(hours=random.uniform(1, 48)), "store_id": random.randint(1, 100)}
+            for _ in range(n_rows)
+        ])
+        conn.execute(insert(Offer), [
+            {"batch_id": i, "discount_pct": 30, "start_ts": now, "end_ts": now + timedelta(days=1),
+             "audience": OfferAudience.PUBLIC}
+            for i in range(1, n_rows + 1)
+        ])
+        conn.execute(insert(Reservation), [
+            {"offer_id": i, "user_id": USER_ID, "qty_reserved": 1, "pickup_start_ts": now,
+             "pickup_end_ts": now + timedelta(hours=2), "confirmation_code": services.confirmation_code_for(i)}
+            for i in range(1, n_rows + 1)
+        ])
+
+# (path, schema, rows for the schema path, rows for the fast path)
+def cases(db):
+    reservations = db.query(Reservation).filter(Reservation.user_id == USER_ID)
+    return [
+        ("/batches", BatchResponse, lambda: services.batches_query(db).all(),
+         lambda: services.batches_query(db).with_entities(*response_columns(Batch, BatchResponse)).all()),
+        ("/offers", OfferResponse, lambda: services.offers_query(db).all(),
+         lambda: services.offers_query(db).with_entities(*response_columns(Offer, OfferResponse)).all()),
+        ("/offers/feed", OfferFeedItem, lambda: services.get_offer_feed(db), lambda: services.get_offer_feed(db)),
+        (f"/reservations?user_id={USER_ID}", ReservationResponse, reservations.all,
+         lambda: reservations.with_entities(*response_columns(Reservation, ReservationResponse)).all()),
+    ]
+
+def median_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(args.rows)
+    seed(args.rows)
+    db = SessionLocal()
+    print(f"{'endpoint':<24} {'rows':>7} | serialize us/row: {'schema':>7} {'fast':>6} {'x':>5} "
+          f"| end to end us/row: {'schema':>7} {'fast':>6} {'x':>5}")
+    with TestClient(app) as client:
+        for path, schema, schema_rows, fast_rows in cases(db):
+            adapter = TypeAdapter(List[schema])
+            objects, rows = schema_rows(), fast_rows()
+            n = len(rows)
+            schema_ser = median_time(lambda: adapter.dump_json(adapter.validate_python(objects, from_attributes=True)),
+                                     args.repeat)
+            fast_ser = median_time(lambda: dumps_rows(rows), args.repeat)
+            db.expunge_all()
+
+            get_settings().fast_json_responses = False
+            schema_e2e = median_time(lambda: client.get(path), args.repeat)
+            get_settings().fast_json_responses = True
+            fast_e2e = median_time(lambda: client.get(path), args.repeat)
+            get_settings().fast_json_responses = False
+
+            per_row = lambda seconds: seconds / n * 1e6
+            print(f"{path:<24} {n:>7} |                   {per_row(schema_ser):>7.2f} {per_row(fast_ser):>6.2f} "
+                  f"{schema_ser / fast_ser:>5.1f} |                    {per_row(schema_e2e):>7.2f} "
+                  f"{per_row(fast_e2e):>6.2f} {schema_e2e / fast_e2e:>5.1f}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Multi-store write throughput with 1, 2 and 4 shards
+
+For each shard count the script creates fresh SQLite shards (see
+sharding.py), seeds --stores stores with --offers-per-store offers each, and
+starts --processes writer processes. Each writer reserves an offer at a
+random store and then confirms the pickup of one of its earlier
+reservations, for --seconds, through the same services and shard routing as
+the API. The script prints writes/sec and p50/p95/p99 latency per shard
+count, and the speedup over one shard.
+
+With one shard every writer queues for the same SQLite write lock. With more
+shards, writers at stores on different shards commit in parallel, so
+throughput grows with the shard count until the writers run out of CPU:
+give each writer process a core (--processes up to the core count) to see
+the scaling. On fewer cores than writers the processes share the CPU and
+the gain is only the lock waits removed.
+
+Usage: python -m bench.bench_sharding [--shards 1,2,4] [--processes 4] [--stores 40] [--seconds 10] [--synchronous NORMAL]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def shard_env(directory, shards, synchronous):
+    urls = [f"sqlite:///{os.path.join(directory, f'shard{index}.db')}" for index in range(shards)]
+    return {"DATABASE_URL": urls[0], "SHARD_DATABASE_URLS": ",".join(urls[1:]),
+            "SQLITE_SYNCHRONOUS": synchronous, "SQLITE_BUSY_TIMEOUT": "60000"}
+
+def seed(stores, offers_per_store):
+    # Runs in a fresh process with shard_env set, like the writers
+    from sqlalchemy import insert, literal, select
+
+    from database import Base, engine
+    from models import Batch, Offer, OfferAudience, Product, Store
+    from sharding import shard_router
+
+    Base.metadata.create_all(bind=engine)
+    shard_router.prepare()
+    now = datetime.utcnow()
+    with shard_router.catalog.engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"SHD{i:04d}", "name": f"Product {i}", "category": "Dairy", "size": "1 unit",
+             "base_price": 3.0, "weight_grams": 500}
+            for i in range(1, 101)
+        ])
+        conn.execute(insert(Store), [
+            {"name": f"Store {i}", "latitude": 40.0, "longitude": -74.0, "geohash": "dr5"}
+            for i in range(1, stores + 1)
+        ])
+    shard_router.sync_catalog()
+    for shard in shard_router.shards:
+        own_stores = [store_id for store_id in range(1, stores + 1) if shard_router.for_store(store_id) is shard]
+        if not own_stores:
+            continue
+        with shard.engine.begin() as conn:
+            conn.execute(insert(Batch), [
+                {"product_id": random.randint(1, 100), "qty_total": 10 ** 6, "qty_available": 10 ** 6,
+                 "expiry_ts": now + timedelta(days=2), "store_id": store_id}
+                for store_id in own_stores for _ in range(offers_per_store)
+            ])
+            conn.execute(insert(Offer).from_select(
+                ["batch_id", "discount_pct", "start_ts", "end_ts", "audience"],
+                select(Batch.id, literal(30), literal(now, Offer.start_ts.type),
+                       literal(now + timedelta(days=1), Offer.end_ts.type),
+                       literal(OfferAudience.PUBLIC, Offer.audience.type))
+            ))
+
+def writer(seconds, barrier, results, worker):
+    from fastapi import HTTPException
+    from sqlalchemy import select
+
+    from models import Batch, Offer
+    from schemas import PickupCreate, ReservationCreate
+    from services import confirm_pickup_service, create_reservation
+    from sharding import shard_router
+
+    random.seed(worker)
+    offers = {}
+    for shard in shard_router.shards:
+        rows = shard.run(lambda db: db.execute(select(Offer.id, Batch.store_id).join(Batch)).all())
+        for offer_id, store_id in rows:
+            offers.setdefault(store_id, []).append(offer_id)
+    stores = sorted(offers)
+
+    latencies, errors, reserved = [], 0, []
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        now = datetime.utcnow()
+        offer_id = random.choice(offers[random.choice(stores)])
+        start = time.perf_counter()
+        try:
+            reservation = shard_router.for_id(offer_id).run(create_reservation, ReservationCreate(
+                offer_id=offer_id, user_id=random.randint(1, 1000), qty_reserved=1,
+                pickup_start_ts=now, pickup_end_ts=now + timedelta(hours=2)))
+            latencies.append(time.perf_counter() - start)
+            reserved.append(reservation.id)
+        except HTTPException:
+            errors += 1
+        if len(reserved) > 1:
+            reservation_id = reserved.pop(0)
+            start = time.perf_counter()
+            try:
+                shard_router.for_id(reservation_id).run(
+                    confirm_pickup_service, PickupCreate(reservation_id=reservation_id, staff_id=1))
+                latencies.append(time.perf_counter() - start)
+            except HTTPException:
+                errors += 1
+    results.put((latencies, errors))
+
+def run(shards, args):
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        saved = dict(os.environ)
+        os.environ.update(shard_env(directory, shards, args.synchronous))
+        try:
+            process = context.Process(target=seed, args=(args.stores, args.offers_per_store))
+            process.start()
+            process.join()
+            if process.exitcode:
+                raise RuntimeError("seeding failed")
+            barrier = context.Barrier(args.processes)
+            results = context.Queue()
+            workers = [context.Process(target=writer, args=(args.seconds, barrier, results, worker))
+                       for worker in range(args.processes)]
+            for worker in workers:
+                worker.start()
+            outcomes = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+    latencies = sorted(latency for worker_latencies, _ in outcomes for latency in worker_latencies)
+    return latencies, sum(errors for _, errors in outcomes)
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--stores", type=int, default=40)
+    parser.add_argument("--offers-per-store", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args()
+
+    print(f"{args.processes} writer processes, {args.stores} stores, synchronous={args.synchronous}, "
+          f"{os.cpu_count()} CPUs")
+    baseline = None
+    for shards in (int(value) for value in args.shards.split(",")):
+        latencies, errors = run(shards, args)
+        rate = len(latencies) / args.seconds
+        baseline = baseline or rate
+        print(f"  {shards} shard{'s' if shards > 1 else ' '}: {rate:7.0f} writes/sec ({rate / baseline:4.2f}x)  "
+              f"p50={percentile(latencies, 0.50):6.1f}ms  p95={percentile(latencies, 0.95):6.1f}ms  "
+              f"p99={percentile(latencies, 0.99):6.1f}ms  errors={errors}")
+
+if __name__ == "__main__":
+    main()
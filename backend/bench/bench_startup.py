@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Cold start: time from spawning N workers to each one's first response
+
+Prepares a small synthetic dataset with init_db.py, then for each worker
+count in --workers starts that many `uvicorn main:app` processes at once.
+This is what a prefork server does on a deploy or a scale-out. Each process
+gets its own port, so each worker's first GET /offers can be timed. The
+script prints the median and the slowest spawn-to-first-response time per
+worker count, for two modes:
+- factory: the default. Importing main only builds the app, and the schema
+  was set up once by init_db.py.
+- schema-on-startup: CREATE_SCHEMA_ON_STARTUP=true. Every worker runs
+  create_schema() before serving, as every import of main used to. With
+  --shards, that includes copying the catalog to each extra shard.
+
+It also prints an in-process breakdown from one worker: import main, and
+the first response through the app's lifespan.
+
+Usage: python -m bench.bench_startup [--workers 1,2,4,8] [--rounds 3] [--shards 0] [--scale small]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+MODES = {"factory": {}, "schema-on-startup": {"CREATE_SCHEMA_ON_STARTUP": "true"}}
+
+FIRST_REQUEST = "/offers?limit=10"
+
+# Run in a fresh interpreter, so nothing is imported yet
+BREAKDOWN = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    status = client.get(%r).status_code
+served = time.perf_counter()
+print(json.dumps({"import main": imported - start, "first response": served - imported, "status": status}))
+""" % FIRST_REQUEST
+
+def prepare(backend, env, scale):
+    """Empty versioned schema, a synthetic dataset, then the shards' tables and catalog"""
+    run = lambda *command: subprocess.run([sys.executable, *command], cwd=backend, env=env, check=True,
+                                          stdout=subprocess.DEVNULL)
+    run("init_db.py", "init", "--no-seed")
+    run("synthetic_data.py", "--database-url", env["DATABASE_URL"], "--scale", scale)
+    run("init_db.py", "migrate")
+
+def first_responses(backend, env, workers, port):
+    """Spawn the workers together; seconds from spawn to each one's first 200"""
+    start = time.perf_counter()
+    processes = {}
+    for i in range(workers):
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port + i), "--log-level", "warning"]
+        processes[port + i] = subprocess.Popen(command, cwd=backend, env=env)
+    elapsed = {}
+    try:
+        while len(elapsed) < workers:
+            for worker_port, process in processes.items():
+                if worker_port in elapsed:
+                    continue
+                if process.poll() is not None:
+                    raise RuntimeError(f"worker on port {worker_port} exited with {process.returncode}")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{worker_port}{FIRST_REQUEST}", timeout=5) as response:
+                        if response.status == 200:
+                            elapsed[worker_port] = time.perf_counter() - start
+                except OSError:
+                    pass
+            if time.perf_counter() - start > 120:
+                raise RuntimeError("workers did not answer within 120s")
+            time.sleep(0.01)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.wait()
+    return list(elapsed.values())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma-separated worker counts")
+    parser.add_argument("--rounds", type=int, default=3, help="spawns per worker count and mode")
+    parser.add_argument("--shards", type=int, default=0, help="extra SQLite shards (SHARD_DATABASE_URLS)")
+    parser.add_argument("--scale", default="small", help="synthetic_data.py preset")
+    parser.add_argument("--port", type=int, default=8600)
+    args = parser.parse_args()
+
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    tmp = tempfile.TemporaryDirectory()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(tmp.name, 'main.db')}",
+           "SCHEDULER_ENABLED": "false"}
+    env.pop("DATABASE_REPLICA_URL", None)
+    if args.shards:
+        env["SHARD_DATABASE_URLS"] = ",".join(f"sqlite:///{os.path.join(tmp.name, f'shard{i}.db')}"
+                                              for i in range(1, args.shards + 1))
+    else:
+        env.pop("SHARD_DATABASE_URLS", None)
+    print(f"Preparing the {args.scale} dataset" + (f" with {args.shards} extra shard(s)..." if args.shards else "..."))
+    prepare(backend, env, args.scale)
+
+    print(f"\n{'mode':<18} {'step':<16} {'ms':>8}")
+    for mode, overrides in MODES.items():
+        output = subprocess.run([sys.executable, "-c", BREAKDOWN], cwd=backend, env={**env, **overrides},
+                                check=True, capture_output=True, text=True).stdout
+        breakdown = json.loads(output.strip().splitlines()[-1])
+        for step in ("import main", "first response"):
+            print(f"{mode:<18} {step:<16} {breakdown[step] * 1000:>8.0f}")
+
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    print(f"\n{'mode':<18} {'workers':>7} {'median ms':>10} {'max ms':>8}")
+    for workers in worker_counts:
+        for mode, overrides in MODES.items():
+            timings = []
+            for _ in range(args.rounds):
+                timings.extend(first_responses(backend, {**env, **overrides}, workers, args.port))
+            print(f"{mode:<18} {workers:>7} {statistics.median(timings) * 1000:>10.0f} {max(timings) * 1000:>8.0f}")
+    tmp.cleanup()
+
+if __name__ == "__main__":
+    main()
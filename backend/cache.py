@@ -0,0 +1,84 @@
+"""
+In-process response cache for GET /offers
+
+Offers only change when the markdown engine runs, on relists and on
+POST /offers, so serialized responses are kept per audience/filter set and
+dropped by those writes once they commit. Each entry also expires at the
+earliest end_ts in it, so an offer never outlives its window in the cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Hashable, Optional
+
+from settings import get_settings
+
+class OfferCache:
+    """TTL + LRU cache of pre-serialized responses with hit/miss counters"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    @property
+    def generation(self):
+        """Changes on every invalidate(); read it before fetching a value to set()"""
+        return self.invalidations
+
+    def set(self, key: Hashable, value, valid_until: Optional[datetime] = None, generation: Optional[int] = None):
+        """
+        Store value until the TTL passes or valid_until (naive UTC), whichever
+        is first. With generation, a value fetched before an invalidate() that
+        has run since is dropped: it may predate the write behind it.
+        """
+        lifetime = self.ttl
+        if valid_until is not None:
+            lifetime = min(lifetime, (valid_until - datetime.utcnow()).total_seconds())
+        if lifetime <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.invalidations:
+                return
+            self._entries[key] = (time.monotonic() + lifetime, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+offer_cache = OfferCache(
+    maxsize=get_settings().offer_cache_size,
+    ttl=get_settings().offer_cache_ttl_seconds,
+)
@@ -1,94 +1,237 @@
-"""
-CSV Import functionality for ZeroWaste Exchange
-"""
-import csv
-import io
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from models import Product, Batch
-from database import SessionLocal
-
-def import_products_from_csv(csv_content: str):
-    """
-    Import products from CSV content
-    Expected CSV format: sku,name,category,size,base_price,weight_grams
-    """
-    db = SessionLocal()
-    try:
-        # Parse CSV
-        csv_reader = csv.DictReader(io.StringIO(csv_content))
-        imported_count = 0
-        
-        for row in csv_reader:
-            # Create product
-            product = Product(
-                sku=row.get('sku', f"SKU{datetime.now().timestamp()}"),
-                name=row.get('name', 'Unknown Product'),
-                category=row.get('category', 'General'),
-                size=row.get('size', '1 unit'),
-                base_price=float(row.get('base_price', 0)),
-                weight_grams=float(row.get('weight_grams', 100))
-            )
-            
-            db.add(product)
-            imported_count += 1
-        
-        db.commit()
-        return {"imported_count": imported_count, "message": "Products imported successfully"}
-        
-    except Exception as e:
-        db.rollback()
-        return {"error": str(e)}
-    finally:
-        db.close()
-
-def create_batch_from_csv(csv_content: str, store_id: int = 1):
-    """
-    Create batches from CSV content
-    Expected CSV format: sku,name,category,size,base_price,weight_grams,qty_total,expiry_hours
-    """
-    db = SessionLocal()
-    try:
-        csv_reader = csv.DictReader(io.StringIO(csv_content))
-        created_batches = 0
-        
-        for row in csv_reader:
-            # Find or create product
-            product = db.query(Product).filter(Product.sku == row.get('sku')).first()
-            
-            if not product:
-                # Create product if it doesn't exist
-                product = Product(
-                    sku=row.get('sku', f"SKU{datetime.now().timestamp()}"),
-                    name=row.get('name', 'Unknown Product'),
-                    category=row.get('category', 'General'),
-                    size=row.get('size', '1 unit'),
-                    base_price=float(row.get('base_price', 0)),
-                    weight_grams=float(row.get('weight_grams', 100))
-                )
-                db.add(product)
-                db.flush()  # Get the ID
-            
-            # Create batch
-            expiry_hours = int(row.get('expiry_hours', 24))
-            expiry_time = datetime.utcnow() + timedelta(hours=expiry_hours)
-            
-            batch = Batch(
-                product_id=product.id,
-                qty_total=int(row.get('qty_total', 10)),
-                qty_available=int(row.get('qty_total', 10)),
-                expiry_ts=expiry_time,
-                store_id=store_id
-            )
-            
-            db.add(batch)
-            created_batches += 1
-        
-        db.commit()
-        return {"created_batches": created_batches, "message": "Batches created successfully"}
-        
-    except Exception as e:
-        db.rollback()
-        return {"error": str(e)}
-    finally:
-        db.close()
+"""
+CSV Import functionality for ZeroWaste Exchange
+
+Rows are processed in chunks: SKUs are resolved through an in-memory cache
+backed by chunked IN queries, products are upserted with ON CONFLICT and
+batches are bulk-inserted. Bad rows are reported back instead of aborting
+the whole file.
+"""
+import csv
+import io
+from itertools import islice
+from typing import BinaryIO, Dict, Iterable, List, Optional
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from models import Product, Batch
+from database import SessionLocal, upsert_insert
+from sharding import shard_router
+from versions import BATCHES, PRODUCTS, bump_versions
+
+# Rows per transaction and per bulk INSERT
+CHUNK_SIZE = 5000
+# Keep IN lists well under SQLite's bound-parameter limit
+SKU_LOOKUP_CHUNK = 500
+# Cap on per-row error details returned to the caller
+MAX_REPORTED_ERRORS = 1000
+
+PRODUCT_FIELDS = ("name", "category", "size", "base_price", "weight_grams")
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _product_values(row: dict):
+    return {
+        "sku": row.get('sku') or f"SKU{datetime.now().timestamp()}",
+        "name": row.get('name') or 'Unknown Product',
+        "category": row.get('category') or 'General',
+        "size": row.get('size') or '1 unit',
+        "base_price": float(row.get('base_price') or 0),
+        "weight_grams": float(row.get('weight_grams') or 100),
+    }
+
+class ImportReport:
+    """Counts and per-row errors for one import run"""
+
+    def __init__(self):
+        self.error_count = 0
+        self.errors: List[dict] = []
+
+    def add_error(self, line: int, error: Exception):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": line, "error": str(error)})
+
+    def as_dict(self, **counts):
+        return {**counts, "error_count": self.error_count, "errors": self.errors}
+
+class SkuCache:
+    """
+    SKU -> product id lookups, filled by chunked IN queries. New products
+    are created in catalog, when that is another shard than db's.
+    """
+
+    def __init__(self, db: Session, catalog: Optional[Session] = None):
+        self.db = db
+        self.catalog = catalog
+        self.ids: Dict[str, int] = {}
+        # Created in db (the catalog shard), to copy to the other shards once db commits
+        self.unsynced: List[str] = []
+
+    def prefetch(self, skus: Iterable[str]):
+        missing = [sku for sku in set(skus) if sku not in self.ids]
+        for chunk in _chunked(missing, SKU_LOOKUP_CHUNK):
+            rows = self.db.execute(select(Product.sku, Product.id).where(Product.sku.in_(chunk)))
+            self.ids.update((sku, product_id) for sku, product_id in rows)
+
+    def ensure_products(self, products: Dict[str, dict]):
+        """Insert any products the database does not know yet and cache their ids"""
+        self.prefetch(products)
+        new_products = [values for sku, values in products.items() if sku not in self.ids]
+        if not new_products:
+            return
+        target = self.catalog if self.catalog is not None else self.db
+        target.execute(upsert_insert(target, Product).on_conflict_do_nothing(index_elements=["sku"]), new_products)
+        skus = [values["sku"] for values in new_products]
+        if self.catalog is not None:
+            # Committed on the catalog shard first, then copied to db's shard and the rest
+            bump_versions(self.catalog, PRODUCTS)
+            self.catalog.commit()
+            shard_router.sync_catalog(Product, [
+                product_id for chunk in _chunked(skus, SKU_LOOKUP_CHUNK)
+                for product_id in self.catalog.scalars(select(Product.id).where(Product.sku.in_(chunk)))
+            ])
+        else:
+            self.unsynced += skus
+        self.prefetch(skus)
+
+    def sync_products(self):
+        """Copy the products created in db to the other shards; call after db commits"""
+        if self.unsynced:
+            shard_router.sync_catalog(Product, [self.ids[sku] for sku in self.unsynced])
+            self.unsynced = []
+
+def import_products_stream(rows: Iterable[dict], db: Optional[Session] = None, chunk_size: int = CHUNK_SIZE):
+    """
+    Upsert products from an iterable of CSV rows, committing every chunk_size rows
+    Expected columns: sku,name,category,size,base_price,weight_grams
+    """
+    owns_session = db is None
+    db = db or SessionLocal()
+    report = ImportReport()
+    imported_count = 0
+    try:
+        for chunk in _chunked(enumerate(rows, start=2), chunk_size):
+            products = {}
+            for line, row in chunk:
+                try:
+                    values = _product_values(row)
+                except ValueError as e:
+                    report.add_error(line, e)
+                    continue
+                # Last row wins when a SKU repeats inside the chunk
+                products[values["sku"]] = values
+
+            if products:
+                stmt = upsert_insert(db, Product)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["sku"],
+                    set_={field: stmt.excluded[field] for field in PRODUCT_FIELDS}
+                )
+                db.execute(stmt, list(products.values()))
+                bump_versions(db, PRODUCTS)
+                db.commit()
+                imported_count += len(products)
+        # Sharded: copy the catalog shard's products to the other shards
+        shard_router.sync_catalog(Product)
+
+        return report.as_dict(imported_count=imported_count, message="Products imported successfully")
+
+    except Exception as e:
+        db.rollback()
+        return report.as_dict(imported_count=imported_count, error=str(e))
+    finally:
+        if owns_session:
+            db.close()
+
+def import_batches_stream(rows: Iterable[dict], store_id: int = 1, db: Optional[Session] = None,
+                          chunk_size: int = CHUNK_SIZE):
+    """
+    Create batches from an iterable of CSV rows, creating missing products on the way
+    Expected columns: sku,name,category,size,base_price,weight_grams,qty_total,expiry_hours
+    """
+    owns_session = db is None
+    shard = shard_router.for_store(store_id)
+    db = db or shard.SessionLocal()
+    catalog = SessionLocal() if owns_session and shard is not shard_router.catalog else None
+    report = ImportReport()
+    skus = SkuCache(db, catalog)
+    created_batches = 0
+    try:
+        for chunk in _chunked(enumerate(rows, start=2), chunk_size):
+            now = datetime.utcnow()
+            products = {}
+            pending = []
+            for line, row in chunk:
+                try:
+                    values = _product_values(row)
+                    qty_total = int(row.get('qty_total') or 10)
+                    expiry_hours = int(row.get('expiry_hours') or 24)
+                except ValueError as e:
+                    report.add_error(line, e)
+                    continue
+                products.setdefault(values["sku"], values)
+                pending.append((values["sku"], qty_total, now + timedelta(hours=expiry_hours)))
+
+            if not pending:
+                continue
+
+            skus.ensure_products(products)
+            db.execute(insert(Batch), [
+                {
+                    "product_id": skus.ids[sku],
+                    "qty_total": qty_total,
+                    "qty_available": qty_total,
+                    "expiry_ts": expiry_ts,
+                    "store_id": store_id,
+                    "created_at": now,
+                }
+                for sku, qty_total, expiry_ts in pending
+            ])
+            # New SKUs in the file also add products
+            bump_versions(db, BATCHES, PRODUCTS)
+            db.commit()
+            skus.sync_products()
+            created_batches += len(pending)
+
+        return report.as_dict(created_batches=created_batches, message="Batches created successfully")
+
+    except Exception as e:
+        db.rollback()
+        return report.as_dict(created_batches=created_batches, error=str(e))
+    finally:
+        if owns_session:
+            db.close()
+        if catalog is not None:
+            catalog.close()
+
+def iter_csv_upload(fileobj: BinaryIO):
+    """
+    Yield CSV rows from a binary file object (e.g. UploadFile.file)
+    The wrapper decodes incrementally, so only one read buffer is held in memory
+    """
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        # Leave the underlying upload open for its owner to close
+        text.detach()
+
+def import_products_from_csv(csv_content: str):
+    """
+    Import products from CSV content
+    Expected CSV format: sku,name,category,size,base_price,weight_grams
+    """
+    return import_products_stream(csv.DictReader(io.StringIO(csv_content)))
+
+def create_batch_from_csv(csv_content: str, store_id: int = 1):
+    """
+    Create batches from CSV content
+    Expected CSV format: sku,name,category,size,base_price,weight_grams,qty_total,expiry_hours
+    """
+    return import_batches_stream(csv.DictReader(io.StringIO(csv_content)), store_id)
@@ -1,22 +1,187 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Database URL - using SQLite for MVP, can switch to PostgreSQL later
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./zerowaste.db")
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base = declarative_base()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from functools import lru_cache
+from typing import Union
+import os
+
+from settings import get_settings
+
+settings = get_settings()
+DATABASE_URL = settings.database_url
+DATABASE_REPLICA_URL = settings.database_replica_url
+
+# Drivers used by the async engines; ASYNC_DATABASE_URL and
+# ASYNC_DATABASE_REPLICA_URL override the derived URLs
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+# Applied to every new SQLite connection. WAL lets readers run alongside the
+# single writer, and busy_timeout makes writers wait instead of failing with
+# "database is locked". Override any of them with SQLITE_<NAME>, e.g.
+# SQLITE_JOURNAL_MODE=DELETE.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": "5000",
+    "mmap_size": str(256 * 1024 * 1024),
+    "cache_size": "-64000",  # negative means KiB, so 64 MB
+    "temp_store": "MEMORY",
+}
+
+def _sqlite_pragmas():
+    return {name: os.getenv(f"SQLITE_{name.upper()}", value) for name, value in SQLITE_PRAGMAS.items()}
+
+def _pool_options(pool_size, max_overflow, pool_recycle, pool_timeout, prefix="DB", size="10", overflow="20"):
+    return {
+        "pool_size": pool_size if pool_size is not None else int(os.getenv(f"{prefix}_POOL_SIZE", size)),
+        "max_overflow": max_overflow if max_overflow is not None else int(os.getenv(f"{prefix}_MAX_OVERFLOW", overflow)),
+        "pool_recycle": pool_recycle if pool_recycle is not None else int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_timeout": pool_timeout if pool_timeout is not None else int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+
+def _is_memory_sqlite(url: str):
+    return ":memory:" in url or url.partition("://")[2].strip("/") == ""
+
+def _use_sqlite_pragmas(engine, sqlite_pragmas):
+    pragmas = _sqlite_pragmas() if sqlite_pragmas is None else sqlite_pragmas
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def create_db_engine(url: str, pool_size: int = None, max_overflow: int = None,
+                     pool_recycle: int = None, pool_timeout: int = None, sqlite_pragmas: dict = None):
+    """
+    Build an engine for url with pooling settings from DB_POOL_* env vars.
+    SQLite connections get sqlite_pragmas (default: SQLITE_PRAGMAS) on connect.
+    """
+    options = _pool_options(pool_size, max_overflow, pool_recycle, pool_timeout)
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_pre_ping=True, **options)
+
+    if _is_memory_sqlite(url):
+        # One shared in-memory database; a pool would hand out separate ones
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    engine = create_engine(url, connect_args={"check_same_thread": False}, **options)
+    _use_sqlite_pragmas(engine, sqlite_pragmas)
+    return engine
+
+def async_db_enabled():
+    """
+    Run route queries on the async driver (see async_services) instead of on
+    worker threads with the sync engines. Needs the driver for the dialect:
+    aiosqlite or asyncpg.
+    """
+    return settings.async_db_enabled
+
+def async_database_url(url: str):
+    """Swap the sync driver in url for its asyncio counterpart"""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    driver = ASYNC_DRIVERS.get(dialect)
+    if driver is None:
+        raise ValueError(f"No async driver configured for {dialect}")
+    return f"{dialect}+{driver}{sep}{rest}"
+
+def create_async_db_engine(url: str, pool_size: int = None, max_overflow: int = None,
+                           pool_recycle: int = None, pool_timeout: int = None, sqlite_pragmas: dict = None):
+    """
+    Async counterpart of create_db_engine; url must name an async driver.
+    The pool caps how many requests per worker have a query in flight, and
+    past a handful the extra connections only interleave more round trips on
+    the one event loop, so it is sized separately (ASYNC_DB_POOL_SIZE,
+    ASYNC_DB_MAX_OVERFLOW) and much smaller than the sync pool.
+    """
+    options = _pool_options(pool_size, max_overflow, pool_recycle, pool_timeout,
+                            prefix="ASYNC_DB", size="5", overflow="0")
+    if not url.startswith("sqlite"):
+        return create_async_engine(url, pool_pre_ping=True, **options)
+
+    if _is_memory_sqlite(url):
+        return create_async_engine(url, poolclass=StaticPool)
+
+    engine = create_async_engine(url, **options)
+    _use_sqlite_pragmas(engine.sync_engine, sqlite_pragmas)
+    return engine
+
+engine = create_db_engine(DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+read_engine = create_db_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Async engines for the API routes, only with ASYNC_DB_ENABLED. Built on first
+# use, so the async drivers are only needed then. Objects are not expired on
+# commit: the routes serialize them after the session's greenlet has
+# returned, where a lazy refresh could not run.
+@lru_cache(maxsize=None)
+def async_engines():
+    """The async (primary, replica) engines; the primary twice without a replica"""
+    primary = create_async_db_engine(settings.async_database_url or async_database_url(DATABASE_URL))
+    if not DATABASE_REPLICA_URL:
+        return primary, primary
+    return primary, create_async_db_engine(
+        settings.async_database_replica_url or async_database_url(DATABASE_REPLICA_URL))
+
+@lru_cache(maxsize=None)
+def _async_sessionmakers():
+    return tuple(async_sessionmaker(e, autoflush=False, expire_on_commit=False) for e in async_engines())
+
+async def dispose_async_engines():
+    """Close the async engines' pools, if they were ever built"""
+    if async_engines.cache_info().currsize:
+        for async_engine in set(async_engines()):
+            await async_engine.dispose()
+
+Base = declarative_base()
+
+def upsert_insert(db, model):
+    """Return a dialect-specific INSERT for model that supports ON CONFLICT clauses"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return insert(model)
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db():
+    """Session for read-only endpoints; uses the replica when one is configured"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# What the route dependencies hand to async_services: an AsyncSession with
+# ASYNC_DB_ENABLED, otherwise the sync sessionmaker to run the service with
+RouteDB = Union[AsyncSession, sessionmaker]
+
+async def get_async_db():
+    if not async_db_enabled():
+        yield SessionLocal
+        return
+    async with _async_sessionmakers()[0]() as db:
+        yield db
+
+async def get_async_read_db():
+    """Route database for read-only endpoints; uses the replica when one is configured"""
+    if not async_db_enabled():
+        yield ReadSessionLocal
+        return
+    async with _async_sessionmakers()[1]() as db:
+        yield db
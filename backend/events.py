@@ -0,0 +1,112 @@
+"""
+In-process event bus for pushing offer and inventory changes to clients
+
+Services publish compact delta events after they commit; GET /events
+streams them to subscribers as Server-Sent Events. Each subscriber listens
+on one channel, "<store_id|*>:<audience|*>", and has a bounded queue: a slow
+client loses its oldest events instead of growing memory without bound.
+Events without a store_id (bulk markdown/relist runs) go to everyone.
+
+publish() is thread-safe, so services running in the threadpool can call it.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+ANY = "*"
+
+def _channel(store_id, audience):
+    return f"{ANY if store_id is None else store_id}:{audience or ANY}"
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class Subscriber:
+    def __init__(self, channel: str, maxsize: int):
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def deliver(self, message: str):
+        if self.queue.full():
+            # Drop the oldest event; the client re-syncs from the REST endpoints
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+class EventBus:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._channels = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, store_id: Optional[int] = None, audience: Optional[str] = None):
+        """Register a subscriber; must be called from the event loop that will consume it"""
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(_channel(store_id, audience), self.queue_size)
+        with self._lock:
+            self._channels[subscriber.channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._channels.get(subscriber.channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[subscriber.channel]
+
+    def publish(self, event_type: str, store_id: Optional[int] = None, audience: Optional[str] = None, **fields):
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._channels:
+            return
+        # Serialize once; every subscriber gets the same string
+        message = json.dumps({"type": event_type, "store_id": store_id, "audience": audience, **fields},
+                             default=_encode)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(store_id, audience, message)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, store_id, audience, message)
+
+    def _targets(self, store_id, audience):
+        with self._lock:
+            if store_id is None:
+                return [s for subscribers in self._channels.values() for s in subscribers]
+            channels = {_channel(None, None), _channel(store_id, None)}
+            if audience is None:
+                channels.update(key for key in self._channels if key.startswith(f"{store_id}:") or key.startswith(f"{ANY}:"))
+            else:
+                channels.update({_channel(None, audience), _channel(store_id, audience)})
+            return [s for key in channels for s in self._channels.get(key, ())]
+
+    def _dispatch(self, store_id, audience, message):
+        self.published += 1
+        for subscriber in self._targets(store_id, audience):
+            subscriber.deliver(message)
+            self.delivered += 1
+
+    def stats(self):
+        with self._lock:
+            subscribers = [s for group in self._channels.values() for s in group]
+        return {
+            "subscribers": len(subscribers),
+            "channels": len(self._channels),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": sum(s.dropped for s in subscribers),
+        }
+
+event_bus = EventBus(queue_size=int(os.getenv("EVENT_QUEUE_SIZE", "100")))
@@ -0,0 +1,42 @@
+"""
+Direct JSON encoding of list responses, skipping per-row Pydantic work
+
+With FAST_JSON_RESPONSES on, list endpoints select only the columns their
+response schema declares and encode the rows straight to JSON bytes with
+orjson, without building ORM objects, validating each row into a model and
+re-serializing it. The output matches the Pydantic path field for field;
+tests/test_fast_json.py verifies that on every list endpoint, so this module
+does not check it per request.
+"""
+from decimal import Decimal
+
+import orjson
+
+from settings import get_settings
+
+def fast_json_enabled():
+    return get_settings().fast_json_responses
+
+def response_columns(model, schema):
+    """The model columns behind each field of a response schema, in field order"""
+    return [getattr(model, name) for name in schema.model_fields]
+
+def _default(value):
+    # PostgreSQL returns numeric expressions (effective_price) as Decimal
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+def dumps_rows(rows) -> bytes:
+    """A JSON array with one object per row, keyed by the row's column labels"""
+    if not rows:
+        return b"[]"
+    fields = rows[0]._fields
+    return orjson.dumps([dict(zip(fields, row)) for row in rows], default=_default)
+
+def dumps_records(records) -> bytes:
+    """A JSON array of already-built dicts"""
+    return orjson.dumps(records, default=_default)
+
+def dumps_row(fields, row) -> bytes:
+    return orjson.dumps(dict(zip(fields, row)), default=_default)
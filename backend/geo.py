@@ -0,0 +1,75 @@
+"""
+Geohash encoding and radius covers for store lookups
+
+Stores carry the geohash of their coordinates in an ordinary B-tree index.
+All points inside a geohash cell share its string as a prefix, so the stores
+in a cell are one index range scan on any database. For a search circle,
+cover() returns the cell containing the centre plus its eight neighbours,
+at the finest precision whose cells are at least as large as the radius.
+Those nine cells always contain the whole circle. Candidates from the cells
+are then filtered by exact distance.
+"""
+import math
+from typing import List, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+STORE_PRECISION = 9  # about 5 m
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def encode(latitude: float, longitude: float, precision: int = STORE_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(latitude, longitude) extent of a cell in degrees"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def cover(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """Geohash prefixes whose cells together contain the circle"""
+    # The narrowest longitude extent inside the circle is at its pole-ward edge
+    edge_lat = min(89.9, abs(latitude) + radius_km / KM_PER_DEGREE)
+    km_per_lon_degree = KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+    for precision in range(STORE_PRECISION, 0, -1):
+        lat_deg, lon_deg = cell_size(precision)
+        if lat_deg * KM_PER_DEGREE >= radius_km and lon_deg * km_per_lon_degree >= radius_km:
+            break
+    else:
+        return [""]  # wider than any cell: the empty prefix matches every store
+    cells = set()
+    for d_lat in (-lat_deg, 0, lat_deg):
+        lat = latitude + d_lat
+        if not -90 <= lat <= 90:
+            continue
+        for d_lon in (-lon_deg, 0, lon_deg):
+            lon = (longitude + d_lon + 180) % 360 - 180
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+def prefix_upper_bound(prefix: str) -> str:
+    """The smallest string greater than every geohash starting with prefix"""
+    return prefix + "{"  # "{" sorts after every BASE32 character
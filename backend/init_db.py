@@ -1,19 +1,81 @@
-#!/usr/bin/env python3
-"""
-Initialize database and seed with sample data
-"""
-from database import engine, Base
-from models import *
-from seed_data import seed_database
-
-def main():
-    print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
-    
-    print("Seeding database with sample data...")
-    seed_database()
-    
-    print("Database initialized successfully!")
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python3
+"""
+Create or upgrade the database schema, and seed sample data
+
+The API does not create tables when it starts; run one of these first:
+
+  python init_db.py migrate          apply the Alembic migrations up to head
+  python init_db.py init [--no-seed] create the tables of a new database, mark it
+                                     as migrated to head, and seed sample data;
+                                     an existing database is migrated instead
+  python init_db.py                  same as init
+
+Both also create the tables of the extra shards (SHARD_DATABASE_URLS) and copy
+the catalog to them. Set CREATE_SCHEMA_ON_STARTUP=true to have the app run
+create_schema() itself, for throwaway databases.
+"""
+import argparse
+import os
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import inspect
+
+from database import engine, Base
+from models import *
+from sharding import shard_router
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+def create_schema():
+    """Create missing tables on the database and every shard; safe to run again"""
+    Base.metadata.create_all(bind=engine)
+    # With SHARD_DATABASE_URLS: the other shards' tables and catalog copies
+    shard_router.prepare()
+
+def migrate(revision: str = "head"):
+    """Upgrade the database to revision, then bring the other shards up to date"""
+    command.upgrade(Config(ALEMBIC_INI), revision)
+    shard_router.prepare()
+
+def init(seed: bool = True):
+    """Create and seed a new database; an existing one is migrated instead"""
+    with engine.connect() as conn:
+        revision = MigrationContext.configure(conn).get_current_revision()
+        existing = inspect(conn).get_table_names()
+    if revision is not None:
+        print("Database is already versioned; applying migrations instead...")
+        migrate()
+        return
+    if existing:
+        # The app created these tables before the migrations existed, so they
+        # match the initial schema; the later migrations add the rest
+        print("Database predates the migrations; marking it as the initial schema and migrating...")
+        command.stamp(Config(ALEMBIC_INI), "0001_initial_schema")
+        migrate()
+        return
+    # Fresh tables match the latest migration
+    create_schema()
+    command.stamp(Config(ALEMBIC_INI), "head")
+    if seed:
+        from seed_data import seed_database
+        print("Seeding database with sample data...")
+        seed_database()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["init", "migrate"], default="init")
+    parser.add_argument("--no-seed", action="store_true", help="init: create the tables only")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print("Applying migrations...")
+        migrate()
+    else:
+        print("Creating database tables...")
+        init(seed=not args.no_seed)
+    print("Database initialized successfully!")
+
+if __name__ == "__main__":
+    main()
@@ -1,123 +1,470 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-import os
-from dotenv import load_dotenv
-
-from database import get_db, engine, Base
-from models import *
-from schemas import *
-from services import *
-from typing import List
-
-load_dotenv()
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="ZeroWaste Exchange API", version="1.0.0")
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-security = HTTPBearer()
-
-# Dependency to get current user (simplified for MVP)
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    # For MVP, we'll use simple token-based auth
-    # In production, implement proper JWT validation
-    return {"user_id": 1, "role": "admin"}  # Mock user
-
-@app.get("/")
-async def root():
-    return {"message": "ZeroWaste Exchange API"}
-
-# Product endpoints
-@app.get("/products", response_model=List[ProductResponse])
-async def get_products(db: Session = Depends(get_db)):
-    return get_all_products(db)
-
-@app.post("/products", response_model=ProductResponse)
-async def create_product(product: ProductCreate, db: Session = Depends(get_db)):
-    return create_product_service(db, product)
-
-# Batch endpoints
-@app.post("/batches", response_model=BatchResponse)
-async def create_batch(batch: BatchCreate, db: Session = Depends(get_db)):
-    return create_batch_service(db, batch)
-
-@app.get("/batches", response_model=List[BatchResponse])
-async def get_batches(db: Session = Depends(get_db)):
-    return get_all_batches(db)
-
-# Offer endpoints
-@app.get("/offers", response_model=List[OfferResponse])
-async def get_offers(
-    user_type: str = "public",
-    db: Session = Depends(get_db)
-):
-    return get_offers_for_user(db, user_type)
-
-@app.post("/offers", response_model=OfferResponse)
-async def create_offer(offer: OfferCreate, db: Session = Depends(get_db)):
-    return create_offer_service(db, offer)
-
-# Reservation endpoints
-@app.post("/reserve", response_model=ReservationResponse)
-async def reserve_offer(
-    reservation: ReservationCreate,
-    db: Session = Depends(get_db)
-):
-    return create_reservation(db, reservation)
-
-@app.get("/reservations", response_model=List[ReservationResponse])
-async def get_reservations(
-    user_id: int,
-    db: Session = Depends(get_db)
-):
-    return get_user_reservations(db, user_id)
-
-# Pickup endpoints
-@app.post("/pickup/confirm", response_model=PickupResponse)
-async def confirm_pickup(
-    pickup: PickupCreate,
-    db: Session = Depends(get_db)
-):
-    return confirm_pickup_service(db, pickup)
-
-@app.post("/pickup/relist")
-async def relist_no_shows(db: Session = Depends(get_db)):
-    return handle_no_shows(db)
-
-# Impact endpoints
-@app.get("/impact", response_model=ImpactResponse)
-async def get_impact_stats(db: Session = Depends(get_db)):
-    return get_impact_metrics(db)
-
-# Markdown engine endpoint
-@app.post("/markdown/calculate")
-async def calculate_markdowns(db: Session = Depends(get_db)):
-    return apply_markdown_engine(db)
-
-# CSV Import endpoints
-@app.post("/import/products")
-async def import_products_csv(csv_data: dict):
-    from csv_import import import_products_from_csv
-    return import_products_from_csv(csv_data["csv_content"])
-
-@app.post("/import/batches")
-async def import_batches_csv(csv_data: dict):
-    from csv_import import create_batch_from_csv
-    return create_batch_from_csv(csv_data["csv_content"], csv_data.get("store_id", 1))
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+"""
+ZeroWaste Exchange API
+
+create_app() builds the application. Importing this module or building the
+app does no database work: create or upgrade the schema first with
+`python init_db.py migrate` (or `init` for a new development database).
+The lifespan starts the scheduler and profiler when they are enabled, and
+stops them with the group committers and engines on shutdown.
+
+Run with `uvicorn main:app`, or `uvicorn --factory main:create_app`.
+"""
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, File, Form, Query, Request, Response, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from contextlib import asynccontextmanager
+import asyncio
+import itertools
+from datetime import date, datetime, timedelta
+import os
+
+from archive import archived_batches_query
+from cache import offer_cache
+from database import (
+    RouteDB, get_async_db, get_async_read_db, engine, read_engine, async_db_enabled, async_engines, dispose_async_engines
+)
+from events import event_bus
+from fast_json import fast_json_enabled
+from metrics import MetricsMiddleware, instrument_engines, register_collector, render as render_metrics
+from profiler import slow_request_profiler
+from scheduler import scheduler, scheduler_enabled
+from settings import get_settings
+from sharding import shard_router
+from versions import BATCHES, IMPACT, PRODUCTS, not_modified, validator_headers
+from schemas import (
+    BatchCreate, BatchResponse, ImpactResponse, ImpactSeriesPoint, OfferCreate, OfferFeedItem, OfferResponse,
+    OfferSearchItem, PickupBatchCreate, PickupBatchResponse, PickupCreate, PickupResponse, ProductCreate,
+    ProductResponse, ReservationCreate, ReservationResponse, StoreCreate, StoreResponse,
+)
+from services import rows_json, stream_ndjson, products_query, batches_query, offers_query
+from async_services import (
+    apply_markdown_engine, archive_expired, confirm_pickup_service, confirm_pickups_batch_service,
+    create_batch_service, create_offer_service, create_product_service, create_reservation, create_store_service,
+    get_all_batches, get_all_batches_json, get_all_products, get_all_products_json, get_all_stores,
+    get_batch_history, get_cached_offers, get_collection_versions, get_impact_metrics, get_impact_series,
+    get_offer_feed, get_offer_feed_json, get_user_reservation_history, get_user_reservations,
+    get_user_reservations_json, group_committers, handle_no_shows, reprice_offers, search_offers,
+    search_offers_json,
+)
+from typing import List, Optional
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if app.state.settings.create_schema_on_startup:
+        from init_db import create_schema
+        await asyncio.to_thread(create_schema)
+    profiler = app.state.profiler
+    if scheduler_enabled():
+        scheduler.start()
+    if profiler is not None:
+        profiler.start()
+    yield
+    if profiler is not None:
+        profiler.stop()
+    await scheduler.stop()
+    for committer in group_committers:
+        await committer.stop()
+    await dispose_async_engines()
+
+router = APIRouter()
+
+# Upper bound for a single keyset page; use format=ndjson for full exports
+MAX_PAGE_SIZE = 1000
+
+# Offer search bounds: a pickup trip, and one screen of results
+MAX_SEARCH_RADIUS_KM = 100
+MAX_SEARCH_RESULTS = 200
+
+security = HTTPBearer()
+
+# Dependency to get current user (simplified for MVP)
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # For MVP, we'll use simple token-based auth
+    # In production, implement proper JWT validation
+    return {"user_id": 1, "role": "admin"}  # Mock user
+
+@router.get("/")
+async def root():
+    return {"message": "ZeroWaste Exchange API"}
+
+# Listing helpers
+def _list_response(response: Response, rows, limit: Optional[int]):
+    # Hand the client the keyset cursor for the next page
+    if limit is not None and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
+
+def _json_response(payload: bytes, next_cursor: Optional[int] = None, headers: Optional[dict] = None):
+    # Pre-encoded body: skips response_model validation and serialization
+    headers = dict(headers or {})
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+def _ndjson_response(build_query, schema, headers: Optional[dict] = None, archive_query=None, **filters):
+    sessions = {}
+    if shard_router.sharded and build_query is not products_query:
+        # Shard by shard, which is id order
+        store_id = filters.get("store_id")
+        shards = [shard_router.for_store(store_id)] if store_id is not None else shard_router.shards
+        sessions["session_factories"] = [shard.SessionLocal for shard in shards]
+    body = stream_ndjson(build_query, schema, **sessions, **filters)
+    if archive_query is not None:
+        # Archived rows follow the hot ones
+        body = itertools.chain(body, stream_ndjson(archive_query, schema, **sessions, **filters))
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+# Conditional GET
+async def _validators(request: Request, db: RouteDB, *collections):
+    """
+    ETag/Last-Modified/Cache-Control for a response built from collections,
+    plus the 304 to send instead when the client's copy is still current
+    """
+    headers = validator_headers(collections, await get_collection_versions(db, collections))
+    if not_modified(request.headers, headers):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+# Product endpoints
+@router.get("/products", response_model=List[ProductResponse])
+async def get_products(
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: RouteDB = Depends(get_async_read_db)
+):
+    validators, unchanged = await _validators(request, db, PRODUCTS)
+    if unchanged is not None:
+        return unchanged
+    filters = dict(after_id=after_id, limit=limit, category=category)
+    if format == "ndjson":
+        return _ndjson_response(products_query, ProductResponse, validators, **filters)
+    if fast_json_enabled():
+        return _json_response(*await get_all_products_json(db, **filters), validators)
+    response.headers.update(validators)
+    return _list_response(response, await get_all_products(db, **filters), limit)
+
+@router.post("/products", response_model=ProductResponse)
+async def create_product(product: ProductCreate, db: RouteDB = Depends(get_async_db)):
+    return await create_product_service(db, product)
+
+# Batch endpoints
+@router.post("/batches", response_model=BatchResponse)
+async def create_batch(batch: BatchCreate, db: RouteDB = Depends(get_async_db)):
+    return await create_batch_service(db, batch)
+
+@router.get("/batches", response_model=List[BatchResponse])
+async def get_batches(
+    request: Request,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    store_id: Optional[int] = None,
+    category: Optional[str] = None,
+    expires_after: Optional[datetime] = None,
+    expires_before: Optional[datetime] = None,
+    include_archived: bool = False,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: RouteDB = Depends(get_async_read_db)
+):
+    # The category filter reads products too
+    validators, unchanged = await _validators(request, db, BATCHES, PRODUCTS)
+    if unchanged is not None:
+        return unchanged
+    filters = dict(after_id=after_id, limit=limit, store_id=store_id, category=category,
+                   expires_after=expires_after, expires_before=expires_before)
+    if format == "ndjson":
+        return _ndjson_response(batches_query, BatchResponse, validators,
+                                archive_query=archived_batches_query if include_archived else None, **filters)
+    if include_archived:
+        rows = await get_batch_history(db, **filters)
+        if fast_json_enabled():
+            return _json_response(*rows_json(rows, limit), validators)
+        response.headers.update(validators)
+        return _list_response(response, rows, limit)
+    if fast_json_enabled():
+        return _json_response(*await get_all_batches_json(db, **filters), validators)
+    response.headers.update(validators)
+    return _list_response(response, await get_all_batches(db, **filters), limit)
+
+# Offer endpoints
+@router.get("/offers", response_model=List[OfferResponse])
+async def get_offers(
+    response: Response,
+    user_type: str = "public",
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    store_id: Optional[int] = None,
+    category: Optional[str] = None,
+    expires_after: Optional[datetime] = None,
+    expires_before: Optional[datetime] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: RouteDB = Depends(get_async_read_db)
+):
+    filters = dict(after_id=after_id, limit=limit, store_id=store_id, category=category,
+                   expires_after=expires_after, expires_before=expires_before)
+    if format == "ndjson":
+        return _ndjson_response(offers_query, OfferResponse, user_type=user_type, **filters)
+    return _json_response(*await get_cached_offers(db, user_type, **filters))
+
+@router.get("/offers/feed", response_model=List[OfferFeedItem])
+async def get_offers_feed(
+    response: Response,
+    user_type: str = "public",
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    store_id: Optional[int] = None,
+    category: Optional[str] = None,
+    db: RouteDB = Depends(get_async_read_db)
+):
+    filters = dict(after_id=after_id, limit=limit, store_id=store_id, category=category)
+    if fast_json_enabled():
+        return _json_response(*await get_offer_feed_json(db, user_type, **filters))
+    return _list_response(response, await get_offer_feed(db, user_type, **filters), limit)
+
+@router.get("/offers/cache/stats")
+async def get_offer_cache_stats():
+    return offer_cache.stats()
+
+@router.post("/offers", response_model=OfferResponse)
+async def create_offer(offer: OfferCreate, db: RouteDB = Depends(get_async_db)):
+    return await create_offer_service(db, offer)
+
+# Store endpoints
+@router.post("/stores", response_model=StoreResponse)
+async def create_store(store: StoreCreate, db: RouteDB = Depends(get_async_db)):
+    return await create_store_service(db, store)
+
+@router.get("/stores", response_model=List[StoreResponse])
+async def get_stores(db: RouteDB = Depends(get_async_read_db)):
+    return await get_all_stores(db)
+
+@router.get("/offers/search", response_model=List[OfferSearchItem])
+async def search_nearby_offers(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=MAX_SEARCH_RADIUS_KM),
+    user_type: str = "public",
+    category: Optional[str] = None,
+    min_discount: Optional[float] = Query(None, ge=0, le=100),
+    expiring_within_hours: Optional[float] = Query(None, gt=0),
+    limit: int = Query(50, ge=1, le=MAX_SEARCH_RESULTS),
+    db: RouteDB = Depends(get_async_read_db)
+):
+    filters = dict(user_type=user_type, category=category, min_discount=min_discount,
+                   expiring_within_hours=expiring_within_hours, limit=limit)
+    if fast_json_enabled():
+        return _json_response(await search_offers_json(db, lat, lon, radius_km, **filters))
+    return await search_offers(db, lat, lon, radius_km, **filters)
+
+# Reservation endpoints
+@router.post("/reserve", response_model=ReservationResponse)
+async def reserve_offer(
+    reservation: ReservationCreate,
+    db: RouteDB = Depends(get_async_db)
+):
+    return await create_reservation(db, reservation)
+
+@router.get("/reservations", response_model=List[ReservationResponse])
+async def get_reservations(
+    user_id: int,
+    include_archived: bool = False,
+    db: RouteDB = Depends(get_async_read_db)
+):
+    if include_archived:
+        rows = await get_user_reservation_history(db, user_id)
+        return _json_response(rows_json(rows)[0]) if fast_json_enabled() else rows
+    if fast_json_enabled():
+        return _json_response(await get_user_reservations_json(db, user_id))
+    return await get_user_reservations(db, user_id)
+
+# Pickup endpoints
+@router.post("/pickup/confirm", response_model=PickupResponse)
+async def confirm_pickup(
+    pickup: PickupCreate,
+    db: RouteDB = Depends(get_async_db)
+):
+    return await confirm_pickup_service(db, pickup)
+
+@router.post("/pickup/confirm/batch", response_model=PickupBatchResponse)
+async def confirm_pickups_batch(
+    pickups: PickupBatchCreate,
+    db: RouteDB = Depends(get_async_db)
+):
+    return await confirm_pickups_batch_service(db, pickups)
+
+@router.post("/pickup/relist")
+async def relist_no_shows(
+    max_reservations: Optional[int] = Query(None, ge=1),
+    db: RouteDB = Depends(get_async_db)
+):
+    return await handle_no_shows(db, max_reservations=max_reservations)
+
+# Impact endpoints
+@router.get("/impact", response_model=ImpactResponse)
+async def get_impact_stats(request: Request, response: Response, db: RouteDB = Depends(get_async_read_db)):
+    validators, unchanged = await _validators(request, db, IMPACT)
+    if unchanged is not None:
+        return unchanged
+    response.headers.update(validators)
+    return await get_impact_metrics(db)
+
+@router.get("/impact/series", response_model=List[ImpactSeriesPoint])
+async def get_impact_series_stats(
+    request: Request,
+    response: Response,
+    bucket: str = Query("day", pattern="^(day|week|month)$"),
+    store_id: Optional[int] = None,
+    category: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: RouteDB = Depends(get_async_read_db)
+):
+    validators, unchanged = await _validators(request, db, IMPACT)
+    if unchanged is not None:
+        return unchanged
+    response.headers.update(validators)
+    return await get_impact_series(db, bucket, store_id, category, start, end)
+
+# Markdown engine endpoint
+@router.post("/markdown/calculate")
+async def calculate_markdowns(db: RouteDB = Depends(get_async_db)):
+    return await apply_markdown_engine(db)
+
+@router.post("/markdown/reprice")
+async def reprice_markdowns(db: RouteDB = Depends(get_async_db)):
+    return await reprice_offers(db)
+
+# Archive endpoint
+@router.post("/archive/run")
+async def run_archive(
+    max_batches: Optional[int] = Query(None, ge=1),
+    db: RouteDB = Depends(get_async_db)
+):
+    return await archive_expired(db, max_batches=max_batches)
+
+# Event stream endpoints
+EVENT_HEARTBEAT_SECONDS = 15
+
+@router.get("/events")
+async def stream_events(request: Request, store_id: Optional[int] = None, audience: Optional[str] = None):
+    subscriber = event_bus.subscribe(store_id, audience)
+    
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+        finally:
+            event_bus.unsubscribe(subscriber)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/events/stats")
+async def get_event_stats():
+    return event_bus.stats()
+
+# Scheduler endpoints
+@router.get("/scheduler/metrics")
+async def get_scheduler_metrics():
+    return scheduler.metrics()
+
+# Metrics endpoint
+def _component_metrics():
+    cache = offer_cache.stats()
+    events = event_bus.stats()
+    jobs = scheduler.metrics()["jobs"]
+    groups = {key: sum(committer.stats()[key] for committer in group_committers)
+              for key in ("groups", "writes", "failed_writes")}
+    job_metric = lambda key: [({"job": name}, job[key]) for name, job in jobs.items()]
+    return [
+        ("offer_cache_entries", "gauge", "Cached /offers responses", [({}, cache["entries"])]),
+        ("offer_cache_hits_total", "counter", "Offer cache hits", [({}, cache["hits"])]),
+        ("offer_cache_misses_total", "counter", "Offer cache misses", [({}, cache["misses"])]),
+        ("offer_cache_invalidations_total", "counter", "Offer cache invalidations", [({}, cache["invalidations"])]),
+        ("event_subscribers", "gauge", "Connected /events subscribers", [({}, events["subscribers"])]),
+        ("events_published_total", "counter", "Events published", [({}, events["published"])]),
+        ("events_delivered_total", "counter", "Events delivered to subscribers", [({}, events["delivered"])]),
+        ("events_dropped_total", "counter", "Events dropped from full subscriber queues", [({}, events["dropped"])]),
+        ("group_commit_groups_total", "counter", "Transactions committed by group commit", [({}, groups["groups"])]),
+        ("group_commit_writes_total", "counter", "Writes committed or failed through group commit",
+         [({}, groups["writes"])]),
+        ("group_commit_failed_writes_total", "counter", "Group commit writes that returned an error",
+         [({}, groups["failed_writes"])]),
+        ("scheduler_job_runs_total", "counter", "Completed scheduled job runs", job_metric("runs")),
+        ("scheduler_job_failures_total", "counter", "Failed scheduled job runs", job_metric("failures")),
+        ("scheduler_job_skipped_total", "counter", "Runs skipped while the previous one was running",
+         job_metric("skipped_overlapping")),
+        ("scheduler_job_rows_touched_total", "counter", "Rows changed by scheduled jobs", job_metric("rows_touched")),
+        ("scheduler_job_duration_seconds_total", "counter", "Time spent in scheduled jobs",
+         job_metric("total_duration_seconds")),
+        ("scheduler_job_last_duration_seconds", "gauge", "Duration of the latest run",
+         job_metric("last_duration_seconds")),
+    ]
+
+register_collector(_component_metrics)
+
+@router.get("/metrics")
+async def get_metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# CSV Import endpoints
+@router.post("/import/products")
+async def import_products_csv(csv_data: dict):
+    from csv_import import import_products_from_csv
+    return await run_in_threadpool(import_products_from_csv, csv_data["csv_content"])
+
+@router.post("/import/batches")
+async def import_batches_csv(csv_data: dict):
+    from csv_import import create_batch_from_csv
+    return await run_in_threadpool(create_batch_from_csv, csv_data["csv_content"], csv_data.get("store_id", 1))
+
+# Streaming uploads: the file is spooled to disk by the multipart parser and
+# decoded row by row, so memory stays flat regardless of file size
+@router.post("/import/products/upload")
+async def upload_products_csv(file: UploadFile = File(...)):
+    from csv_import import import_products_stream, iter_csv_upload
+    return await run_in_threadpool(import_products_stream, iter_csv_upload(file.file))
+
+@router.post("/import/batches/upload")
+async def upload_batches_csv(file: UploadFile = File(...), store_id: int = Form(1)):
+    from csv_import import import_batches_stream, iter_csv_upload
+    return await run_in_threadpool(import_batches_stream, iter_csv_upload(file.file), store_id)
+
+# App factory
+def create_app() -> FastAPI:
+    settings = get_settings()
+    app = FastAPI(title="ZeroWaste Exchange API", version="1.0.0", lifespan=lifespan)
+    app.state.settings = settings
+    # Opt-in: PROFILE_SLOW_REQUESTS_MS dumps folded stacks for slow requests
+    app.state.profiler = profiler = slow_request_profiler()
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Per-route latency and per-request SQL statement metrics, served at /metrics
+    instrument_engines(engine, read_engine, *(async_engines() if async_db_enabled() else ()), *shard_router.engines)
+    app.add_middleware(MetricsMiddleware, on_request_end=profiler.on_request_end if profiler else None)
+
+    app.include_router(router)
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,243 @@
+"""
+Request and query instrumentation with Prometheus text exposition
+
+MetricsMiddleware times every request by route template. SQLAlchemy cursor
+hooks time every statement and attribute it to the request being served
+(through a context variable, which follows the request into the threadpool
+and into AsyncSession.run_sync) and to the first function in this package
+that issued it, e.g. "services.create_reservation". When one request runs
+the same statement METRICS_N_PLUS_ONE_THRESHOLD times or more it is counted
+and logged as a likely N+1 pattern.
+
+render() produces the Prometheus text format for GET /metrics; other
+modules add their own gauges and counters with register_collector().
+"""
+import bisect
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", "10"))
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, values[-2]
+            yield f"{self.name}_sum", labels, values[-1]
+            yield f"{self.name}_count", labels, values[-2]
+
+class CounterFamily:
+    """Monotonic counters keyed by a tuple of label values"""
+
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: tuple, amount: float = 1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+request_duration = Histogram("http_request_duration_seconds", "Request latency by route",
+                             ("method", "route"), REQUEST_BUCKETS)
+requests_total = CounterFamily("http_requests_total", "Requests by route and status",
+                               ("method", "route", "status"))
+statements_per_request = Histogram("db_statements_per_request", "SQL statements issued per request",
+                                   ("method", "route"), STATEMENT_COUNT_BUCKETS)
+query_duration = Histogram("db_query_duration_seconds", "SQL statement latency by calling function",
+                           ("caller",), QUERY_BUCKETS)
+n_plus_one_total = CounterFamily("db_n_plus_one_total",
+                                 "Statements one request ran at least METRICS_N_PLUS_ONE_THRESHOLD times",
+                                 ("method", "route", "caller"))
+
+_families = [request_duration, requests_total, statements_per_request, query_duration, n_plus_one_total]
+_collectors = []
+
+def register_collector(collector: Callable):
+    """
+    Add a callable returning [(name, type, help, [(labels, value), ...]), ...]
+    that render() calls on every scrape
+    """
+    _collectors.append(collector)
+
+# Per-request statement tracking
+class RequestStats:
+    __slots__ = ("statements", "query_seconds", "repeats")
+
+    def __init__(self):
+        self.statements = 0
+        self.query_seconds = 0.0
+        self.repeats = Counter()  # (statement, caller) -> executions
+
+_current = contextvars.ContextVar("metrics_request", default=None)
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+_caller_cache = {}
+
+def _caller():
+    """Name the innermost function in this package (outside the db plumbing) running the query"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        name = _caller_cache.get(code)
+        if name is None:
+            filename = code.co_filename
+            module = os.path.splitext(os.path.basename(filename))[0]
+            # Generated code has pseudo-filenames like "<string>"
+            if (filename.endswith(".py") and os.path.dirname(os.path.abspath(filename)) == _PACKAGE_DIR
+                    and module not in ("metrics", "database", "async_services")):
+                name = f"{module}.{code.co_name}"
+            else:
+                name = ""
+            _caller_cache[code] = name
+        if name:
+            return name
+        frame = frame.f_back
+    return "other"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    caller = _caller()
+    query_duration.observe((caller,), elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.query_seconds += elapsed
+        stats.repeats[(statement, caller)] += 1
+
+def instrument_engines(*engines):
+    """Time statements on each engine; accepts async engines and duplicates"""
+    for engine in engines:
+        engine = getattr(engine, "sync_engine", engine)
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+# Request middleware
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and statement counts per route template"""
+
+    def __init__(self, app, on_request_end: Optional[Callable] = None):
+        self.app = app
+        self.on_request_end = on_request_end
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            method = scope["method"]
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_duration.observe((method, route), elapsed)
+            requests_total.inc((method, route, str(status)))
+            statements_per_request.observe((method, route), stats.statements)
+            for (statement, caller), executions in stats.repeats.items():
+                if executions >= N_PLUS_ONE_THRESHOLD:
+                    n_plus_one_total.inc((method, route, caller))
+                    logger.warning("Possible N+1 in %s %s: %s ran %d times: %s", method, route, caller,
+                                   executions, " ".join(statement.split())[:200])
+            if self.on_request_end is not None:
+                self.on_request_end(method, route, start, elapsed)
+
+# Exposition
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _sample_line(name, labels, value):
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for family in _families:
+        kind = "histogram" if isinstance(family, Histogram) else "counter"
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {kind}")
+        lines.extend(_sample_line(*sample) for sample in family.samples())
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(_sample_line(name, labels, value) for labels, value in samples)
+    return "\n".join(lines) + "\n"
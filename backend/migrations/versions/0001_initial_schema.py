@@ -0,0 +1,159 @@
+"""initial schema
+
+The tables the app created before the migrations existed, so init_db.py can
+mark such a database as this revision and upgrade it from here. The impact
+rollup tables came later, in 0007_impact_rollups.
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-17 23:53:46.596529
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_initial_schema'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('products',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sku', sa.String(), nullable=True),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('category', sa.String(), nullable=True),
+    sa.Column('size', sa.String(), nullable=True),
+    sa.Column('base_price', sa.Float(), nullable=True),
+    sa.Column('weight_grams', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_products_id'), ['id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_products_name'), ['name'], unique=False)
+        batch_op.create_index(batch_op.f('ix_products_sku'), ['sku'], unique=True)
+
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('role', sa.Enum('ADMIN', 'NONPROFIT', 'CUSTOMER', 'STORE', name='userrole'), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_users_id'), ['id'], unique=False)
+
+    op.create_table('batches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('qty_total', sa.Integer(), nullable=True),
+    sa.Column('qty_available', sa.Integer(), nullable=True),
+    sa.Column('expiry_ts', sa.DateTime(), nullable=True),
+    sa.Column('store_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_batches_id'), ['id'], unique=False)
+
+    op.create_table('impact',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=True),
+    sa.Column('qty_picked_up', sa.Integer(), nullable=True),
+    sa.Column('co2e_saved_kg', sa.Float(), nullable=True),
+    sa.Column('revenue_recovered', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('impact', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_impact_id'), ['id'], unique=False)
+
+    op.create_table('offers',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=True),
+    sa.Column('discount_pct', sa.Float(), nullable=True),
+    sa.Column('start_ts', sa.DateTime(), nullable=True),
+    sa.Column('end_ts', sa.DateTime(), nullable=True),
+    sa.Column('audience', sa.Enum('NONPROFIT', 'PUBLIC', name='offeraudience'), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('offers', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_offers_id'), ['id'], unique=False)
+
+    op.create_table('reservations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('offer_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('qty_reserved', sa.Integer(), nullable=True),
+    sa.Column('pickup_start_ts', sa.DateTime(), nullable=True),
+    sa.Column('pickup_end_ts', sa.DateTime(), nullable=True),
+    sa.Column('status', sa.Enum('RESERVED', 'PICKED_UP', 'NO_SHOW', name='reservationstatus'), nullable=True),
+    sa.Column('confirmation_code', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['offer_id'], ['offers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('reservations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reservations_confirmation_code'), ['confirmation_code'], unique=True)
+        batch_op.create_index(batch_op.f('ix_reservations_id'), ['id'], unique=False)
+
+    op.create_table('pickups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('reservation_id', sa.Integer(), nullable=True),
+    sa.Column('pickup_ts', sa.DateTime(), nullable=True),
+    sa.Column('staff_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['reservation_id'], ['reservations.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('pickups', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pickups_id'), ['id'], unique=False)
+
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('pickups', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pickups_id'))
+
+    op.drop_table('pickups')
+    with op.batch_alter_table('reservations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservations_id'))
+        batch_op.drop_index(batch_op.f('ix_reservations_confirmation_code'))
+
+    op.drop_table('reservations')
+    with op.batch_alter_table('offers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_offers_id'))
+
+    op.drop_table('offers')
+    with op.batch_alter_table('impact', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_impact_id'))
+
+    op.drop_table('impact')
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_batches_id'))
+
+    op.drop_table('batches')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_id'))
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_products_sku'))
+        batch_op.drop_index(batch_op.f('ix_products_name'))
+        batch_op.drop_index(batch_op.f('ix_products_id'))
+
+    op.drop_table('products')
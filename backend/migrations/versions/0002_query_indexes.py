@@ -0,0 +1,64 @@
+"""query indexes
+
+Composite and partial indexes for the filters services.py actually runs:
+live offers per audience, offer lookups per batch, no-show sweeps,
+per-user reservations, batch expiry/store/watermark scans and impact per batch.
+
+Revision ID: 0002_query_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-17 23:53:48.431214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_query_indexes'
+down_revision: Union[str, Sequence[str], None] = '0001_initial_schema'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_batches_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_batches_expiry_ts'), ['expiry_ts'], unique=False)
+        batch_op.create_index(batch_op.f('ix_batches_store_id'), ['store_id'], unique=False)
+
+    with op.batch_alter_table('impact', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_impact_batch_id'), ['batch_id'], unique=False)
+
+    with op.batch_alter_table('offers', schema=None) as batch_op:
+        batch_op.create_index('ix_offers_audience_end_ts', ['audience', 'end_ts'], unique=False)
+        batch_op.create_index('ix_offers_batch_id_audience', ['batch_id', 'audience'], unique=False)
+
+    with op.batch_alter_table('reservations', schema=None) as batch_op:
+        batch_op.create_index('ix_reservations_open_pickup_end_ts', ['pickup_end_ts'], unique=False, sqlite_where=sa.text("status = 'RESERVED'"), postgresql_where=sa.text("status = 'RESERVED'"))
+        batch_op.create_index('ix_reservations_status_pickup_end_ts', ['status', 'pickup_end_ts'], unique=False)
+        batch_op.create_index(batch_op.f('ix_reservations_user_id'), ['user_id'], unique=False)
+
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('reservations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservations_user_id'))
+        batch_op.drop_index('ix_reservations_status_pickup_end_ts')
+        batch_op.drop_index('ix_reservations_open_pickup_end_ts', sqlite_where=sa.text("status = 'RESERVED'"), postgresql_where=sa.text("status = 'RESERVED'"))
+
+    with op.batch_alter_table('offers', schema=None) as batch_op:
+        batch_op.drop_index('ix_offers_batch_id_audience')
+        batch_op.drop_index('ix_offers_audience_end_ts')
+
+    with op.batch_alter_table('impact', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_impact_batch_id'))
+
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_batches_store_id'))
+        batch_op.drop_index(batch_op.f('ix_batches_expiry_ts'))
+        batch_op.drop_index(batch_op.f('ix_batches_created_at'))
+
@@ -0,0 +1,36 @@
+"""collection versions
+
+Change counter per resource collection behind the ETag/Last-Modified
+headers of GET /products, /batches and /impact.
+
+Revision ID: 0003_collection_versions
+Revises: 0002_query_indexes
+Create Date: 2026-10-18 00:37:06.743600
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_collection_versions'
+down_revision: Union[str, Sequence[str], None] = '0002_query_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('collection_versions',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('collection_versions')
@@ -0,0 +1,67 @@
+"""stores and offer search indexes
+
+Stores with coordinates and a geohash index for GET /offers/search. The
+batches store_id index gains expiry_ts, so a store's soonest-expiring
+batches are one ordered range scan, and the offers batch_id index gains
+end_ts, so whether a batch has a live offer is one index probe.
+
+Revision ID: 0004_stores
+Revises: 0003_collection_versions
+Create Date: 2026-10-18 01:00:33.355040
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_stores'
+down_revision: Union[str, Sequence[str], None] = '0003_collection_versions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stores',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('address', sa.String(), nullable=True),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.Column('geohash', sa.String(), nullable=False),
+    sa.Column('pickup_opens', sa.Time(), nullable=True),
+    sa.Column('pickup_closes', sa.Time(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stores', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stores_geohash'), ['geohash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_stores_id'), ['id'], unique=False)
+
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_batches_store_id'))
+        batch_op.create_index('ix_batches_store_id_expiry_ts', ['store_id', 'expiry_ts'], unique=False)
+
+    with op.batch_alter_table('offers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_offers_batch_id_audience'))
+        batch_op.create_index('ix_offers_batch_id_audience_end_ts', ['batch_id', 'audience', 'end_ts'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('offers', schema=None) as batch_op:
+        batch_op.drop_index('ix_offers_batch_id_audience_end_ts')
+        batch_op.create_index(batch_op.f('ix_offers_batch_id_audience'), ['batch_id', 'audience'], unique=False)
+
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.drop_index('ix_batches_store_id_expiry_ts')
+        batch_op.create_index(batch_op.f('ix_batches_store_id'), ['store_id'], unique=False)
+
+    with op.batch_alter_table('stores', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stores_id'))
+        batch_op.drop_index(batch_op.f('ix_stores_geohash'))
+
+    op.drop_table('stores')
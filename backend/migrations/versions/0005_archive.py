@@ -0,0 +1,132 @@
+"""archive tables
+
+Archive copies of batches, offers, reservations, pickups and impact, for
+rows the archive job (archive.py) moves out of the hot tables. They keep
+the ids but no foreign keys, so a batch and its children can move in any
+order. Reservations gain an offer_id index and pickups a reservation_id
+index, which the job uses to find a batch's children.
+
+Revision ID: 0005_archive
+Revises: 0004_stores
+Create Date: 2026-10-18 01:41:59.829537
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_archive'
+down_revision: Union[str, Sequence[str], None] = '0004_stores'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('batches_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('qty_total', sa.Integer(), nullable=True),
+    sa.Column('qty_available', sa.Integer(), nullable=True),
+    sa.Column('expiry_ts', sa.DateTime(), nullable=True),
+    sa.Column('store_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('batches_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_batches_archive_store_id'), ['store_id'], unique=False)
+
+    op.create_table('impact_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=True),
+    sa.Column('qty_picked_up', sa.Integer(), nullable=True),
+    sa.Column('co2e_saved_kg', sa.Float(), nullable=True),
+    sa.Column('revenue_recovered', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('impact_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_impact_archive_batch_id'), ['batch_id'], unique=False)
+
+    # The archive tables share the enum types 0001_initial_schema created
+    op.create_table('offers_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('batch_id', sa.Integer(), nullable=True),
+    sa.Column('discount_pct', sa.Float(), nullable=True),
+    sa.Column('start_ts', sa.DateTime(), nullable=True),
+    sa.Column('end_ts', sa.DateTime(), nullable=True),
+    sa.Column('audience', sa.Enum('NONPROFIT', 'PUBLIC', name='offeraudience', create_type=False), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('offers_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_offers_archive_batch_id'), ['batch_id'], unique=False)
+
+    op.create_table('pickups_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('reservation_id', sa.Integer(), nullable=True),
+    sa.Column('pickup_ts', sa.DateTime(), nullable=True),
+    sa.Column('staff_id', sa.Integer(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('pickups_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pickups_archive_reservation_id'), ['reservation_id'], unique=False)
+
+    op.create_table('reservations_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('offer_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('qty_reserved', sa.Integer(), nullable=True),
+    sa.Column('pickup_start_ts', sa.DateTime(), nullable=True),
+    sa.Column('pickup_end_ts', sa.DateTime(), nullable=True),
+    sa.Column('status', sa.Enum('RESERVED', 'PICKED_UP', 'NO_SHOW', name='reservationstatus', create_type=False), nullable=True),
+    sa.Column('confirmation_code', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('reservations_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reservations_archive_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('pickups', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_pickups_reservation_id'), ['reservation_id'], unique=False)
+
+    with op.batch_alter_table('reservations', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reservations_offer_id'), ['offer_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('reservations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservations_offer_id'))
+
+    with op.batch_alter_table('pickups', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pickups_reservation_id'))
+
+    with op.batch_alter_table('reservations_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservations_archive_user_id'))
+
+    op.drop_table('reservations_archive')
+    with op.batch_alter_table('pickups_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_pickups_archive_reservation_id'))
+
+    op.drop_table('pickups_archive')
+    with op.batch_alter_table('offers_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_offers_archive_batch_id'))
+
+    op.drop_table('offers_archive')
+    with op.batch_alter_table('impact_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_impact_archive_batch_id'))
+
+    op.drop_table('impact_archive')
+    with op.batch_alter_table('batches_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_batches_archive_store_id'))
+
+    op.drop_table('batches_archive')
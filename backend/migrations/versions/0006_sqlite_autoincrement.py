@@ -0,0 +1,53 @@
+"""sqlite autoincrement on the archived tables
+
+On SQLite, batches, offers, reservations, pickups and impact become
+AUTOINCREMENT tables. Without it SQLite hands out the highest ids again once
+their rows are deleted, and the archive job (archive.py) deletes exactly
+those rows while their archive copies keep the ids. Each table is rebuilt,
+and its sequence starts above every id in the table or its archive, so ids
+archived before this migration are not handed out again either. PostgreSQL
+sequences never reuse ids, so nothing changes there.
+
+Revision ID: 0006_sqlite_autoincrement
+Revises: 0005_archive
+Create Date: 2026-10-18 09:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_sqlite_autoincrement'
+down_revision: Union[str, Sequence[str], None] = '0005_archive'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ['batches', 'offers', 'reservations', 'pickups', 'impact']
+
+
+def _rebuild(autoincrement: bool) -> None:
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}):
+            pass
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild(True)
+    for table in TABLES:
+        top = f"max((SELECT coalesce(max(id), 0) FROM {table}), (SELECT coalesce(max(id), 0) FROM {table}_archive))"
+        op.execute(sa.text(f"UPDATE sqlite_sequence SET seq = max(seq, {top}) WHERE name = '{table}'"))
+        op.execute(sa.text(f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', {top} "
+                           f"WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{table}')"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild(False)
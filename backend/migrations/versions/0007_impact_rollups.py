@@ -0,0 +1,86 @@
+"""impact rollups
+
+The daily and total impact rollups behind GET /impact and /impact/series,
+filled from the impact rows already there, archived ones included, the same
+way rebuild_impact.py fills them. Databases created before the migrations
+existed lack them. Ones migrated before this revision got them from
+0001_initial_schema and have kept them up to date since, so they are left
+as they are.
+
+Revision ID: 0007_impact_rollups
+Revises: 0006_sqlite_autoincrement
+Create Date: 2026-10-18 11:04:27.531862
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_impact_rollups'
+down_revision: Union[str, Sequence[str], None] = '0006_sqlite_autoincrement'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# services._impact_rows: each impact row under its batch's store and product's category
+IMPACT_ROWS = """
+    SELECT coalesce(b.store_id, 0) AS store_id, coalesce(p.category, '') AS category,
+           date(i.created_at) AS day, i.qty_picked_up, i.co2e_saved_kg, i.revenue_recovered
+    FROM {impact} i
+    JOIN {batches} b ON i.batch_id = b.id
+    JOIN products p ON b.product_id = p.id
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if 'impact_daily' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('impact_daily',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('store_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('qty_picked_up', sa.Integer(), nullable=False),
+    sa.Column('co2e_saved_kg', sa.Float(), nullable=False),
+    sa.Column('revenue_recovered', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('store_id', 'category', 'day')
+    )
+    with op.batch_alter_table('impact_daily', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_impact_daily_day'), ['day'], unique=False)
+        batch_op.create_index(batch_op.f('ix_impact_daily_id'), ['id'], unique=False)
+
+    op.create_table('impact_totals',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('qty_picked_up', sa.Integer(), nullable=False),
+    sa.Column('co2e_saved_kg', sa.Float(), nullable=False),
+    sa.Column('revenue_recovered', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    rows = (IMPACT_ROWS.format(impact='impact', batches='batches') + ' UNION ALL '
+            + IMPACT_ROWS.format(impact='impact_archive', batches='batches_archive'))
+    op.execute(sa.text(
+        "INSERT INTO impact_daily (store_id, category, day, qty_picked_up, co2e_saved_kg, revenue_recovered) "
+        "SELECT store_id, category, day, sum(qty_picked_up), sum(co2e_saved_kg), sum(revenue_recovered) "
+        f"FROM ({rows}) AS impact_rows GROUP BY store_id, category, day"
+    ))
+    # services.TOTALS_ID
+    op.execute(sa.text(
+        "INSERT INTO impact_totals (id, qty_picked_up, co2e_saved_kg, revenue_recovered) "
+        "SELECT 1, coalesce(sum(qty_picked_up), 0), coalesce(sum(co2e_saved_kg), 0), "
+        "coalesce(sum(revenue_recovered), 0) FROM impact_daily"
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('impact_totals')
+    with op.batch_alter_table('impact_daily', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_impact_daily_id'))
+        batch_op.drop_index(batch_op.f('ix_impact_daily_day'))
+
+    op.drop_table('impact_daily')
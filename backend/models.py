@@ -1,110 +1,244 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Enum as SQLEnum
-from sqlalchemy.orm import relationship
-from database import Base
-from datetime import datetime
-import enum
-
-class UserRole(str, enum.Enum):
-    ADMIN = "admin"
-    NONPROFIT = "nonprofit"
-    CUSTOMER = "customer"
-    STORE = "store"
-
-class OfferAudience(str, enum.Enum):
-    NONPROFIT = "nonprofit"
-    PUBLIC = "public"
-
-class ReservationStatus(str, enum.Enum):
-    RESERVED = "reserved"
-    PICKED_UP = "picked_up"
-    NO_SHOW = "no_show"
-
-class Product(Base):
-    __tablename__ = "products"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    sku = Column(String, unique=True, index=True)
-    name = Column(String, index=True)
-    category = Column(String)
-    size = Column(String)
-    base_price = Column(Float)
-    weight_grams = Column(Float)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    batches = relationship("Batch", back_populates="product")
-
-class Batch(Base):
-    __tablename__ = "batches"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
-    qty_total = Column(Integer)
-    qty_available = Column(Integer)
-    expiry_ts = Column(DateTime)
-    store_id = Column(Integer)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    product = relationship("Product", back_populates="batches")
-    offers = relationship("Offer", back_populates="batch")
-    impact = relationship("Impact", back_populates="batch")
-
-class Offer(Base):
-    __tablename__ = "offers"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    batch_id = Column(Integer, ForeignKey("batches.id"))
-    discount_pct = Column(Float)
-    start_ts = Column(DateTime)
-    end_ts = Column(DateTime)
-    audience = Column(SQLEnum(OfferAudience))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    batch = relationship("Batch", back_populates="offers")
-    reservations = relationship("Reservation", back_populates="offer")
-
-class Reservation(Base):
-    __tablename__ = "reservations"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    offer_id = Column(Integer, ForeignKey("offers.id"))
-    user_id = Column(Integer)
-    qty_reserved = Column(Integer)
-    pickup_start_ts = Column(DateTime)
-    pickup_end_ts = Column(DateTime)
-    status = Column(SQLEnum(ReservationStatus), default=ReservationStatus.RESERVED)
-    confirmation_code = Column(String, unique=True, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    offer = relationship("Offer", back_populates="reservations")
-    pickups = relationship("Pickup", back_populates="reservation")
-
-class Pickup(Base):
-    __tablename__ = "pickups"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    reservation_id = Column(Integer, ForeignKey("reservations.id"))
-    pickup_ts = Column(DateTime, default=datetime.utcnow)
-    staff_id = Column(Integer)
-    
-    reservation = relationship("Reservation", back_populates="pickups")
-
-class Impact(Base):
-    __tablename__ = "impact"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    batch_id = Column(Integer, ForeignKey("batches.id"))
-    qty_picked_up = Column(Integer)
-    co2e_saved_kg = Column(Float)
-    revenue_recovered = Column(Float)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    batch = relationship("Batch", back_populates="impact")
-
-class User(Base):
-    __tablename__ = "users"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True)
-    name = Column(String)
-    role = Column(SQLEnum(UserRole))
-    created_at = Column(DateTime, default=datetime.utcnow)
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Time, Boolean, ForeignKey, Index, UniqueConstraint, Enum as SQLEnum, text
+from sqlalchemy.orm import relationship
+from database import Base
+from datetime import datetime
+import enum
+
+class UserRole(str, enum.Enum):
+    ADMIN = "admin"
+    NONPROFIT = "nonprofit"
+    CUSTOMER = "customer"
+    STORE = "store"
+
+class OfferAudience(str, enum.Enum):
+    NONPROFIT = "nonprofit"
+    PUBLIC = "public"
+
+class ReservationStatus(str, enum.Enum):
+    RESERVED = "reserved"
+    PICKED_UP = "picked_up"
+    NO_SHOW = "no_show"
+
+class Product(Base):
+    __tablename__ = "products"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sku = Column(String, unique=True, index=True)
+    name = Column(String, index=True)
+    category = Column(String)
+    size = Column(String)
+    base_price = Column(Float)
+    weight_grams = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    batches = relationship("Batch", back_populates="product")
+
+class Store(Base):
+    __tablename__ = "stores"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    address = Column(String)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    geohash = Column(String, nullable=False, index=True)  # radius search by prefix ranges (geo.py)
+    pickup_opens = Column(Time)
+    pickup_closes = Column(Time)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Batch(Base):
+    __tablename__ = "batches"
+    __table_args__ = (
+        # Store filters, and live batches per store soonest-expiring first for offer search
+        Index("ix_batches_store_id_expiry_ts", "store_id", "expiry_ts"),
+        # Ids are never handed out twice. Without AUTOINCREMENT, SQLite reuses
+        # the highest ids once their rows are deleted, and archived rows keep
+        # theirs (archive.py). Same for offers, reservations, pickups and impact.
+        {"sqlite_autoincrement": True},
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    qty_total = Column(Integer)
+    qty_available = Column(Integer)
+    expiry_ts = Column(DateTime, index=True)  # markdown engine, expiry window filters
+    # Not a foreign key: batches may predate their store's registration
+    store_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # scheduler watermark
+    
+    product = relationship("Product", back_populates="batches")
+    offers = relationship("Offer", back_populates="batch")
+    impact = relationship("Impact", back_populates="batch")
+
+class Offer(Base):
+    __tablename__ = "offers"
+    __table_args__ = (
+        # Live offers per audience: GET /offers, /offers/feed
+        Index("ix_offers_audience_end_ts", "audience", "end_ts"),
+        # Existing-offer anti-join in the markdown engine, relist checks, and
+        # a batch's live offers for offer search
+        Index("ix_offers_batch_id_audience_end_ts", "batch_id", "audience", "end_ts"),
+        {"sqlite_autoincrement": True},
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("batches.id"))
+    discount_pct = Column(Float)
+    start_ts = Column(DateTime)
+    end_ts = Column(DateTime)
+    audience = Column(SQLEnum(OfferAudience))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    batch = relationship("Batch", back_populates="offers")
+    reservations = relationship("Reservation", back_populates="offer")
+
+class Reservation(Base):
+    __tablename__ = "reservations"
+    __table_args__ = (
+        Index("ix_reservations_status_pickup_end_ts", "status", "pickup_end_ts"),
+        # No-show sweeps only ever look at open reservations
+        Index("ix_reservations_open_pickup_end_ts", "pickup_end_ts",
+              sqlite_where=text("status = 'RESERVED'"),
+              postgresql_where=text("status = 'RESERVED'")),
+        {"sqlite_autoincrement": True},
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    offer_id = Column(Integer, ForeignKey("offers.id"), index=True)  # archiving an offer's reservations
+    user_id = Column(Integer, index=True)
+    qty_reserved = Column(Integer)
+    pickup_start_ts = Column(DateTime)
+    pickup_end_ts = Column(DateTime)
+    status = Column(SQLEnum(ReservationStatus), default=ReservationStatus.RESERVED)
+    confirmation_code = Column(String, unique=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    offer = relationship("Offer", back_populates="reservations")
+    pickups = relationship("Pickup", back_populates="reservation")
+
+class Pickup(Base):
+    __tablename__ = "pickups"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    reservation_id = Column(Integer, ForeignKey("reservations.id"), index=True)
+    pickup_ts = Column(DateTime, default=datetime.utcnow)
+    staff_id = Column(Integer)
+    
+    reservation = relationship("Reservation", back_populates="pickups")
+
+class Impact(Base):
+    __tablename__ = "impact"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, ForeignKey("batches.id"), index=True)
+    qty_picked_up = Column(Integer)
+    co2e_saved_kg = Column(Float)
+    revenue_recovered = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    batch = relationship("Batch", back_populates="impact")
+
+# Impact rollups, maintained in the same transaction as each Impact row
+# and rebuildable from the raw rows with rebuild_impact.py
+class ImpactDaily(Base):
+    __tablename__ = "impact_daily"
+    __table_args__ = (UniqueConstraint("store_id", "category", "day"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    store_id = Column(Integer, nullable=False)
+    category = Column(String, nullable=False)
+    day = Column(Date, nullable=False, index=True)
+    qty_picked_up = Column(Integer, nullable=False, default=0)
+    co2e_saved_kg = Column(Float, nullable=False, default=0)
+    revenue_recovered = Column(Float, nullable=False, default=0)
+
+class ImpactTotal(Base):
+    __tablename__ = "impact_totals"
+    
+    # Single row holding network-wide totals
+    id = Column(Integer, primary_key=True)
+    qty_picked_up = Column(Integer, nullable=False, default=0)
+    co2e_saved_kg = Column(Float, nullable=False, default=0)
+    revenue_recovered = Column(Float, nullable=False, default=0)
+
+# Archive tables: batches that expired more than ARCHIVE_AFTER_DAYS ago, moved
+# out of the hot tables together with their offers, reservations, pickups and
+# impact rows (archive.py). Same columns and ids, no foreign keys, and only
+# the indexes historical reads use.
+class BatchArchive(Base):
+    __tablename__ = "batches_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    product_id = Column(Integer)
+    qty_total = Column(Integer)
+    qty_available = Column(Integer)
+    expiry_ts = Column(DateTime)
+    store_id = Column(Integer, index=True)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+class OfferArchive(Base):
+    __tablename__ = "offers_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    batch_id = Column(Integer, index=True)
+    discount_pct = Column(Float)
+    start_ts = Column(DateTime)
+    end_ts = Column(DateTime)
+    audience = Column(SQLEnum(OfferAudience))
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+class ReservationArchive(Base):
+    __tablename__ = "reservations_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    offer_id = Column(Integer)
+    user_id = Column(Integer, index=True)
+    qty_reserved = Column(Integer)
+    pickup_start_ts = Column(DateTime)
+    pickup_end_ts = Column(DateTime)
+    status = Column(SQLEnum(ReservationStatus))
+    confirmation_code = Column(String)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+class PickupArchive(Base):
+    __tablename__ = "pickups_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    reservation_id = Column(Integer, index=True)
+    pickup_ts = Column(DateTime)
+    staff_id = Column(Integer)
+    archived_at = Column(DateTime, nullable=False)
+
+class ImpactArchive(Base):
+    __tablename__ = "impact_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    batch_id = Column(Integer, index=True)
+    qty_picked_up = Column(Integer)
+    co2e_saved_kg = Column(Float)
+    revenue_recovered = Column(Float)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, nullable=False)
+
+# Change counter per resource collection, bumped in the transaction of every
+# write to it; GET endpoints derive ETag/Last-Modified from it (versions.py)
+class CollectionVersion(Base):
+    __tablename__ = "collection_versions"
+    
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class User(Base):
+    __tablename__ = "users"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True)
+    name = Column(String)
+    role = Column(SQLEnum(UserRole))
+    created_at = Column(DateTime, default=datetime.utcnow)
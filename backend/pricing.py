@@ -0,0 +1,192 @@
+"""
+Vectorized offer repricing over a columnar snapshot of live offers
+
+reprice_offers() reads every live offer with its batch's expiry, shelf life
+and stock in one projected query, as NumPy columns, and computes every new
+discount at once with the curve registered for the offer's category. It then
+updates only the offers whose discount changed.
+
+Repricing only ever deepens a discount. Offers set by hand through POST
+/offers, and the deeper relists of no-shows, keep their discount until a
+curve goes past it.
+
+The default curve is the markdown engine's tier ladder. With nothing
+registered, repricing moves each offer to the tier its batch has reached
+since the offer was created. sell_through_curve() adds demand: batches that
+fall behind their sell-through target get a deeper discount, scaled by how
+often the category's reservations were actually picked up lately. Register a
+curve per category with register_curve(), or list categories in
+PRICING_DEMAND_CATEGORIES to give them the default sell-through curve.
+"""
+import os
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.orm import Session
+
+from cache import offer_cache
+from events import event_bus
+from models import Batch, Offer, Product, Reservation, ReservationStatus
+
+# Reservations whose pickup window ended this recently set the pickup rates
+HISTORY_DAYS = int(os.getenv("PRICING_HISTORY_DAYS", "30"))
+# Offer ids per UPDATE when writing discounts back
+UPDATE_CHUNK_SIZE = 10000
+
+# A curve maps column arrays for one category's offers to discounts in percent:
+# curve(hours_left, elapsed, unsold, pickup_rate). elapsed is the share of
+# the batch's shelf life gone, unsold the share of its stock still available,
+# pickup_rate the category's picked-up share of reserved items (1.0 without
+# history).
+Curve = Callable[[np.ndarray, np.ndarray, np.ndarray, float], np.ndarray]
+
+def tier_ladder(hours_left, elapsed, unsold, pickup_rate):
+    """services._markdown_discount: 60/40/30/20% below 6/12/18/any hours left"""
+    return np.select([hours_left < 6, hours_left < 12, hours_left < 18], [60.0, 40.0, 30.0], 20.0)
+
+def sell_through_curve(base: Curve = tier_ladder, max_boost: float = 20, max_discount: float = 70,
+                       step: float = 5) -> Curve:
+    """
+    base plus up to max_boost points for batches behind a linear sell-through
+    target (all stock gone at expiry). The boost doubles for categories that
+    pick up half their reservations, and so on, up to twice max_boost.
+    Discounts are rounded to step so small drifts do not rewrite offers.
+    """
+    def curve(hours_left, elapsed, unsold, pickup_rate):
+        behind = np.clip(unsold - (1 - elapsed), 0, 1)
+        demand = min(2.0, 1 / max(pickup_rate, 0.5))
+        discount = base(hours_left, elapsed, unsold, pickup_rate) + max_boost * demand * behind
+        return np.clip(np.round(discount / step) * step, 0, max_discount)
+    return curve
+
+DEFAULT_CURVE: Curve = tier_ladder
+_curves: Dict[str, Curve] = {}
+
+def register_curve(category: str, curve: Curve):
+    """Price category's offers with curve instead of DEFAULT_CURVE"""
+    _curves[category] = curve
+
+for _category in filter(None, (c.strip() for c in os.getenv("PRICING_DEMAND_CATEGORIES", "").split(","))):
+    register_curve(_category, sell_through_curve())
+
+def _hours(later, earlier, dialect: str):
+    # Datetime arithmetic differs; both return fractional hours as a float
+    if dialect == "postgresql":
+        return func.extract("epoch", later - earlier) / 3600
+    return (func.julianday(later) - func.julianday(earlier)) * 24
+
+class Snapshot:
+    """Live offers as NumPy columns, one row per offer"""
+
+    def __init__(self, offer_ids, discounts, hours_left, shelf_hours, qty_available, qty_total, categories,
+                 category_names):
+        self.offer_ids = offer_ids
+        self.discounts = discounts
+        self.hours_left = hours_left
+        self.shelf_hours = shelf_hours
+        self.qty_available = qty_available
+        self.qty_total = qty_total
+        self.categories = categories  # index into category_names
+        self.category_names = category_names
+
+    def __len__(self):
+        return len(self.offer_ids)
+
+def load_snapshot(db: Session, now: datetime) -> Snapshot:
+    dialect = db.get_bind().dialect.name
+    hours_left = _hours(Batch.expiry_ts, literal(now, Batch.expiry_ts.type), dialect)
+    # Through the Core connection: plain rows, without the ORM result layer
+    rows = db.connection().execute(
+        select(Offer.id, Offer.discount_pct, hours_left, _hours(Batch.expiry_ts, Batch.created_at, dialect),
+               Batch.qty_available, Batch.qty_total, Batch.product_id)
+        .join(Batch, Offer.batch_id == Batch.id)
+        # A sweep scans offers in rowid order and looks batches up by key:
+        # about 0.1 us per offer row on SQLite, plus the fetch. Walking
+        # ix_offers_audience_end_ts or ix_batches_expiry_ts instead adds a
+        # random row lookup per live offer, about twice the time at a
+        # million, and only wins once fewer than ~3% of offers are live.
+        # Expiry is filtered through the expression so neither index applies.
+        .where(Offer.end_ts > now, hours_left > 0)
+    ).all()
+    # One float matrix from the flattened rows (np.array over Row objects is
+    # two orders of magnitude slower); NULLs become NaN
+    columns = np.array(list(chain.from_iterable(rows)), dtype=np.float64).reshape(len(rows), 7).T
+    offer_ids, discounts, hours_left, shelf_hours, qty_available, qty_total, product_ids = columns
+
+    # Categories by product id, as codes
+    products = db.execute(select(Product.id, Product.category)).all()
+    category_names = sorted({category or "" for _, category in products})
+    code = {name: i for i, name in enumerate(category_names)}
+    by_product = np.full(max((pid for pid, _ in products), default=0) + 1, -1, dtype=np.int64)
+    for pid, category in products:
+        by_product[pid] = code[category or ""]
+    categories = by_product[np.nan_to_num(product_ids).astype(np.int64)]
+    return Snapshot(offer_ids.astype(np.int64), discounts, hours_left, shelf_hours, qty_available, qty_total,
+                    categories, category_names)
+
+def pickup_rates(db: Session, now: datetime, days: int = HISTORY_DAYS) -> Dict[str, float]:
+    """Picked-up share of reserved items per category, over the last days"""
+    done = [ReservationStatus.PICKED_UP, ReservationStatus.NO_SHOW]
+    rows = db.execute(
+        select(Product.category,
+               func.sum(case((Reservation.status == ReservationStatus.PICKED_UP, Reservation.qty_reserved), else_=0)),
+               func.sum(Reservation.qty_reserved))
+        .join(Offer, Reservation.offer_id == Offer.id)
+        .join(Batch, Offer.batch_id == Batch.id)
+        .join(Product, Batch.product_id == Product.id)
+        .where(Reservation.status.in_(done), Reservation.pickup_end_ts >= now - timedelta(days=days))
+        .group_by(Product.category)
+    ).all()
+    return {category: picked / reserved for category, picked, reserved in rows if reserved}
+
+def compute_discounts(snapshot: Snapshot, rates: Dict[str, float]) -> np.ndarray:
+    """New discount per offer, each category through its curve"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        elapsed = np.nan_to_num(1 - snapshot.hours_left / snapshot.shelf_hours, nan=0.0).clip(0, 1)
+        unsold = np.nan_to_num(snapshot.qty_available / snapshot.qty_total, nan=1.0).clip(0, 1)
+    discounts = np.empty(len(snapshot))
+    for code, name in enumerate(snapshot.category_names):
+        rows = np.flatnonzero(snapshot.categories == code)
+        if len(rows):
+            curve = _curves.get(name, DEFAULT_CURVE)
+            discounts[rows] = curve(snapshot.hours_left[rows], elapsed[rows], unsold[rows], rates.get(name, 1.0))
+    unknown = np.flatnonzero(snapshot.categories < 0)
+    discounts[unknown] = DEFAULT_CURVE(snapshot.hours_left[unknown], elapsed[unknown], unsold[unknown], 1.0)
+    return discounts
+
+def write_discounts(db: Session, offer_ids: np.ndarray, discounts: np.ndarray):
+    """
+    One UPDATE ... WHERE id IN per distinct discount and chunk, ids sorted.
+    Curves produce a handful of distinct discounts, so a million changes is
+    a few hundred statements rather than a million.
+    """
+    order = np.lexsort((offer_ids, discounts))
+    offer_ids, discounts = offer_ids[order], discounts[order]
+    starts = np.flatnonzero(np.diff(discounts, prepend=np.nan) != 0)
+    for start, end in zip(starts, np.append(starts[1:], len(offer_ids))):
+        for first in range(start, end, UPDATE_CHUNK_SIZE):
+            ids = offer_ids[first:min(first + UPDATE_CHUNK_SIZE, end)].tolist()
+            db.execute(update(Offer).where(Offer.id.in_(ids)).values(discount_pct=float(discounts[start]))
+                       .execution_options(synchronize_session=False))
+
+def reprice_offers(db: Session, since: Optional[datetime] = None, now: Optional[datetime] = None):
+    """
+    Reprice every live offer and write back the ones whose discount
+    deepened. since is accepted for the scheduler and ignored: discounts move
+    with time, so every run is a full sweep.
+    """
+    now = now or datetime.utcnow()
+    snapshot = load_snapshot(db, now)
+    rates = pickup_rates(db, now) if _curves else {}
+    # Never below the current discount; fmax keeps the curve's value for NULL ones
+    discounts = np.fmax(compute_discounts(snapshot, rates), snapshot.discounts)
+    changed = np.flatnonzero(discounts != snapshot.discounts)
+    write_discounts(db, snapshot.offer_ids[changed], discounts[changed])
+    db.commit()
+    if len(changed):
+        offer_cache.invalidate()
+        event_bus.publish("offers_repriced", repriced_offers=len(changed))
+    return {"repriced_offers": len(changed)}
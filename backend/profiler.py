@@ -0,0 +1,103 @@
+"""
+Opt-in sampling profiler that dumps flame-graph data for slow requests
+
+With PROFILE_SLOW_REQUESTS_MS set, a daemon thread samples the stack of every
+thread each PROFILE_INTERVAL_MS and keeps the last PROFILE_WINDOW_SECONDS of
+samples. When a request takes longer than the threshold, the samples taken
+while it ran are written to PROFILE_DIR as folded stacks, one
+"thread;frame;...;frame count" line per distinct stack: the input format of
+flamegraph.pl and speedscope.
+
+Samples cover the whole process, not just the slow request. On the event
+loop requests interleave, so a slow request's profile also shows whatever
+held the loop while it waited, which is usually the interesting part.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    def __init__(self, threshold_ms: float, interval_ms: float = 5, window_seconds: float = 60,
+                 output_dir: str = "profiles"):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self._samples = deque(maxlen=int(window_seconds / self.interval))  # (time, stack)
+        self._names = {}  # code object -> "module.function"
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dumps = 0
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            name = self._names[code] = f"{module}.{code.co_name}"
+        return name
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                # Idle pool workers park in Condition.wait; they would drown the profile
+                if frame.f_code.co_name == "wait" and frame.f_code.co_filename.endswith("threading.py"):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                with self._lock:
+                    self._samples.append((now, ";".join(reversed(stack))))
+
+    def on_request_end(self, method: str, route: str, start: float, elapsed: float):
+        if elapsed < self.threshold:
+            return
+        end = start + elapsed
+        with self._lock:
+            samples = list(self._samples)
+        folded = Counter(stack for sampled_at, stack in samples if start <= sampled_at <= end)
+        if not folded:
+            return
+        slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        path = os.path.join(self.output_dir, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{method}-{slug}-{elapsed * 1000:.0f}ms.folded")
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in folded.most_common())
+        self.dumps += 1
+        logger.info("Slow request %s %s took %.0f ms; profile written to %s", method, route, elapsed * 1000, path)
+
+def slow_request_profiler():
+    """The profiler configured from the environment, or None when profiling is off"""
+    threshold = os.getenv("PROFILE_SLOW_REQUESTS_MS")
+    if not threshold:
+        return None
+    return SamplingProfiler(
+        float(threshold),
+        interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),
+        window_seconds=float(os.getenv("PROFILE_WINDOW_SECONDS", "60")),
+        output_dir=os.getenv("PROFILE_DIR", "profiles"),
+    )
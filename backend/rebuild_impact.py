@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Recompute the impact rollup tables from the raw impact rows, archived ones included,
+on every shard
+"""
+from models import *
+from services import rebuild_impact_rollups
+from sharding import merge_counts, shard_router
+
+def main():
+    print("Rebuilding impact rollups...")
+    # Each shard rolls up its own stores' impact rows
+    result = merge_counts(shard_router.each(rebuild_impact_rollups))
+    
+    print(f"Rebuilt {result['daily_rows']} daily rollup rows")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Background scheduler for the markdown engine, repricing, no-show relisting
+and archiving
+
+Jobs run on the FastAPI event loop but do their database work in a worker
+thread, so request handling is never blocked. Each job keeps a watermark
+(the start of its last successful run) and only looks at batches and
+reservations that changed since then; the first run after startup is a
+full sweep. A job never overlaps with itself. With shards, a run covers
+every shard in turn and reports their summed counts.
+
+Enable with SCHEDULER_ENABLED=true on one worker per deployment.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from archive import archive_expired
+from services import apply_markdown_engine, handle_no_shows
+from settings import get_settings
+from sharding import merge_counts, shard_router
+
+logger = logging.getLogger(__name__)
+
+# Rows committed by an in-flight transaction can carry a timestamp slightly
+# older than the watermark; both jobs are idempotent, so re-scan a little
+WATERMARK_OVERLAP = timedelta(seconds=60)
+
+def reprice_offers(db, since: Optional[datetime] = None):
+    from pricing import reprice_offers  # NumPy loads on the first run, not at worker startup
+    return reprice_offers(db, since=since)
+
+class PeriodicJob:
+    def __init__(self, name: str, func: Callable, interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.watermark: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.rows_touched = 0
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+        self.last_run_at: Optional[datetime] = None
+
+    def _run(self, since: Optional[datetime]):
+        return merge_counts(shard_router.each(self.func, since=since))
+
+    async def run_once(self):
+        if self._lock.locked():
+            self.skipped += 1
+            return None
+        async with self._lock:
+            started_at = datetime.utcnow()
+            since = self.watermark - WATERMARK_OVERLAP if self.watermark else None
+            start = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(self._run, since)
+            except Exception:
+                self.failures += 1
+                logger.exception("Scheduled job %s failed", self.name)
+                return None
+            finally:
+                self.last_duration = time.perf_counter() - start
+                self.total_duration += self.last_duration
+                self.last_run_at = started_at
+            self.runs += 1
+            self.rows_touched += sum(v for v in result.values() if isinstance(v, int))
+            self.watermark = started_at
+            return result
+
+    async def loop(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def metrics(self):
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_overlapping": self.skipped,
+            "rows_touched": self.rows_touched,
+            "last_duration_seconds": self.last_duration,
+            "total_duration_seconds": self.total_duration,
+            "last_run_at": self.last_run_at,
+            "watermark": self.watermark,
+        }
+
+class Scheduler:
+    def __init__(self, jobs):
+        self.jobs = {job.name: job for job in jobs}
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(job.loop(), name=f"scheduler:{job.name}") for job in self.jobs.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self):
+        return {
+            "running": bool(self._tasks),
+            "jobs": {name: job.metrics() for name, job in self.jobs.items()},
+        }
+
+scheduler = Scheduler([
+    PeriodicJob("markdown", apply_markdown_engine, float(os.getenv("MARKDOWN_INTERVAL_SECONDS", "300"))),
+    PeriodicJob("relist", handle_no_shows, float(os.getenv("RELIST_INTERVAL_SECONDS", "300"))),
+    PeriodicJob("reprice", reprice_offers, float(os.getenv("REPRICE_INTERVAL_SECONDS", "900"))),
+    PeriodicJob("archive", archive_expired, float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))),
+])
+
+def scheduler_enabled():
+    return get_settings().scheduler_enabled
@@ -1,205 +1,833 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from typing import List
-import random
-import string
-
-from models import *
-from schemas import *
-
-# Product services
-def get_all_products(db: Session):
-    return db.query(Product).all()
-
-def create_product_service(db: Session, product: ProductCreate):
-    db_product = Product(**product.dict())
-    db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
-    return db_product
-
-# Batch services
-def get_all_batches(db: Session):
-    return db.query(Batch).all()
-
-def create_batch_service(db: Session, batch: BatchCreate):
-    db_batch = Batch(**batch.dict())
-    db.add(db_batch)
-    db.commit()
-    db.refresh(db_batch)
-    return db_batch
-
-# Offer services
-def get_offers_for_user(db: Session, user_type: str):
-    now = datetime.utcnow()
-    query = db.query(Offer).filter(Offer.end_ts > now)
-    
-    if user_type == "nonprofit":
-        query = query.filter(Offer.audience == "nonprofit")
-    else:
-        query = query.filter(Offer.audience == "public")
-    
-    return query.all()
-
-def create_offer_service(db: Session, offer: OfferCreate):
-    db_offer = Offer(**offer.dict())
-    db.add(db_offer)
-    db.commit()
-    db.refresh(db_offer)
-    return db_offer
-
-# Reservation services
-def create_reservation(db: Session, reservation: ReservationCreate):
-    # Generate confirmation code
-    confirmation_code = ''.join(random.choices(string.digits, k=6))
-    
-    db_reservation = Reservation(
-        **reservation.dict(),
-        confirmation_code=confirmation_code
-    )
-    db.add(db_reservation)
-    db.commit()
-    db.refresh(db_reservation)
-    return db_reservation
-
-def get_user_reservations(db: Session, user_id: int):
-    return db.query(Reservation).filter(Reservation.user_id == user_id).all()
-
-# Pickup services
-def confirm_pickup_service(db: Session, pickup: PickupCreate):
-    # Update reservation status
-    reservation = db.query(Reservation).filter(Reservation.id == pickup.reservation_id).first()
-    if reservation:
-        reservation.status = ReservationStatus.PICKED_UP
-        
-        # Create pickup record
-        db_pickup = Pickup(**pickup.dict())
-        db.add(db_pickup)
-        
-        # Update impact metrics
-        update_impact_metrics(db, reservation)
-        
-        db.commit()
-        db.refresh(db_pickup)
-        return db_pickup
-    
-    raise HTTPException(status_code=404, detail="Reservation not found")
-
-def handle_no_shows(db: Session):
-    now = datetime.utcnow()
-    no_show_reservations = db.query(Reservation).filter(
-        Reservation.status == ReservationStatus.RESERVED,
-        Reservation.pickup_end_ts < now
-    ).all()
-    
-    relisted_count = 0
-    for reservation in no_show_reservations:
-        reservation.status = ReservationStatus.NO_SHOW
-        
-        # Create new public offer with increased discount
-        offer = db.query(Offer).filter(Offer.id == reservation.offer_id).first()
-        if offer:
-            new_discount = min(offer.discount_pct + 10, 80)  # Cap at 80%
-            new_offer = Offer(
-                batch_id=offer.batch_id,
-                discount_pct=new_discount,
-                start_ts=now,
-                end_ts=offer.end_ts,
-                audience=OfferAudience.PUBLIC
-            )
-            db.add(new_offer)
-            relisted_count += 1
-    
-    db.commit()
-    return {"relisted_count": relisted_count}
-
-# Impact services
-def get_impact_metrics(db: Session):
-    total_impact = db.query(
-        func.sum(Impact.qty_picked_up).label('total_items'),
-        func.sum(Impact.co2e_saved_kg).label('total_co2e'),
-        func.sum(Impact.revenue_recovered).label('total_revenue')
-    ).first()
-    
-    # Convert grams to pounds (1 kg = 2.20462 lbs)
-    total_lbs = (total_impact.total_items or 0) * 0.15 * 2.20462  # Assuming 150g average item weight
-    
-    return ImpactResponse(
-        total_lbs_saved=total_lbs,
-        total_co2e_avoided=total_impact.total_co2e or 0,
-        total_revenue_recovered=total_impact.total_revenue or 0,
-        total_items_rescued=total_impact.total_items or 0
-    )
-
-def update_impact_metrics(db: Session, reservation: Reservation):
-    offer = db.query(Offer).filter(Offer.id == reservation.offer_id).first()
-    batch = db.query(Batch).filter(Batch.id == offer.batch_id).first()
-    product = db.query(Product).filter(Product.id == batch.product_id).first()
-    
-    # Calculate CO2e saved (example: dairy products)
-    co2e_per_kg = 1.9  # kg CO2e per kg of dairy
-    weight_kg = (product.weight_grams * reservation.qty_reserved) / 1000
-    co2e_saved = weight_kg * co2e_per_kg
-    
-    # Calculate revenue recovered
-    revenue_recovered = reservation.qty_reserved * product.base_price * (1 - offer.discount_pct / 100)
-    
-    # Create impact record
-    impact = Impact(
-        batch_id=batch.id,
-        qty_picked_up=reservation.qty_reserved,
-        co2e_saved_kg=co2e_saved,
-        revenue_recovered=revenue_recovered
-    )
-    db.add(impact)
-
-# Markdown engine
-def apply_markdown_engine(db: Session):
-    now = datetime.utcnow()
-    batches = db.query(Batch).filter(Batch.expiry_ts > now).all()
-    
-    created_offers = 0
-    for batch in batches:
-        hours_left = (batch.expiry_ts - now).total_seconds() / 3600
-        
-        # Apply discount based on hours left
-        if hours_left < 6:
-            discount_pct = 60
-        elif hours_left < 12:
-            discount_pct = 40
-        elif hours_left < 18:
-            discount_pct = 30
-        else:
-            discount_pct = 20
-        
-        # Check if offer already exists
-        existing_offer = db.query(Offer).filter(
-            Offer.batch_id == batch.id,
-            Offer.audience == OfferAudience.NONPROFIT
-        ).first()
-        
-        if not existing_offer:
-            # Create nonprofit offer first
-            nonprofit_offer = Offer(
-                batch_id=batch.id,
-                discount_pct=discount_pct,
-                start_ts=now,
-                end_ts=now + timedelta(hours=2),  # 2-hour nonprofit window
-                audience=OfferAudience.NONPROFIT
-            )
-            db.add(nonprofit_offer)
-            
-            # Create public offer after nonprofit window
-            public_offer = Offer(
-                batch_id=batch.id,
-                discount_pct=discount_pct,
-                start_ts=now + timedelta(hours=2),
-                end_ts=batch.expiry_ts,
-                audience=OfferAudience.PUBLIC
-            )
-            db.add(public_offer)
-            created_offers += 2
-    
-    db.commit()
-    return {"created_offers": created_offers}
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import Numeric, func, and_, or_, bindparam, case, cast, insert, literal, select, tuple_, union_all, update
+from datetime import date, datetime, timedelta
+from functools import partial
+import hashlib
+import logging
+from typing import List, Optional
+from pydantic import TypeAdapter
+
+from cache import offer_cache
+import geo
+from events import event_bus
+from database import ReadSessionLocal, upsert_insert
+from fast_json import dumps_records, dumps_row, dumps_rows, fast_json_enabled, response_columns
+from settings import get_settings
+from versions import BATCHES, IMPACT, PRODUCTS, bump_versions
+from models import *
+from schemas import *
+
+logger = logging.getLogger(__name__)
+
+# Listing helpers
+def _keyset_page(query, id_column, after_id=None, limit=None):
+    # Keyset pagination on the primary key: cheap at any depth, unlike OFFSET
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    query = query.order_by(id_column)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def _filter_batches(query, store_id=None, category=None, expires_after=None, expires_before=None, model=Batch):
+    # model: Batch, or BatchArchive for historical reads (archive.py)
+    if store_id is not None:
+        query = query.filter(model.store_id == store_id)
+    if category is not None:
+        query = query.join(Product, model.product_id == Product.id).filter(Product.category == category)
+    if expires_after is not None:
+        query = query.filter(model.expiry_ts >= expires_after)
+    if expires_before is not None:
+        query = query.filter(model.expiry_ts < expires_before)
+    return query
+
+def stream_ndjson(build_query, schema, session_factories=(ReadSessionLocal,), **filters):
+    """
+    Yield one JSON document per row for a full export, from each of
+    session_factories' databases in turn (one per shard when sharded).
+    Opens its own sessions so the stream outlives the request dependency,
+    and reads through a server-side cursor so memory stays constant.
+    """
+    for session_factory in session_factories:
+        db = session_factory()
+        try:
+            query = build_query(db, **filters)
+            if fast_json_enabled():
+                columns = response_columns(query.column_descriptions[0]["entity"], schema)
+                fields = list(schema.model_fields)
+                for row in query.with_entities(*columns).yield_per(1000):
+                    yield dumps_row(fields, row) + b"\n"
+                continue
+            for row in query.yield_per(1000):
+                yield schema.model_validate(row).model_dump_json() + "\n"
+        finally:
+            db.close()
+
+def _next_cursor(rows, limit):
+    return rows[-1].id if limit is not None and len(rows) == limit else None
+
+def _list_rows(query, schema):
+    # Only the schema's columns, to encode without ORM objects or validation
+    columns = response_columns(query.column_descriptions[0]["entity"], schema)
+    return query.with_entities(*columns).all()
+
+def rows_json(rows, limit=None):
+    """JSON body and next-page cursor for rows projected onto a response schema"""
+    return dumps_rows(rows), _next_cursor(rows, limit)
+
+def _list_json(query, schema, limit=None):
+    """JSON body and next-page cursor for a list query"""
+    return rows_json(_list_rows(query, schema), limit)
+
+_offer_list = TypeAdapter(List[OfferResponse])
+
+# Product services
+def products_query(db: Session, after_id: Optional[int] = None, limit: Optional[int] = None,
+                   category: Optional[str] = None):
+    query = db.query(Product)
+    if category is not None:
+        query = query.filter(Product.category == category)
+    return _keyset_page(query, Product.id, after_id, limit)
+
+def get_all_products(db: Session, **filters):
+    return products_query(db, **filters).all()
+
+def get_all_products_json(db: Session, **filters):
+    return _list_json(products_query(db, **filters), ProductResponse, filters.get("limit"))
+
+def create_product_service(db: Session, product: ProductCreate):
+    db_product = Product(**product.dict())
+    db.add(db_product)
+    bump_versions(db, PRODUCTS)
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
+# Batch services
+def batches_query(db: Session, after_id: Optional[int] = None, limit: Optional[int] = None,
+                  store_id: Optional[int] = None, category: Optional[str] = None,
+                  expires_after: Optional[datetime] = None, expires_before: Optional[datetime] = None):
+    query = _filter_batches(db.query(Batch), store_id, category, expires_after, expires_before)
+    return _keyset_page(query, Batch.id, after_id, limit)
+
+def get_all_batches(db: Session, **filters):
+    return batches_query(db, **filters).all()
+
+def get_all_batches_json(db: Session, **filters):
+    return _list_json(batches_query(db, **filters), BatchResponse, filters.get("limit"))
+
+def get_all_batches_rows(db: Session, **filters):
+    return _list_rows(batches_query(db, **filters), BatchResponse)
+
+def create_batch_service(db: Session, batch: BatchCreate):
+    db_batch = Batch(**batch.dict())
+    db.add(db_batch)
+    bump_versions(db, BATCHES)
+    db.commit()
+    db.refresh(db_batch)
+    return db_batch
+
+# Offer services
+def offers_query(db: Session, user_type: str = "public", after_id: Optional[int] = None,
+                 limit: Optional[int] = None, store_id: Optional[int] = None,
+                 category: Optional[str] = None, expires_after: Optional[datetime] = None,
+                 expires_before: Optional[datetime] = None):
+    now = datetime.utcnow()
+    query = db.query(Offer).filter(Offer.end_ts > now)
+    
+    if user_type == "nonprofit":
+        query = query.filter(Offer.audience == "nonprofit")
+    else:
+        query = query.filter(Offer.audience == "public")
+
+    if any(f is not None for f in (store_id, category, expires_after, expires_before)):
+        query = _filter_batches(query.join(Batch, Offer.batch_id == Batch.id),
+                                store_id, category, expires_after, expires_before)
+    
+    return _keyset_page(query, Offer.id, after_id, limit)
+
+def get_offers_for_user(db: Session, user_type: str, **filters):
+    return offers_query(db, user_type, **filters).all()
+
+def get_offer_rows(db: Session, user_type: str, **filters):
+    """GET /offers rows: projected for fast JSON, otherwise Offer objects"""
+    query = offers_query(db, user_type, **filters)
+    if fast_json_enabled():
+        return query.with_entities(*response_columns(Offer, OfferResponse)).all()
+    return query.all()
+
+def get_cached_offers(db: Session, user_type: str, **filters):
+    return cached_offers(partial(get_offer_rows, db), user_type, **filters)
+
+def cached_offers(fetch, user_type: str, **filters):
+    """
+    Serialized GET /offers body plus next-page cursor, served from offer_cache.
+    On a miss fetch(user_type, **filters) returns the rows. Entries expire at
+    the earliest end_ts they contain.
+    """
+    key = (user_type, *sorted(filters.items()))
+    cached = offer_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    # A write that commits during the fetch invalidates after it; its rows may be stale
+    generation = offer_cache.generation
+    offers = fetch(user_type, **filters)
+    if fast_json_enabled():
+        payload = dumps_rows(offers)
+    else:
+        payload = _offer_list.dump_json(_offer_list.validate_python(offers, from_attributes=True))
+    next_cursor = _next_cursor(offers, filters.get("limit"))
+    offer_cache.set(key, (payload, next_cursor), min((o.end_ts for o in offers), default=None), generation)
+    return payload, next_cursor
+
+_FEED_COLUMNS = (
+    Offer.id, Offer.batch_id, Offer.discount_pct, Offer.start_ts, Offer.end_ts, Offer.audience,
+    Batch.qty_available, Batch.expiry_ts, Batch.store_id,
+    Product.name.label("product_name"), Product.category, Product.base_price,
+    # PostgreSQL only has round(numeric, int)
+    func.round(cast(Product.base_price * (1 - Offer.discount_pct / 100), Numeric), 2).label("effective_price")
+)
+
+def get_offer_feed(db: Session, user_type: str = "public", after_id: Optional[int] = None,
+                   limit: Optional[int] = None, store_id: Optional[int] = None,
+                   category: Optional[str] = None):
+    """Live offers with their batch and product fields from one projected join"""
+    now = datetime.utcnow()
+    audience = OfferAudience.NONPROFIT if user_type == "nonprofit" else OfferAudience.PUBLIC
+    query = (
+        db.query(*_FEED_COLUMNS)
+        .join(Batch, Offer.batch_id == Batch.id)
+        .join(Product, Batch.product_id == Product.id)
+        .filter(Offer.end_ts > now, Offer.audience == audience)
+    )
+    if store_id is not None:
+        query = query.filter(Batch.store_id == store_id)
+    if category is not None:
+        query = query.filter(Product.category == category)
+    return _keyset_page(query, Offer.id, after_id, limit).all()
+
+def get_offer_feed_json(db: Session, user_type: str = "public", **filters):
+    # The feed is already a column projection named after OfferFeedItem's fields
+    rows = get_offer_feed(db, user_type, **filters)
+    return dumps_rows(rows), _next_cursor(rows, filters.get("limit"))
+
+def create_offer_service(db: Session, offer: OfferCreate):
+    # SQLite does not enforce the batch foreign key; the store also goes in the event
+    batch = db.execute(select(Batch.store_id).where(Batch.id == offer.batch_id)).first()
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    db_offer = Offer(**offer.dict())
+    db.add(db_offer)
+    db.commit()
+    offer_cache.invalidate()
+    db.refresh(db_offer)
+    event_bus.publish("offer_created", store_id=batch.store_id, audience=db_offer.audience.value,
+                      offer_id=db_offer.id, batch_id=db_offer.batch_id,
+                      discount_pct=db_offer.discount_pct, end_ts=db_offer.end_ts)
+    return db_offer
+
+# Store services
+def create_store_service(db: Session, store: StoreCreate):
+    db_store = Store(**store.dict(), geohash=geo.encode(store.latitude, store.longitude))
+    db.add(db_store)
+    db.commit()
+    db.refresh(db_store)
+    return db_store
+
+def get_all_stores(db: Session):
+    return db.query(Store).order_by(Store.id).all()
+
+def stores_within(db: Session, latitude: float, longitude: float, radius_km: float):
+    """(distance_km, store row) for every store in the circle, nearest first"""
+    cells = geo.cover(latitude, longitude, radius_km)
+    rows = db.execute(
+        select(Store.id, Store.name, Store.latitude, Store.longitude, Store.pickup_opens, Store.pickup_closes)
+        .where(or_(*(and_(Store.geohash >= cell, Store.geohash < geo.prefix_upper_bound(cell)) for cell in cells)))
+    ).all()
+    nearby = [(geo.haversine_km(latitude, longitude, row.latitude, row.longitude), row) for row in rows]
+    return sorted((item for item in nearby if item[0] <= radius_km), key=lambda item: (item[0], item[1].id))
+
+def _store_offer_rows(db: Session, store_id: int, batches, offers, wanted: int):
+    """
+    A store's offers, soonest-expiring batch first. Pages through the store's
+    batches that have a matching offer, then fetches those offers by batch
+    id. One join over both tables would let SQLite without statistics start
+    from ix_offers_audience_end_ts and read every store's live offers.
+    """
+    rows, after, page_size = [], None, wanted
+    while len(rows) < wanted:
+        page = batches.where(Batch.store_id == store_id)
+        if after is not None:
+            page = page.where(tuple_(Batch.expiry_ts, Batch.id) > after)
+        page = db.execute(page.limit(page_size)).all()
+        if page:
+            rows.extend(db.execute(offers, {"batch_ids": [batch.id for batch in page]}).all())
+        if len(page) < page_size:
+            break
+        after = (page[-1].expiry_ts, page[-1].id)
+        page_size *= 2
+    return rows[:wanted]
+
+def search_offers(db: Session, latitude: float, longitude: float, radius_km: float, **filters):
+    """
+    Live, in-stock offers at stores within radius_km, nearest store first and
+    soonest-expiring first within a store. Stores come from the geohash
+    index, and each store's batches from ix_batches_store_id_expiry_ts.
+    """
+    return offers_at_stores(db, stores_within(db, latitude, longitude, radius_km), **filters)
+
+def offers_at_stores(db: Session, stores, user_type: str = "public", category: Optional[str] = None,
+                     min_discount: Optional[float] = None, expiring_within_hours: Optional[float] = None,
+                     limit: int = 50):
+    """search_offers for (distance_km, store row) pairs from stores_within"""
+    now = datetime.utcnow()
+    audience = OfferAudience.NONPROFIT if user_type == "nonprofit" else OfferAudience.PUBLIC
+    batches = (
+        select(Batch.id, Batch.expiry_ts)
+        .where(Batch.expiry_ts > now, Batch.qty_available > 0)
+        .order_by(Batch.expiry_ts, Batch.id)
+    )
+    if expiring_within_hours is not None:
+        batches = batches.where(Batch.expiry_ts <= now + timedelta(hours=expiring_within_hours))
+    if category is not None:
+        batches = batches.join(Product, Batch.product_id == Product.id).where(Product.category == category)
+    matching = [Offer.audience == audience, Offer.end_ts > now]
+    if min_discount is not None:
+        matching.append(Offer.discount_pct >= min_discount)
+    # Skip batches without a matching offer, so sparse filters need few pages
+    batches = batches.where(select(Offer.id).where(Offer.batch_id == Batch.id, *matching).exists())
+    offers = (
+        select(*_FEED_COLUMNS)
+        .join(Batch, Offer.batch_id == Batch.id)
+        .join(Product, Batch.product_id == Product.id)
+        .where(Offer.batch_id.in_(bindparam("batch_ids", expanding=True)), *matching)
+        .order_by(Batch.expiry_ts, Batch.id, Offer.id)
+    )
+
+    results = []
+    for distance_km, store in stores:
+        rows = _store_offer_rows(db, store.id, batches, offers, limit - len(results))
+        results.extend(
+            {**row._mapping, "store_name": store.name, "distance_km": round(distance_km, 3),
+             "pickup_opens": store.pickup_opens, "pickup_closes": store.pickup_closes}
+            for row in rows
+        )
+        if len(results) >= limit:
+            break
+    return results
+
+def search_offers_json(db: Session, latitude: float, longitude: float, radius_km: float, **filters):
+    return dumps_records(search_offers(db, latitude, longitude, radius_km, **filters))
+
+# Reservation services
+# Confirmation codes are the reservation id run through a 4-round Feistel network
+# keyed with CONFIRMATION_CODE_SECRET: a permutation of the code space, so unique
+# by construction (no retry on collision), but without the key a code says
+# nothing about its neighbours'. Scanners submit codes in bulk, hence 10 digits.
+CODE_DIGITS = 10
+_CODE_SPACE = 10 ** CODE_DIGITS
+_CODE_HALF = 10 ** (CODE_DIGITS // 2)
+_CODE_ROUNDS = 4
+
+_code_secret = get_settings().confirmation_code_secret
+if _code_secret is None:
+    logger.warning("CONFIRMATION_CODE_SECRET is not set; confirmation codes use a development key "
+                   "and can be derived from the reservation id")
+    _code_secret = "development-only"
+# Keyed BLAKE2b is a MAC on its own; its key is at most 64 bytes
+_CODE_KEY = hashlib.sha256(_code_secret.encode()).digest()
+
+def _code_round(round_number: int, half: int):
+    mac = hashlib.blake2b(b"%d:%d" % (round_number, half), key=_CODE_KEY, digest_size=8)
+    return int.from_bytes(mac.digest(), "big") % _CODE_HALF
+
+def confirmation_code_for(reservation_id: int):
+    high, low = divmod(reservation_id, _CODE_SPACE)
+    left, right = divmod(low, _CODE_HALF)
+    for round_number in range(_CODE_ROUNDS):
+        left, right = right, (left + _code_round(round_number, right)) % _CODE_HALF
+    code = f"{left * _CODE_HALF + right:0{CODE_DIGITS}d}"
+    # Ids past the code space get a distinct, longer code
+    return f"{high}{code}" if high else code
+
+def stage_reservation(db: Session, reservation: ReservationCreate):
+    """
+    create_reservation up to the commit: returns the reservation and a
+    callable publishing its event, for after the caller commits
+    """
+    # Take inventory atomically: the UPDATE only matches while enough stock is left,
+    # so concurrent reservations can never oversell a batch
+    batch_id = select(Offer.batch_id).where(Offer.id == reservation.offer_id).scalar_subquery()
+    batch = db.execute(
+        update(Batch)
+        .where(Batch.id == batch_id, Batch.qty_available >= reservation.qty_reserved)
+        .values(qty_available=Batch.qty_available - reservation.qty_reserved)
+        .returning(Batch.id, Batch.store_id, Batch.qty_available)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if batch is None:
+        # Nothing was written; the caller rolls back
+        if db.get(Offer, reservation.offer_id) is None:
+            raise HTTPException(status_code=404, detail="Offer not found")
+        raise HTTPException(status_code=409, detail="Not enough quantity available")
+    
+    db_reservation = Reservation(**reservation.dict())
+    db.add(db_reservation)
+    db.flush()  # Get the ID
+    db_reservation.confirmation_code = confirmation_code_for(db_reservation.id)
+    bump_versions(db, BATCHES)
+    return db_reservation, partial(event_bus.publish, "inventory", store_id=batch.store_id, batch_id=batch.id,
+                                   qty_available=batch.qty_available)
+
+def create_reservation(db: Session, reservation: ReservationCreate):
+    try:
+        db_reservation, publish = stage_reservation(db, reservation)
+    except HTTPException:
+        db.rollback()
+        raise
+    db.commit()
+    db.refresh(db_reservation)
+    publish()
+    return db_reservation
+
+def get_user_reservations(db: Session, user_id: int):
+    return db.query(Reservation).filter(Reservation.user_id == user_id).all()
+
+def get_user_reservations_json(db: Session, user_id: int):
+    payload, _ = _list_json(db.query(Reservation).filter(Reservation.user_id == user_id), ReservationResponse)
+    return payload
+
+def get_user_reservation_rows(db: Session, user_id: int):
+    return _list_rows(db.query(Reservation).filter(Reservation.user_id == user_id), ReservationResponse)
+
+# Pickup services
+def _reservations_for_pickup(db: Session):
+    # Reservation -> Offer -> Batch -> Product in a single joined query
+    return db.query(Reservation).options(
+        joinedload(Reservation.offer).joinedload(Offer.batch).joinedload(Batch.product)
+    )
+
+def _pickup_events(reservations):
+    # Built before commit: afterwards the loaded objects are expired and reading
+    # them again would cost a query per relationship
+    return [
+        dict(store_id=r.offer.batch.store_id, reservation_id=r.id,
+             batch_id=r.offer.batch_id, qty_picked_up=r.qty_reserved)
+        for r in reservations
+    ]
+
+def _publish_pickups(events):
+    for event in events:
+        event_bus.publish("pickup_confirmed", **event)
+
+def stage_pickup(db: Session, pickup: PickupCreate):
+    """
+    confirm_pickup_service up to the commit: returns the pickup and a
+    callable publishing its event, for after the caller commits
+    """
+    # Claim the reservation atomically: only a RESERVED one can be picked up.
+    # A no-show has already put its units back on the batch, and a second
+    # confirm must not count the same pickup twice.
+    claimed = db.execute(
+        update(Reservation)
+        .where(Reservation.id == pickup.reservation_id, Reservation.status == ReservationStatus.RESERVED)
+        .values(status=ReservationStatus.PICKED_UP)
+    ).rowcount
+    if not claimed:
+        # Nothing was written; the caller rolls back
+        if db.get(Reservation, pickup.reservation_id) is None:
+            raise HTTPException(status_code=404, detail="Reservation not found")
+        raise HTTPException(status_code=409, detail="Reservation is not awaiting pickup")
+    reservation = _reservations_for_pickup(db).filter(Reservation.id == pickup.reservation_id).one()
+    
+    # Create pickup record
+    db_pickup = Pickup(**pickup.dict())
+    db.add(db_pickup)
+    
+    # Update impact metrics
+    update_impact_metrics(db, reservation)
+    
+    events = _pickup_events([reservation])
+    bump_versions(db, IMPACT)
+    db.flush()
+    return db_pickup, partial(_publish_pickups, events)
+
+def confirm_pickup_service(db: Session, pickup: PickupCreate):
+    db_pickup, publish = stage_pickup(db, pickup)
+    db.commit()
+    db.refresh(db_pickup)
+    publish()
+    return db_pickup
+
+def confirm_pickups_batch_service(db: Session, pickups: PickupBatchCreate):
+    """Confirm many reservations by id or confirmation code in one transaction"""
+    ids = set(pickups.reservation_ids)
+    codes = set(pickups.confirmation_codes)
+    found = db.execute(select(Reservation.id, Reservation.confirmation_code).where(or_(
+        Reservation.id.in_(ids),
+        Reservation.confirmation_code.in_(codes)
+    ))).all() if ids or codes else []
+    
+    found_ids = {r.id for r in found}
+    found_codes = {r.confirmation_code for r in found}
+    not_found = [str(i) for i in sorted(ids - found_ids)] + sorted(codes - found_codes)
+    
+    # Claim them atomically, as stage_pickup does: only RESERVED ones are picked
+    # up. The rest were picked up already or restocked as no-shows.
+    claimed = set(db.execute(
+        update(Reservation)
+        .where(Reservation.id.in_(found_ids), Reservation.status == ReservationStatus.RESERVED)
+        .values(status=ReservationStatus.PICKED_UP)
+        .returning(Reservation.id)
+        .execution_options(synchronize_session=False)
+    ).scalars()) if found_ids else set()
+    skipped = sorted(found_ids - claimed)
+    reservations = _reservations_for_pickup(db).filter(Reservation.id.in_(claimed)).all() if claimed else []
+    
+    db_pickups = []
+    for reservation in reservations:
+        db_pickup = Pickup(reservation_id=reservation.id, staff_id=pickups.staff_id)
+        db.add(db_pickup)
+        db_pickups.append(db_pickup)
+        update_impact_metrics(db, reservation)
+    
+    db.flush()
+    confirmed = [PickupResponse.model_validate(p) for p in db_pickups]
+    events = _pickup_events(reservations)
+    if db_pickups:
+        bump_versions(db, IMPACT)
+    db.commit()
+    _publish_pickups(events)
+    return PickupBatchResponse(confirmed=confirmed, skipped=skipped, not_found=not_found)
+
+# No-shows are processed in bounded chunks, one transaction each
+RELIST_CHUNK_SIZE = 1000
+
+def handle_no_shows(db: Session, chunk_size: int = RELIST_CHUNK_SIZE, max_reservations: Optional[int] = None,
+                    since: Optional[datetime] = None):
+    """
+    Mark expired reservations as no-shows and relist their batches.
+    With since, only reservations whose pickup window closed after it are scanned.
+    """
+    now = datetime.utcnow()
+    window = [Reservation.pickup_end_ts < now]
+    if since is not None:
+        window.append(Reservation.pickup_end_ts >= since)
+    batches = Batch.__table__
+    restore_inventory = (
+        update(batches)
+        .where(batches.c.id == bindparam("b_id"))
+        .values(qty_available=batches.c.qty_available + bindparam("qty"))
+    )
+    
+    no_show_count = 0
+    relisted_batches = set()
+    while max_reservations is None or no_show_count < max_reservations:
+        limit = chunk_size if max_reservations is None else min(chunk_size, max_reservations - no_show_count)
+        rows = db.execute(
+            select(Reservation.id, Reservation.qty_reserved, Offer.batch_id, Offer.discount_pct, Offer.end_ts,
+                   Batch.store_id)
+            .outerjoin(Offer, Reservation.offer_id == Offer.id)
+            .outerjoin(Batch, Offer.batch_id == Batch.id)
+            .where(Reservation.status == ReservationStatus.RESERVED, *window)
+            .order_by(Reservation.id)
+            .limit(limit)
+        ).all()
+        if not rows:
+            break
+        
+        # Only rows still RESERVED: one picked up since the select keeps its status,
+        # and its units stay sold
+        claimed = set(db.execute(
+            update(Reservation)
+            .where(Reservation.id.in_([row.id for row in rows]), Reservation.status == ReservationStatus.RESERVED)
+            .values(status=ReservationStatus.NO_SHOW)
+            .returning(Reservation.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        
+        # Group by batch: return the units and relist each batch once per run
+        returned = {}
+        relists = {}
+        store_ids = {}
+        for row in rows:
+            if row.id not in claimed:
+                continue
+            if row.batch_id is None:
+                continue
+            store_ids[row.batch_id] = row.store_id
+            returned[row.batch_id] = returned.get(row.batch_id, 0) + row.qty_reserved
+            if row.batch_id in relisted_batches:
+                continue
+            discount_pct, end_ts = relists.get(row.batch_id, (row.discount_pct, row.end_ts))
+            relists[row.batch_id] = (max(discount_pct, row.discount_pct), max(end_ts, row.end_ts))
+        
+        if returned:
+            db.execute(restore_inventory, [{"b_id": b, "qty": qty} for b, qty in returned.items()])
+            bump_versions(db, BATCHES)
+        if relists:
+            # Skip batches an earlier run already relisted at the same or a deeper discount
+            live_discounts = dict(db.execute(
+                select(Offer.batch_id, func.max(Offer.discount_pct))
+                .where(
+                    Offer.batch_id.in_(list(relists)),
+                    Offer.audience == OfferAudience.PUBLIC,
+                    Offer.start_ts <= now,
+                    Offer.end_ts > now
+                )
+                .group_by(Offer.batch_id)
+            ).tuples().all())
+            relists = {
+                batch_id: (discount_pct, end_ts)
+                for batch_id, (discount_pct, end_ts) in relists.items()
+                if live_discounts.get(batch_id, -1) < min(discount_pct + 10, 80)
+            }
+        if relists:
+            # New public offer with increased discount
+            db.execute(insert(Offer), [
+                {
+                    "batch_id": batch_id,
+                    "discount_pct": min(discount_pct + 10, 80),  # Cap at 80%
+                    "start_ts": now,
+                    "end_ts": end_ts,
+                    "audience": OfferAudience.PUBLIC,
+                    "created_at": now,
+                }
+                for batch_id, (discount_pct, end_ts) in relists.items()
+            ])
+            relisted_batches.update(relists)
+        
+        db.commit()
+        for batch_id, qty in returned.items():
+            event_bus.publish("inventory", store_id=store_ids.get(batch_id), batch_id=batch_id, qty_returned=qty)
+        no_show_count += len(claimed)
+        if len(rows) < limit:
+            break
+    
+    if relisted_batches:
+        offer_cache.invalidate()
+        event_bus.publish("offers_refreshed", audience=OfferAudience.PUBLIC.value, created_offers=len(relisted_batches))
+    return {"relisted_count": len(relisted_batches), "no_show_count": no_show_count}
+
+# Impact services
+TOTALS_ID = 1
+
+def _items_to_lbs(items: int):
+    # Convert grams to pounds (1 kg = 2.20462 lbs)
+    return items * 0.15 * 2.20462  # Assuming 150g average item weight
+
+def get_impact_metrics(db: Session):
+    # O(1): read the running totals instead of summing every Impact row
+    totals = db.get(ImpactTotal, TOTALS_ID)
+    total_items = totals.qty_picked_up if totals else 0
+    
+    return ImpactResponse(
+        total_lbs_saved=_items_to_lbs(total_items),
+        total_co2e_avoided=totals.co2e_saved_kg if totals else 0,
+        total_revenue_recovered=totals.revenue_recovered if totals else 0,
+        total_items_rescued=total_items
+    )
+
+def get_impact_series(db: Session, bucket: str = "day", store_id: Optional[int] = None,
+                      category: Optional[str] = None, start: Optional[date] = None,
+                      end: Optional[date] = None):
+    query = db.query(
+        ImpactDaily.day,
+        func.sum(ImpactDaily.qty_picked_up).label('items'),
+        func.sum(ImpactDaily.co2e_saved_kg).label('co2e'),
+        func.sum(ImpactDaily.revenue_recovered).label('revenue')
+    )
+    if store_id is not None:
+        query = query.filter(ImpactDaily.store_id == store_id)
+    if category is not None:
+        query = query.filter(ImpactDaily.category == category)
+    if start is not None:
+        query = query.filter(ImpactDaily.day >= start)
+    if end is not None:
+        query = query.filter(ImpactDaily.day < end)
+    
+    # Fold daily rows into week/month buckets; at most a few thousand rows per query
+    buckets = {}
+    for row in query.group_by(ImpactDaily.day).order_by(ImpactDaily.day):
+        if bucket == "week":
+            key = row.day - timedelta(days=row.day.weekday())
+        elif bucket == "month":
+            key = row.day.replace(day=1)
+        else:
+            key = row.day
+        items, co2e, revenue = buckets.get(key, (0, 0.0, 0.0))
+        buckets[key] = (items + row.items, co2e + row.co2e, revenue + row.revenue)
+    
+    return [
+        ImpactSeriesPoint(
+            bucket_start=key,
+            lbs_saved=_items_to_lbs(items),
+            co2e_avoided=co2e,
+            revenue_recovered=revenue,
+            items_rescued=items
+        )
+        for key, (items, co2e, revenue) in buckets.items()
+    ]
+
+def _add_to_rollups(db: Session, store_id: int, category: str, day: date,
+                    qty: int, co2e: float, revenue: float):
+    daily = upsert_insert(db, ImpactDaily).values(
+        store_id=store_id, category=category, day=day,
+        qty_picked_up=qty, co2e_saved_kg=co2e, revenue_recovered=revenue
+    )
+    db.execute(daily.on_conflict_do_update(
+        index_elements=["store_id", "category", "day"],
+        set_={
+            "qty_picked_up": ImpactDaily.qty_picked_up + daily.excluded.qty_picked_up,
+            "co2e_saved_kg": ImpactDaily.co2e_saved_kg + daily.excluded.co2e_saved_kg,
+            "revenue_recovered": ImpactDaily.revenue_recovered + daily.excluded.revenue_recovered,
+        }
+    ))
+    total = upsert_insert(db, ImpactTotal).values(
+        id=TOTALS_ID, qty_picked_up=qty, co2e_saved_kg=co2e, revenue_recovered=revenue
+    )
+    db.execute(total.on_conflict_do_update(
+        index_elements=["id"],
+        set_={
+            "qty_picked_up": ImpactTotal.qty_picked_up + total.excluded.qty_picked_up,
+            "co2e_saved_kg": ImpactTotal.co2e_saved_kg + total.excluded.co2e_saved_kg,
+            "revenue_recovered": ImpactTotal.revenue_recovered + total.excluded.revenue_recovered,
+        }
+    ))
+
+def _impact_rows(impact, batch):
+    # Raw impact rows with the store and category they roll up under
+    return (
+        select(
+            func.coalesce(batch.store_id, 0).label("store_id"),
+            func.coalesce(Product.category, "").label("category"),
+            func.date(impact.created_at).label("day"),
+            impact.qty_picked_up, impact.co2e_saved_kg, impact.revenue_recovered
+        )
+        .select_from(impact)
+        .join(batch, impact.batch_id == batch.id)
+        .join(Product, batch.product_id == Product.id)
+    )
+
+def rebuild_impact_rollups(db: Session):
+    """Recompute the daily and total rollups from the raw Impact rows, archived ones included"""
+    db.query(ImpactDaily).delete()
+    db.query(ImpactTotal).delete()
+    
+    rows = union_all(_impact_rows(Impact, Batch), _impact_rows(ImpactArchive, BatchArchive)).subquery()
+    daily = (
+        select(
+            rows.c.store_id, rows.c.category, rows.c.day,
+            func.sum(rows.c.qty_picked_up),
+            func.sum(rows.c.co2e_saved_kg),
+            func.sum(rows.c.revenue_recovered)
+        )
+        .group_by(rows.c.store_id, rows.c.category, rows.c.day)
+    )
+    result = db.execute(insert(ImpactDaily).from_select(
+        ["store_id", "category", "day", "qty_picked_up", "co2e_saved_kg", "revenue_recovered"], daily
+    ))
+    db.execute(insert(ImpactTotal).from_select(
+        ["id", "qty_picked_up", "co2e_saved_kg", "revenue_recovered"],
+        select(
+            literal(TOTALS_ID),
+            func.coalesce(func.sum(ImpactDaily.qty_picked_up), 0),
+            func.coalesce(func.sum(ImpactDaily.co2e_saved_kg), 0),
+            func.coalesce(func.sum(ImpactDaily.revenue_recovered), 0)
+        )
+    ))
+    bump_versions(db, IMPACT)
+    db.commit()
+    return {"daily_rows": result.rowcount}
+
+def update_impact_metrics(db: Session, reservation: Reservation):
+    # Uses the relationships eagerly loaded by _reservations_for_pickup
+    offer = reservation.offer
+    batch = offer.batch
+    product = batch.product
+    
+    # Calculate CO2e saved (example: dairy products)
+    co2e_per_kg = 1.9  # kg CO2e per kg of dairy
+    weight_kg = (product.weight_grams * reservation.qty_reserved) / 1000
+    co2e_saved = weight_kg * co2e_per_kg
+    
+    # Calculate revenue recovered
+    revenue_recovered = reservation.qty_reserved * product.base_price * (1 - offer.discount_pct / 100)
+    
+    # Create impact record
+    now = datetime.utcnow()
+    impact = Impact(
+        batch_id=batch.id,
+        qty_picked_up=reservation.qty_reserved,
+        co2e_saved_kg=co2e_saved,
+        revenue_recovered=revenue_recovered,
+        created_at=now
+    )
+    db.add(impact)
+    
+    # Keep the rollups in step within the caller's transaction
+    _add_to_rollups(db, batch.store_id or 0, product.category or "", now.date(),
+                    reservation.qty_reserved, co2e_saved, revenue_recovered)
+
+# Markdown engine
+def _markdown_discount(now: datetime):
+    # Discount tiers based on hours left, evaluated in SQL for every batch at once
+    return case(
+        (Batch.expiry_ts < now + timedelta(hours=6), 60),
+        (Batch.expiry_ts < now + timedelta(hours=12), 40),
+        (Batch.expiry_ts < now + timedelta(hours=18), 30),
+        else_=20,
+    )
+
+def apply_markdown_engine(db: Session, since: Optional[datetime] = None):
+    """
+    Create nonprofit and public offers for every live batch that has none.
+    With since, only batches created after it are considered.
+    """
+    now = datetime.utcnow()
+    nonprofit_window_end = now + timedelta(hours=2)  # 2-hour nonprofit window
+
+    # Anti-join: live batches that have no nonprofit offer yet
+    candidates = (
+        select(Batch.id, Batch.expiry_ts, _markdown_discount(now).label("discount_pct"))
+        .outerjoin(Offer, and_(
+            Offer.batch_id == Batch.id,
+            Offer.audience == OfferAudience.NONPROFIT
+        ))
+        .where(Batch.expiry_ts > now, Offer.id.is_(None))
+    )
+    if since is not None:
+        candidates = candidates.where(Batch.created_at >= since)
+    candidates = candidates.subquery()
+    columns = ["batch_id", "discount_pct", "start_ts", "end_ts", "audience", "created_at"]
+
+    # Public offers go in first so the anti-join still sees the same candidate set
+    public_offers = db.execute(
+        insert(Offer).from_select(columns, select(
+            candidates.c.id,
+            candidates.c.discount_pct,
+            literal(nonprofit_window_end, Offer.start_ts.type),
+            candidates.c.expiry_ts,
+            literal(OfferAudience.PUBLIC, Offer.audience.type),
+            literal(now, Offer.created_at.type),
+        ))
+    )
+    nonprofit_offers = db.execute(
+        insert(Offer).from_select(columns, select(
+            candidates.c.id,
+            candidates.c.discount_pct,
+            literal(now, Offer.start_ts.type),
+            literal(nonprofit_window_end, Offer.end_ts.type),
+            literal(OfferAudience.NONPROFIT, Offer.audience.type),
+            literal(now, Offer.created_at.type),
+        ))
+    )
+
+    db.commit()
+    created_offers = public_offers.rowcount + nonprofit_offers.rowcount
+    if created_offers:
+        offer_cache.invalidate()
+        event_bus.publish("offers_refreshed", created_offers=created_offers)
+    return {"created_offers": created_offers}
@@ -0,0 +1,50 @@
+"""
+Process settings, read once from the environment and .env
+
+get_settings() loads .env on first use and caches the result, so the file
+is read once per process however many modules ask. Values already in the
+environment win over .env. Settings read elsewhere with os.getenv see the
+.env values too, as long as they are read after the first get_settings().
+"""
+import os
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+def _flag(name: str, default: str = "false"):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+class Settings:
+    """Startup settings for the database module, the offer cache, the app factory and the opt-in features"""
+
+    def __init__(self):
+        # SQLite for development, PostgreSQL in production
+        self.database_url: str = os.getenv("DATABASE_URL", "sqlite:///./zerowaste.db")
+        # Optional read replica for GET endpoints; defaults to the primary
+        self.database_replica_url: Optional[str] = os.getenv("DATABASE_REPLICA_URL")
+        # Override the async URLs derived from the two above
+        self.async_database_url: Optional[str] = os.getenv("ASYNC_DATABASE_URL")
+        self.async_database_replica_url: Optional[str] = os.getenv("ASYNC_DATABASE_REPLICA_URL")
+        self.cors_origins = [origin.strip() for origin in
+                             os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",") if origin.strip()]
+        # Keys the permutation behind reservation confirmation codes (services.py);
+        # every process sharing a database must use the same value
+        self.confirmation_code_secret: Optional[str] = os.getenv("CONFIRMATION_CODE_SECRET")
+        # GET /offers response cache (cache.py); a TTL of 0 disables it
+        self.offer_cache_size: int = int(os.getenv("OFFER_CACHE_SIZE", "256"))
+        self.offer_cache_ttl_seconds: float = float(os.getenv("OFFER_CACHE_TTL_SECONDS", "30"))
+        # Throwaway databases only: create missing tables when the app starts
+        # instead of with init_db.py (see init_db.create_schema)
+        self.create_schema_on_startup: bool = _flag("CREATE_SCHEMA_ON_STARTUP")
+        # Opt-in features, each read through the *_enabled() of the module named
+        self.async_db_enabled: bool = _flag("ASYNC_DB_ENABLED")  # database
+        self.fast_json_responses: bool = _flag("FAST_JSON_RESPONSES")  # fast_json
+        self.group_commit: bool = _flag("GROUP_COMMIT")  # group_commit
+        # Periodic jobs (scheduler); on one worker per deployment
+        self.scheduler_enabled: bool = _flag("SCHEDULER_ENABLED")
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    load_dotenv()
+    return Settings()
@@ -0,0 +1,129 @@
+"""
+Cross-shard versions of the read services
+
+With SHARD_DATABASE_URLS set, async_services routes reads that span stores
+here. Each function runs its counterpart from services.py on every shard in
+parallel (sharding.shard_router.scatter) and merges the results the way one
+database would have returned them: keyset pages in id order, search results
+nearest first, impact figures summed. Reads filtered by store_id go to that
+store's shard alone.
+"""
+from functools import partial
+from typing import List, Optional
+
+from fast_json import dumps_records
+from schemas import *
+from sharding import merge_sorted, shard_router
+import archive
+import services
+import versions
+
+# Collection versions for conditional GET
+def get_versions(collections):
+    """Every shard's counters summed, so a write on any shard changes the ETag"""
+    merged = {}
+    for shard_versions in shard_router.scatter(versions.get_versions, collections):
+        for name, (version, updated_at) in shard_versions.items():
+            total, latest = merged.get(name, (0, updated_at))
+            merged[name] = (total + version, max(latest, updated_at))
+    return merged
+
+# Batch services
+def get_all_batches(**filters):
+    return shard_router.page(services.get_all_batches, **filters)
+
+def get_all_batches_json(**filters):
+    return services.rows_json(shard_router.page(services.get_all_batches_rows, **filters), filters.get("limit"))
+
+def get_batch_history(**filters):
+    return shard_router.page(archive.get_batch_history_rows, **filters)
+
+# Offer services
+def get_cached_offers(user_type: str, **filters):
+    return services.cached_offers(partial(shard_router.page, services.get_offer_rows), user_type, **filters)
+
+def get_offer_feed(user_type: str = "public", **filters):
+    return shard_router.page(services.get_offer_feed, user_type, **filters)
+
+def get_offer_feed_json(user_type: str = "public", **filters):
+    return services.rows_json(get_offer_feed(user_type, **filters), filters.get("limit"))
+
+def search_offers(latitude: float, longitude: float, radius_km: float, limit: int = 50, **filters):
+    # Stores from the catalog, then each shard searches only its own stores
+    stores = shard_router.catalog.run(services.stores_within, latitude, longitude, radius_km)
+    by_shard = {}
+    for item in stores:
+        by_shard.setdefault(shard_router.for_store(item[1].id), []).append(item)
+    pages = shard_router.run_parallel([
+        (shard, services.offers_at_stores, (shard_stores,), dict(filters, limit=limit))
+        for shard, shard_stores in by_shard.items()
+    ])
+    return merge_sorted(pages, lambda item: (item["distance_km"], item["store_id"], item["expiry_ts"],
+                                             item["batch_id"], item["id"]), limit)
+
+def search_offers_json(latitude: float, longitude: float, radius_km: float, **filters):
+    return dumps_records(search_offers(latitude, longitude, radius_km, **filters))
+
+# Reservation services
+def get_user_reservations(user_id: int):
+    return [row for page in shard_router.scatter(services.get_user_reservations, user_id) for row in page]
+
+def get_user_reservations_json(user_id: int):
+    rows = [row for page in shard_router.scatter(services.get_user_reservation_rows, user_id) for row in page]
+    payload, _ = services.rows_json(rows)
+    return payload
+
+def get_user_reservation_history(user_id: int):
+    pages = shard_router.scatter(archive.get_user_reservation_history_rows, user_id)
+    return [row for page in pages for row in page]
+
+# Pickup services
+def split_pickup_batch(pickups: PickupBatchCreate) -> List[Optional[PickupBatchCreate]]:
+    """
+    One request per shard: reservation ids go to their own shard, codes to
+    every shard since a code does not name it. None for a shard with nothing.
+    """
+    ids = [[] for _ in shard_router.shards]
+    for reservation_id in pickups.reservation_ids:
+        ids[shard_router.for_id(reservation_id).index].append(reservation_id)
+    return [
+        PickupBatchCreate(staff_id=pickups.staff_id, reservation_ids=shard_ids,
+                          confirmation_codes=pickups.confirmation_codes)
+        if shard_ids or pickups.confirmation_codes else None
+        for shard_ids in ids
+    ]
+
+def merge_pickup_batches(pickups: PickupBatchCreate, results: List[Optional[PickupBatchResponse]]):
+    results = [result for result in results if result is not None]
+    not_found = [set(result.not_found) for result in results]
+    # An id was only looked up on its own shard, a code on every shard
+    missing_ids = set().union(*not_found)
+    missing_codes = set.intersection(*not_found) if not_found else set()
+    return PickupBatchResponse(
+        confirmed=[pickup for result in results for pickup in result.confirmed],
+        skipped=[reservation_id for result in results for reservation_id in result.skipped],
+        not_found=[str(i) for i in sorted(set(pickups.reservation_ids)) if str(i) in missing_ids]
+        + sorted(code for code in set(pickups.confirmation_codes) if code in missing_codes),
+    )
+
+# Impact services
+def get_impact_metrics():
+    totals = shard_router.scatter(services.get_impact_metrics)
+    return ImpactResponse(**{field: sum(getattr(shard_totals, field) for shard_totals in totals)
+                             for field in ImpactResponse.model_fields})
+
+def get_impact_series(bucket: str = "day", store_id: Optional[int] = None, category: Optional[str] = None,
+                      start=None, end=None):
+    args = (bucket, store_id, category, start, end)
+    if store_id is not None:
+        return shard_router.for_store(store_id).run(services.get_impact_series, *args)
+    buckets = {}
+    for series in shard_router.scatter(services.get_impact_series, *args):
+        for point in series:
+            merged = buckets.get(point.bucket_start)
+            buckets[point.bucket_start] = point if merged is None else ImpactSeriesPoint(
+                bucket_start=point.bucket_start,
+                **{field: getattr(merged, field) + getattr(point, field)
+                   for field in ImpactSeriesPoint.model_fields if field != "bucket_start"}
+            )
+    return [buckets[key] for key in sorted(buckets)]
@@ -0,0 +1,251 @@
+"""
+Per-store sharding over several databases
+
+Opt-in with SHARD_DATABASE_URLS, a comma-separated list of extra database
+URLs: SQLite files, or PostgreSQL databases (a schema works too, through
+?options=-csearch_path=<schema>). DATABASE_URL stays shard 0, so without the
+variable there is one shard and nothing changes.
+
+A store lives on shard store_id % shard count, together with its batches and
+everything that hangs off them: offers, reservations, pickups and impact.
+Shard k hands out ids for those tables from its own range,
+[k * SHARD_ID_SPAN + 1, (k + 1) * SHARD_ID_SPAN], so an offer or reservation
+id names its shard without a lookup. Ids stay unique and ordered across
+shards, which makes a global keyset page the shards' pages in shard order.
+
+Products and stores are the shared catalog. Shard 0 owns it: catalog writes
+go there and are then copied, ids included, to every other shard, so each
+shard joins its batches to products locally. prepare() copies the whole
+catalog again at startup, which repairs a copy that failed half way.
+
+Each shard has its own engine, sessions and (on SQLite) writer thread, so a
+busy store's writes only queue behind its own shard. Reads that span stores
+query every shard in parallel and merge the results (scatter()).
+
+Shards other than shard 0 are created by prepare(), not by the Alembic
+migrations. Stores are not moved when the shard count changes: pick it
+before the first batch is written.
+"""
+import asyncio
+import contextvars
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, List, Optional
+
+from sqlalchemy import MetaData, select, text
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, SessionLocal, create_db_engine, engine, upsert_insert
+from models import Batch, Impact, Offer, Pickup, Product, Reservation, Store
+
+# PostgreSQL ids are 32-bit, which leaves room for 21 shards of 10**8 ids.
+# Every shard must agree on it, and it cannot change once ids are handed out.
+SHARD_ID_SPAN = int(os.getenv("SHARD_ID_SPAN", str(10 ** 8)))
+
+# Tables whose ids carry their shard; the rest are catalog or shard-local
+RANGED_TABLES = [model.__tablename__ for model in (Batch, Offer, Reservation, Pickup, Impact)]
+CATALOG_MODELS = (Product, Store)
+
+# Catalog rows per upsert when copying the catalog to a shard
+CATALOG_COPY_CHUNK = 5000
+
+def shard_database_urls() -> List[str]:
+    return [url.strip() for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url.strip()]
+
+class Shard:
+    """One database: its engine, sessions and SQLite writer thread"""
+
+    def __init__(self, index: int, engine, session_factory):
+        self.index = index
+        self.engine = engine
+        self.SessionLocal = session_factory
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-writer-{index}")
+
+    @property
+    def is_sqlite(self):
+        return self.engine.dialect.name == "sqlite"
+
+    def run(self, func: Callable, *args, **kwargs):
+        """func(db, *args, **kwargs) on a new session of this shard"""
+        # Not expired on commit: results are serialized after the session closes
+        db = self.SessionLocal(expire_on_commit=False)
+        try:
+            return func(db, *args, **kwargs)
+        finally:
+            db.close()
+
+class ShardRouter:
+    """Maps stores and ids to shards and runs work on one or all of them"""
+
+    def __init__(self, shards: List[Shard]):
+        self.shards = shards
+        # Scatter threads mostly wait on their shard's database
+        self._pool = ThreadPoolExecutor(max_workers=4 * len(shards), thread_name_prefix="shard-scatter")
+
+    @classmethod
+    def from_env(cls):
+        shards = [Shard(0, engine, SessionLocal)]
+        for index, url in enumerate(shard_database_urls(), start=1):
+            shard_engine = create_db_engine(url)
+            shards.append(Shard(index, shard_engine, sessionmaker(autocommit=False, autoflush=False,
+                                                                  bind=shard_engine)))
+        return cls(shards)
+
+    @property
+    def sharded(self):
+        return len(self.shards) > 1
+
+    @property
+    def engines(self):
+        return [shard.engine for shard in self.shards]
+
+    # Routing
+    def for_store(self, store_id: Optional[int]) -> Shard:
+        return self.shards[(store_id or 0) % len(self.shards)]
+
+    def for_id(self, row_id: int) -> Shard:
+        """The shard that handed out a batch, offer, reservation or pickup id"""
+        index = (row_id - 1) // SHARD_ID_SPAN if row_id and row_id > 0 else 0
+        return self.shards[index] if index < len(self.shards) else self.shards[0]
+
+    @property
+    def catalog(self) -> Shard:
+        return self.shards[0]
+
+    # Running work
+    def run_parallel(self, calls) -> list:
+        """Run (shard, func, args, kwargs) calls in parallel; results in call order"""
+        context = contextvars.copy_context()
+        futures = [self._pool.submit(context.copy().run, shard.run, func, *args, **kwargs)
+                   for shard, func, args, kwargs in calls]
+        return [future.result() for future in futures]
+
+    def scatter(self, func: Callable, *args, **kwargs) -> list:
+        """func(db, ...) on every shard in parallel; results in shard order"""
+        return self.run_parallel([(shard, func, args, kwargs) for shard in self.shards])
+
+    def page(self, func: Callable, *args, **filters) -> list:
+        """
+        A keyset page of func(db, *args, **filters) rows: from the store's
+        shard when filters name a store_id, otherwise from every shard
+        """
+        store_id = filters.get("store_id")
+        if store_id is not None:
+            return self.for_store(store_id).run(func, *args, **filters)
+        return merge_pages(self.scatter(func, *args, **filters), filters.get("limit"))
+
+    def each(self, func: Callable, *args, **kwargs) -> list:
+        """func(db, ...) on every shard in turn; for jobs that write to every shard"""
+        return [shard.run(func, *args, **kwargs) for shard in self.shards]
+
+    async def write(self, shard: Shard, func: Callable, *args, **kwargs):
+        """
+        func(db, ...) as a write on shard. SQLite writes queue on the shard's
+        writer thread (see async_services), PostgreSQL ones run on any thread.
+        """
+        if not shard.is_sqlite:
+            return await asyncio.to_thread(shard.run, func, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(shard.writer, partial(context.run, shard.run, func, *args, **kwargs))
+
+    async def write_all(self, func: Callable, *args, **kwargs) -> list:
+        return await asyncio.gather(*(self.write(shard, func, *args, **kwargs) for shard in self.shards))
+
+    # Catalog replication
+    def copy_catalog_rows(self, model, rows: List[dict]):
+        """Upsert catalog rows, ids included, into every shard but the catalog"""
+        if not rows:
+            return
+        for shard in self.shards[1:]:
+            db = shard.SessionLocal()
+            try:
+                stmt = upsert_insert(db, model)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["id"],
+                    set_={column.name: stmt.excluded[column.name]
+                          for column in model.__table__.columns if column.name != "id"}
+                )
+                for start in range(0, len(rows), CATALOG_COPY_CHUNK):
+                    db.execute(stmt, rows[start:start + CATALOG_COPY_CHUNK])
+                db.commit()
+            finally:
+                db.close()
+
+    def replicate(self, obj):
+        """Copy one catalog object, as just committed on the catalog shard"""
+        self.copy_catalog_rows(type(obj), [
+            {column.name: getattr(obj, column.key) for column in type(obj).__mapper__.columns}
+        ])
+
+    def sync_catalog(self, model=None, ids: Optional[List[int]] = None):
+        """Copy the catalog, or only model's rows (with the given ids), from the catalog shard"""
+        if not self.sharded:
+            return
+        with self.catalog.engine.connect() as conn:
+            for catalog_model in [model] if model is not None else CATALOG_MODELS:
+                query = select(catalog_model.__table__)
+                if ids is None:
+                    rows = conn.execute(query)
+                else:
+                    # IN lists kept under SQLite's bound-parameter limit
+                    rows = [row for start in range(0, len(ids), CATALOG_COPY_CHUNK) for row in conn.execute(
+                        query.where(catalog_model.id.in_(ids[start:start + CATALOG_COPY_CHUNK])))]
+                self.copy_catalog_rows(catalog_model, [dict(row._mapping) for row in rows])
+
+    # Setup
+    def prepare(self):
+        """Create each extra shard's tables, start its id range, copy the catalog"""
+        for shard in self.shards[1:]:
+            _create_shard_tables(shard)
+        self.sync_catalog()
+
+def _create_shard_tables(shard: Shard):
+    base = shard.index * SHARD_ID_SPAN
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    # The ranged tables are AUTOINCREMENT on SQLite (models.py); otherwise an
+    # empty table would start at id 1 rather than at the shard's base
+    metadata.create_all(bind=shard.engine)
+
+    with shard.engine.begin() as conn:
+        for name in RANGED_TABLES:
+            if shard.is_sqlite:
+                sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                   {"name": name}).scalar()
+                if "AUTOINCREMENT" not in sql.upper():
+                    raise RuntimeError(f"Shard {shard.index}: table {name} was created without AUTOINCREMENT; "
+                                       f"let sharding create the shard's tables")
+                updated = conn.execute(text("UPDATE sqlite_sequence SET seq = max(seq, :base) WHERE name = :name"),
+                                       {"base": base, "name": name})
+                if not updated.rowcount:
+                    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :base)"),
+                                 {"base": base, "name": name})
+            else:
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                                  f"greatest(:base, (SELECT coalesce(max(id), 0) FROM {name})))"),
+                             {"base": base})
+
+# Merging
+def merge_pages(pages: list, limit: Optional[int] = None) -> list:
+    """One keyset page from per-shard pages: shard ranges ascend, so concatenate"""
+    rows = [row for page in pages for row in page]
+    return rows[:limit] if limit is not None else rows
+
+def merge_sorted(pages: list, key: Callable, limit: Optional[int] = None) -> list:
+    """The first limit rows of per-shard pages that are each sorted by key"""
+    merged = heapq.merge(*pages, key=key)
+    return [row for _, row in zip(range(limit), merged)] if limit is not None else list(merged)
+
+def merge_counts(results: List[dict]) -> dict:
+    """Sum the counters of a job that ran on every shard"""
+    merged = {}
+    for result in results:
+        for name, value in result.items():
+            merged[name] = merged.get(name, 0) + value if isinstance(value, (int, float)) else value
+    return merged
+
+shard_router = ShardRouter.from_env()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Synthetic marketplace data at load-test volumes
+
+Bulk-loads stores, users, products, batches and their offers, reservations, pickups
+and impact rows the way the running system would have produced them over
+the last --days days:
+- Stores are spread uniformly over a disc of AREA_RADIUS_KM around
+  AREA_CENTER, with the same pickup hours.
+- Batches arrive at stores with a Zipf-skewed size: a few large stores and
+  a long tail.
+- Each batch is marked down within one scheduler interval of arriving: a
+  2-hour nonprofit offer first, then a public offer until expiry, with
+  the markdown engine's tier discount.
+- Reservations fall inside their offer's window. Past ones end as
+  PICKED_UP (with a pickup and impact row) or NO_SHOW. Future ones are
+  still RESERVED.
+The impact rollups are rebuilt at the end.
+
+Rows are generated and inserted in chunks of --chunk-size batches, so
+memory stays flat at any volume. The same seed and sizes give the same data,
+relative to the time of the run. Tables must be empty, or pass --reset.
+
+Usage: python synthetic_data.py --database-url sqlite:////tmp/load.db [--scale medium]
+       [--batches N] [--stores N] [--store-skew 1.1] [--no-show-rate 0.15] [--seed 0] [--reset]
+"""
+import argparse
+import math
+import random
+import time
+from datetime import datetime, time as clock, timedelta
+from itertools import accumulate
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, SQLITE_PRAGMAS, create_db_engine
+import geo
+from models import *
+from services import confirmation_code_for, rebuild_impact_rollups
+from versions import BATCHES, PRODUCTS, bump_versions
+
+SCALES = {
+    "small": {"stores": 20, "products": 500, "users": 2000, "batches": 10000},
+    "medium": {"stores": 100, "products": 2000, "users": 20000, "batches": 200000},
+    "large": {"stores": 300, "products": 5000, "users": 100000, "batches": 2000000},
+}
+
+# (category, share of products, typical weight in grams, typical price)
+CATEGORIES = [
+    ("Produce", 0.30, 400, 2.99),
+    ("Dairy", 0.25, 500, 4.49),
+    ("Bakery", 0.20, 450, 3.49),
+    ("Meat", 0.10, 300, 7.99),
+    ("Deli", 0.10, 250, 5.99),
+    ("Frozen", 0.05, 700, 6.49),
+]
+
+# Where the stores are: central New Jersey
+AREA_CENTER = (40.5, -74.45)
+AREA_RADIUS_KM = 30
+PICKUP_HOURS = (clock(8, 0), clock(20, 0))
+
+CO2E_PER_KG = 1.9  # same factor as services.update_impact_metrics
+NONPROFIT_WINDOW = timedelta(hours=2)
+
+class SyntheticConfig:
+    """Volumes and distributions for one generated dataset"""
+
+    def __init__(self, stores: int = 100, products: int = 2000, users: int = 20000, batches: int = 200000,
+                 days: float = 90, shelf_life_hours: tuple = (12, 240), store_skew: float = 1.1,
+                 offer_rate: float = 0.95, reservations_per_offer: float = 1.2,
+                 nonprofit_share: float = 0.03, no_show_rate: float = 0.15, seed: int = 0):
+        self.stores = stores
+        self.products = products
+        self.users = users
+        self.batches = batches
+        self.days = days
+        self.shelf_life_hours = shelf_life_hours
+        self.store_skew = store_skew  # Zipf exponent of batches per store; 0 is uniform
+        self.offer_rate = offer_rate  # share of batches the markdown engine reached
+        self.reservations_per_offer = reservations_per_offer
+        self.nonprofit_share = nonprofit_share  # share of users that are nonprofits
+        self.no_show_rate = no_show_rate
+        self.seed = seed
+
+def _discount(hours_left: float):
+    # Tier ladder of services._markdown_discount
+    if hours_left < 6:
+        return 60
+    if hours_left < 12:
+        return 40
+    if hours_left < 18:
+        return 30
+    return 20
+
+class _Generator:
+    def __init__(self, config: SyntheticConfig, now: datetime):
+        self.config = config
+        self.now = now
+        self.rng = random.Random(config.seed)
+        self.store_weights = list(accumulate(1 / rank ** config.store_skew for rank in range(1, config.stores + 1)))
+        self.next_id = {"offers": 1, "reservations": 1, "pickups": 1, "impact": 1}
+        self.products = []  # (category, weight_grams, base_price) by product_id - 1
+        # Users: 1 admin, one staff member per store, nonprofits, then customers
+        self.staff_ids = range(2, 2 + config.stores)
+        n_nonprofit = max(1, int(config.users * config.nonprofit_share))
+        self.nonprofit_ids = range(self.staff_ids.stop, self.staff_ids.stop + n_nonprofit)
+        self.customer_ids = range(self.nonprofit_ids.stop, max(config.users + 1, self.nonprofit_ids.stop + 1))
+
+    def users(self):
+        rows = [{"id": 1, "email": "admin@load.test", "name": "Admin", "role": UserRole.ADMIN}]
+        for ids, role, prefix in ((self.staff_ids, UserRole.STORE, "staff"),
+                                  (self.nonprofit_ids, UserRole.NONPROFIT, "nonprofit"),
+                                  (self.customer_ids, UserRole.CUSTOMER, "customer")):
+            rows.extend({"id": i, "email": f"{prefix}{i}@load.test", "name": f"{prefix.title()} {i}", "role": role}
+                        for i in ids)
+        return rows
+
+    def store_rows(self):
+        # Own generator, so adding stores left the rest of a seed's data as it was
+        rng = random.Random(f"stores-{self.config.seed}")
+        center_lat, center_lon = AREA_CENTER
+        rows = []
+        for store_id in range(1, self.config.stores + 1):
+            distance = AREA_RADIUS_KM * math.sqrt(rng.random())
+            bearing = rng.uniform(0, 2 * math.pi)
+            lat = center_lat + distance * math.cos(bearing) / geo.KM_PER_DEGREE
+            lon = center_lon + distance * math.sin(bearing) / (geo.KM_PER_DEGREE * math.cos(math.radians(center_lat)))
+            rows.append({"id": store_id, "name": f"Store {store_id}", "latitude": lat, "longitude": lon,
+                         "geohash": geo.encode(lat, lon), "pickup_opens": PICKUP_HOURS[0],
+                         "pickup_closes": PICKUP_HOURS[1], "created_at": self.now - timedelta(days=self.config.days + 1)})
+        return rows
+
+    def product_rows(self):
+        rng = self.rng
+        names, shares = [c[0] for c in CATEGORIES], [c[1] for c in CATEGORIES]
+        typical = {c[0]: c[2:] for c in CATEGORIES}
+        rows = []
+        for product_id in range(1, self.config.products + 1):
+            category = rng.choices(names, shares)[0]
+            weight, price = typical[category]
+            weight = round(weight * rng.uniform(0.5, 1.5))
+            price = round(price * rng.uniform(0.6, 1.6), 2)
+            self.products.append((category, weight, price))
+            rows.append({"id": product_id, "sku": f"SYN{product_id:06d}", "name": f"{category} item {product_id}",
+                         "category": category, "size": f"{weight}g", "base_price": price,
+                         "weight_grams": weight, "created_at": self.now - timedelta(days=self.config.days + 1)})
+        return rows
+
+    def chunk(self, first_batch_id: int, n: int):
+        """Batches first_batch_id.. and every row that hangs off them"""
+        config, rng, now = self.config, self.rng, self.now
+        low, high = config.shelf_life_hours
+        store_ids = rng.choices(range(1, config.stores + 1), cum_weights=self.store_weights, k=n)
+        rows = {"batches": [], "offers": [], "reservations": [], "pickups": [], "impact": []}
+        for batch_id, store_id in zip(range(first_batch_id, first_batch_id + n), store_ids):
+            product_id = rng.randint(1, config.products)
+            created_at = now - timedelta(days=rng.uniform(0, config.days))
+            expiry_ts = created_at + timedelta(hours=rng.uniform(low, high))
+            qty_total = rng.randint(5, 60)
+            qty_available = qty_total
+            # The scheduler marks new batches down within its 5-minute interval
+            marked_at = created_at + timedelta(seconds=rng.uniform(0, 300))
+            if marked_at < min(now, expiry_ts) and rng.random() < config.offer_rate:
+                discount = _discount((expiry_ts - marked_at).total_seconds() / 3600)
+                nonprofit_end = min(marked_at + NONPROFIT_WINDOW, expiry_ts)
+                windows = [(OfferAudience.NONPROFIT, marked_at, nonprofit_end, self.nonprofit_ids)]
+                if nonprofit_end < expiry_ts:
+                    windows.append((OfferAudience.PUBLIC, nonprofit_end, expiry_ts, self.customer_ids))
+                for audience, start_ts, end_ts, user_ids in windows:
+                    offer_id = self._take("offers")
+                    rows["offers"].append({"id": offer_id, "batch_id": batch_id, "discount_pct": discount,
+                                           "start_ts": start_ts, "end_ts": end_ts, "audience": audience,
+                                           "created_at": marked_at})
+                    qty_available -= self._reservations(rows, batch_id, product_id, offer_id, discount,
+                                                        start_ts, end_ts, user_ids, qty_available)
+            rows["batches"].append({"id": batch_id, "product_id": product_id, "qty_total": qty_total,
+                                    "qty_available": qty_available, "expiry_ts": expiry_ts,
+                                    "store_id": store_id, "created_at": created_at})
+        return rows
+
+    def _reservations(self, rows, batch_id, product_id, offer_id, discount, start_ts, end_ts, user_ids, stock):
+        config, rng, now = self.config, self.rng, self.now
+        rate = config.reservations_per_offer
+        count = int(rate) + (rng.random() < rate - int(rate))
+        window = (min(end_ts, now) - start_ts).total_seconds()
+        held = 0
+        for _ in range(count):
+            qty = rng.randint(1, 3)
+            if window <= 0 or held + qty > stock:
+                break
+            reservation_id = self._take("reservations")
+            created_at = start_ts + timedelta(seconds=rng.uniform(0, window))
+            pickup_start_ts = created_at + timedelta(minutes=rng.uniform(15, 60))
+            pickup_end_ts = pickup_start_ts + timedelta(hours=2)
+            if pickup_end_ts > now:
+                status = ReservationStatus.RESERVED
+            elif rng.random() < config.no_show_rate:
+                status = ReservationStatus.NO_SHOW
+            else:
+                status = ReservationStatus.PICKED_UP
+            rows["reservations"].append({
+                "id": reservation_id, "offer_id": offer_id, "user_id": rng.choice(user_ids),
+                "qty_reserved": qty, "pickup_start_ts": pickup_start_ts, "pickup_end_ts": pickup_end_ts,
+                "status": status, "confirmation_code": confirmation_code_for(reservation_id),
+                "created_at": created_at})
+            if status == ReservationStatus.NO_SHOW:
+                continue
+            held += qty
+            if status == ReservationStatus.PICKED_UP:
+                pickup_ts = pickup_start_ts + timedelta(seconds=rng.uniform(0, 7200))
+                rows["pickups"].append({"id": self._take("pickups"), "reservation_id": reservation_id,
+                                        "pickup_ts": pickup_ts, "staff_id": rng.choice(self.staff_ids)})
+                _, weight, price = self.products[product_id - 1]
+                rows["impact"].append({
+                    "id": self._take("impact"), "batch_id": batch_id, "qty_picked_up": qty,
+                    "co2e_saved_kg": weight * qty / 1000 * CO2E_PER_KG,
+                    "revenue_recovered": qty * price * (1 - discount / 100), "created_at": pickup_ts})
+        return held
+
+    def _take(self, table):
+        value = self.next_id[table]
+        self.next_id[table] += 1
+        return value
+
+TABLES = [("batches", Batch), ("offers", Offer), ("reservations", Reservation), ("pickups", Pickup), ("impact", Impact)]
+
+def generate(engine, config: SyntheticConfig, chunk_size: int = 20000, log=print):
+    """Load a dataset into engine's (empty) tables; returns row counts per table"""
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(Batch)).scalar()
+    if existing:
+        raise ValueError("Database already has batches; use an empty database or reset it first")
+
+    gen = _Generator(config, datetime.utcnow())
+    counts = {table: 0 for table, _ in TABLES}
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        users = gen.users()
+        conn.execute(insert(Store), gen.store_rows())
+        conn.execute(insert(User), users)
+        conn.execute(insert(Product), gen.product_rows())
+    counts.update(stores=config.stores, users=len(users), products=config.products)
+
+    for first in range(1, config.batches + 1, chunk_size):
+        rows = gen.chunk(first, min(chunk_size, config.batches + 1 - first))
+        with engine.begin() as conn:
+            for table, model in TABLES:
+                if rows[table]:
+                    conn.execute(insert(model), rows[table])
+                counts[table] += len(rows[table])
+        done = min(first + chunk_size - 1, config.batches)
+        log(f"  {done}/{config.batches} batches, {sum(counts.values())} rows, {time.perf_counter() - start:.0f}s")
+
+    if engine.dialect.name == "postgresql":
+        # Ids were assigned here, so move each sequence past them
+        with engine.begin() as conn:
+            for table in ["stores", "users", "products"] + [table for table, _ in TABLES]:
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                  f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"))
+
+    db = sessionmaker(bind=engine)()
+    try:
+        # Rebuilding the rollups bumps the impact version; the bulk load bumps the rest
+        bump_versions(db, PRODUCTS, BATCHES)
+        counts["impact_daily"] = rebuild_impact_rollups(db)["daily_rows"]
+    finally:
+        db.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--scale", choices=SCALES, default="medium", help="preset sizes; flags below override")
+    for name in ("stores", "products", "users", "batches"):
+        parser.add_argument(f"--{name}", type=int)
+    parser.add_argument("--days", type=float, default=90, help="history length")
+    parser.add_argument("--min-shelf-life-hours", type=float, default=12)
+    parser.add_argument("--max-shelf-life-hours", type=float, default=240)
+    parser.add_argument("--store-skew", type=float, default=1.1, help="Zipf exponent of store sizes; 0 is uniform")
+    parser.add_argument("--offer-rate", type=float, default=0.95)
+    parser.add_argument("--reservations-per-offer", type=float, default=1.2)
+    parser.add_argument("--nonprofit-share", type=float, default=0.03)
+    parser.add_argument("--no-show-rate", type=float, default=0.15)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    sizes.update({name: getattr(args, name) for name in sizes if getattr(args, name) is not None})
+    config = SyntheticConfig(
+        **sizes, days=args.days, shelf_life_hours=(args.min_shelf_life_hours, args.max_shelf_life_hours),
+        store_skew=args.store_skew, offer_rate=args.offer_rate, reservations_per_offer=args.reservations_per_offer,
+        nonprofit_share=args.nonprofit_share, no_show_rate=args.no_show_rate, seed=args.seed)
+
+    # A bulk load is rerun rather than recovered, so skip the fsyncs
+    engine = create_db_engine(args.database_url, sqlite_pragmas={**SQLITE_PRAGMAS, "synchronous": "OFF"})
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    start = time.perf_counter()
+    counts = generate(engine, config, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    print(f"Loaded {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/sec)")
+    for table, count in counts.items():
+        print(f"  {table:14} {count}")
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Shared test setup
+
+The application modules build their engines from DATABASE_URL when first
+imported, so the environment is pointed at a throwaway SQLite database here,
+before any test module imports them. Tests marked slow (load-test volumes)
+only run with --run-slow.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(_tmp.name, 'test.db')}", SCHEDULER_ENABLED="false",
+                  OFFER_CACHE_TTL_SECONDS="0")
+for name in ("DATABASE_REPLICA_URL", "ASYNC_DB_ENABLED", "ASYNC_DATABASE_URL", "ASYNC_DATABASE_REPLICA_URL",
+             "SHARD_DATABASE_URLS", "FAST_JSON_RESPONSES", "GROUP_COMMIT", "CREATE_SCHEMA_ON_STARTUP"):
+    os.environ.pop(name, None)
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true", help="also run tests marked slow")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: load-test volumes; run with --run-slow")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip = pytest.mark.skip(reason="load-test volume; run with --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+@pytest.fixture(scope="module")
+def app_db():
+    """The app's database with a fresh schema, for one test module"""
+    from database import Base, engine
+    from init_db import create_schema
+    Base.metadata.drop_all(bind=engine)
+    create_schema()
+    yield engine
+    engine.dispose()
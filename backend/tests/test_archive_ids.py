@@ -0,0 +1,25 @@
+"""
+Archived ids are never handed out again
+
+The archive job (archive.py) deletes the oldest rows of the hot tables and
+keeps their ids in the archive tables, so a new row must not reuse the id of
+a deleted one.
+"""
+from sqlalchemy import delete
+
+from database import SessionLocal
+from models import Batch
+
+
+def test_deleted_ids_are_not_reused(app_db):
+    with SessionLocal() as db:
+        batch = Batch(product_id=1, qty_total=1, qty_available=1, store_id=1)
+        db.add(batch)
+        db.commit()
+        archived_id = batch.id
+        db.execute(delete(Batch).where(Batch.id == archived_id))
+        db.commit()
+        fresh = Batch(product_id=1, qty_total=1, qty_available=1, store_id=1)
+        db.add(fresh)
+        db.commit()
+        assert fresh.id > archived_id
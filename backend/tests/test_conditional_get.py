@@ -0,0 +1,130 @@
+"""
+Conditional GETs must not run the listing query, and must see every change
+
+Seeds the sample data and counts the SQL statements behind every request to
+the endpoints with ETags. For each endpoint:
+- a request with a current If-None-Match (or If-Modified-Since) gets 304;
+- that 304 costs exactly one statement, the collection_versions lookup,
+  and reads none of the endpoint's tables;
+- after a write to the collection, the old ETag gets a 200 with a new ETag.
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+
+from database import SessionLocal, async_db_enabled, async_engines, engine, read_engine
+from models import CollectionVersion
+from seed_data import seed_database
+import versions
+
+# (path, tables its full response reads, write that must change its ETag)
+ENDPOINTS = [
+    ("/products", {"products"}, "product"),
+    ("/products?format=ndjson", {"products"}, "product"),
+    ("/batches?category=Dairy&limit=10", {"batches", "products"}, "reservation"),
+    ("/impact", {"impact_totals"}, "pickup"),
+    ("/impact/series?bucket=week", {"impact_daily"}, "pickup"),
+]
+
+class StatementLog:
+    def __init__(self, engines):
+        self.statements = []
+        self.targets = {getattr(e, "sync_engine", e) for e in engines}
+        for target in self.targets:
+            event.listen(target, "after_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split()))
+
+    def during(self, fn):
+        start = len(self.statements)
+        result = fn()
+        return result, self.statements[start:]
+
+    def close(self):
+        for target in self.targets:
+            event.remove(target, "after_cursor_execute", self._record)
+
+def reads_table(statement, table):
+    lowered = statement.lower()
+    return f"from {table}" in lowered or f"join {table}" in lowered
+
+class Writes:
+    """One write per collection, each through the API"""
+
+    def __init__(self, client):
+        self.client = client
+        self.count = 0
+
+    def product(self):
+        self.count += 1
+        return self.client.post("/products", json={
+            "sku": f"ETAG{self.count}", "name": "ETag check", "category": "Dairy", "size": "1",
+            "base_price": 1.0, "weight_grams": 100})
+
+    def reservation(self):
+        offer = self.client.get("/offers").json()[0]
+        now = datetime.utcnow()
+        return self.client.post("/reserve", json={
+            "offer_id": offer["id"], "user_id": 3, "qty_reserved": 1, "pickup_start_ts": now.isoformat(),
+            "pickup_end_ts": (now + timedelta(hours=2)).isoformat()})
+
+    def pickup(self):
+        reservation = self.reservation().json()
+        return self.client.post("/pickup/confirm", json={"reservation_id": reservation["id"], "staff_id": 5})
+
+@pytest.fixture(scope="module")
+def api(app_db):
+    """A test client on the sample data, its writes and the statement log"""
+    seed_database()
+    log = StatementLog([engine, read_engine, *(async_engines() if async_db_enabled() else ())])
+    import main
+    with TestClient(main.app) as client:
+        writes = Writes(client)
+        client.post("/markdown/calculate")
+        # Give every collection a version
+        writes.product()
+        writes.pickup()
+        yield client, writes, log
+    log.close()
+
+@pytest.mark.parametrize("path, tables, write", ENDPOINTS)
+def test_conditional_get(api, path, tables, write):
+    client, writes, log = api
+    # Last-Modified is only sent once the latest change is a second old
+    time.sleep(1.1)
+    full = client.get(path)
+    etag = full.headers.get("etag")
+    assert full.status_code == 200 and etag is not None, dict(full.headers)
+    assert "last-modified" in full.headers
+
+    for header, value in {"If-None-Match": etag, "If-Modified-Since": full.headers["last-modified"]}.items():
+        cached, statements = log.during(lambda: client.get(path, headers={header: value}))
+        assert cached.status_code == 304, header
+        assert not cached.content, header
+        # The collection_versions lookup only
+        table_reads = [s for s in statements if any(reads_table(s, table) for table in tables)]
+        assert len(statements) == 1 and not table_reads, (header, statements)
+
+    assert getattr(writes, write)().status_code == 200
+    changed = client.get(path, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers.get("etag") != etag
+
+def test_versions_add_up_over_slots(app_db):
+    """Writes through different slots each advance the collection's version"""
+    with SessionLocal() as db:
+        before = versions.get_versions(db, ["batches"]).get("batches", (0, None))[0]
+    for slot in (0, 3, 3, versions.VERSION_SLOTS - 1):
+        with SessionLocal() as db:
+            db.info["collection_version_slot"] = slot
+            versions.bump_versions(db, "batches", "products")
+            db.commit()
+    with SessionLocal() as db:
+        batches = versions.get_versions(db, ["batches"])
+        latest = db.scalar(select(func.max(CollectionVersion.updated_at)))
+    assert list(batches) == ["batches"]
+    assert batches["batches"] == (before + 4, latest)
@@ -0,0 +1,78 @@
+"""
+The fast JSON path must not drift from the response schemas
+
+FAST_JSON_RESPONSES encodes projected rows with orjson instead of
+validating each row through its Pydantic response model, so nothing checks
+the output per request. These tests do. They load a small synthetic dataset
+and request every list endpoint, both as JSON and as ndjson, once with the
+fast path off and once with it on. They then compare the bodies and the
+X-Next-Cursor header. The comparison keeps key order and JSON types, so 400
+and 400.0 differ. A list route that no case covers fails too.
+"""
+import json
+import typing
+
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from models import Reservation
+from settings import get_settings
+import synthetic_data
+
+CASES = [
+    "/products", "/products?limit=7", "/products?category=Dairy&after_id=3&limit=50", "/products?format=ndjson",
+    "/batches", "/batches?store_id=2&limit=25", "/batches?category=Bakery&limit=10", "/batches?format=ndjson",
+    "/offers", "/offers?user_type=nonprofit", "/offers?store_id=1&limit=20", "/offers?category=Meat&limit=5",
+    "/offers?format=ndjson",
+    "/offers/feed", "/offers/feed?user_type=nonprofit", "/offers/feed?store_id=1&limit=20",
+    "/offers/search?lat=40.5&lon=-74.45&radius_km=30", "/offers/search?lat=40.5&lon=-74.45&radius_km=30&limit=7",
+    "/offers/search?lat=40.6&lon=-74.4&radius_km=10&user_type=nonprofit",
+    "/offers/search?lat=40.5&lon=-74.45&radius_km=30&category=Dairy&min_discount=20&expiring_within_hours=240",
+    "/reservations?user_id={reserving_user}", "/reservations?user_id=0",
+]
+
+# List routes that always go through their response model, with the reason
+SCHEMA_ONLY = {
+    "/impact/series": "a few aggregated points per request, not table rows",
+    "/stores": "one row per store, a few hundred at most",
+}
+
+def canonical(response):
+    """Parsed body re-encoded without normalizing key order or number types"""
+    if response.headers["content-type"].startswith("application/x-ndjson"):
+        return [json.dumps(json.loads(line)) for line in response.text.splitlines()]
+    return json.dumps(response.json())
+
+@pytest.fixture(scope="module")
+def api(app_db):
+    """A test client on a small synthetic dataset, and its busiest reserving user"""
+    config = synthetic_data.SyntheticConfig(stores=5, products=200, users=500, batches=2000)
+    synthetic_data.generate(app_db, config, log=lambda line: None)
+    with app_db.connect() as conn:
+        reserving_user = conn.execute(select(Reservation.user_id).group_by(Reservation.user_id)
+                                      .order_by(func.count().desc()).limit(1)).scalar() or 1
+    import main
+    with TestClient(main.app) as client:
+        yield client, reserving_user
+
+def test_every_list_route_is_covered():
+    import main
+    list_routes = {route.path for route in main.app.routes
+                   if isinstance(route, APIRoute) and typing.get_origin(route.response_model) is list}
+    covered = {case.split("?")[0] for case in CASES}
+    assert list_routes - covered - set(SCHEMA_ONLY) == set()
+
+@pytest.mark.parametrize("case", CASES)
+def test_fast_path_matches_schema(api, case, monkeypatch):
+    client, reserving_user = api
+    path = case.format(reserving_user=reserving_user)
+    monkeypatch.setattr(get_settings(), "fast_json_responses", False)
+    expected = client.get(path)
+    monkeypatch.setattr(get_settings(), "fast_json_responses", True)
+    actual = client.get(path)
+
+    assert (expected.status_code, actual.status_code) == (200, 200)
+    assert actual.headers.get("x-next-cursor") == expected.headers.get("x-next-cursor")
+    assert canonical(actual) == canonical(expected)
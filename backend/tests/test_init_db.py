@@ -0,0 +1,41 @@
+"""
+init_db.init() on a database the app created before the migrations existed
+
+Such a database has the tables of 0001_initial_schema and no alembic_version.
+init() must migrate it from there: the later revisions add the indexes, the
+archive tables and the impact rollups, filled from the impact rows already
+there so GET /impact keeps its history.
+"""
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, insert, text
+
+from database import Base, SessionLocal, engine
+from models import *
+import init_db
+import services
+
+def test_init_migrates_a_pre_migration_database():
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    command.upgrade(Config(init_db.ALEMBIC_INI), "0001_initial_schema")
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE alembic_version"))
+        conn.execute(insert(Product), [{"id": 1, "sku": "OLD1", "category": "Dairy", "base_price": 2.0,
+                                        "weight_grams": 500}])
+        conn.execute(insert(Batch), [{"id": 1, "product_id": 1, "store_id": 4}])
+        conn.execute(text("INSERT INTO impact (batch_id, qty_picked_up, co2e_saved_kg, revenue_recovered, created_at) "
+                          "VALUES (1, 2, 1.5, 3.0, '2026-05-01 10:00:00'), (1, 1, 0.5, 1.0, '2026-05-02 10:00:00')"))
+
+    init_db.init(seed=False)
+
+    assert "ix_offers_audience_end_ts" in {index["name"] for index in inspect(engine).get_indexes("offers")}
+    with SessionLocal() as db:
+        migrated = services.get_impact_metrics(db)
+        series = services.get_impact_series(db)
+        services.rebuild_impact_rollups(db)
+        assert services.get_impact_metrics(db) == migrated
+        assert services.get_impact_series(db) == series
+    assert migrated.total_items_rescued == 3
+    assert [point.items_rescued for point in series] == [2, 1]
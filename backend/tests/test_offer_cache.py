@@ -0,0 +1,33 @@
+"""
+The offer cache never keeps rows read before a write that invalidated it
+
+Writes invalidate the cache after they commit, so a miss whose fetch ran
+while one committed may hold the old rows; it must not be cached.
+"""
+from cache import OfferCache
+import services
+
+def test_set_drops_values_fetched_before_an_invalidate():
+    cache = OfferCache(ttl=30)
+    generation = cache.generation
+    cache.invalidate()
+    cache.set("stale", 1, generation=generation)
+    cache.set("fresh", 2, generation=cache.generation)
+    assert cache.get("stale") is None
+    assert cache.get("fresh") == 2
+
+def test_write_during_a_miss_is_not_hidden(monkeypatch):
+    cache = OfferCache(ttl=30)
+    monkeypatch.setattr(services, "offer_cache", cache)
+    fetches = []
+
+    def fetch(user_type, **filters):
+        fetches.append(user_type)
+        if len(fetches) == 1:
+            # POST /offers commits and invalidates while this read is in flight
+            cache.invalidate()
+        return []
+
+    for _ in range(3):
+        services.cached_offers(fetch, "public")
+    assert fetches == ["public", "public"]
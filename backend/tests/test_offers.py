@@ -0,0 +1,25 @@
+"""
+POST /offers checks its batch
+
+SQLite does not enforce the offers -> batches foreign key, so an offer for a
+batch that does not exist must be refused before anything is written.
+"""
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from models import Offer
+
+OFFER = {"discount_pct": 20, "start_ts": "2026-01-01T00:00:00", "end_ts": "2030-01-01T00:00:00",
+         "audience": "public"}
+
+def test_offer_for_unknown_batch_is_404(app_db):
+    import main
+    with TestClient(main.app) as client:
+        missing = client.post("/offers", json={"batch_id": 99999, **OFFER})
+        batch = client.post("/batches", json={"product_id": 1, "qty_total": 5, "qty_available": 5,
+                                               "expiry_ts": "2030-01-01T00:00:00", "store_id": 3}).json()
+        created = client.post("/offers", json={"batch_id": batch["id"], **OFFER})
+    assert missing.status_code == 404
+    assert created.status_code == 200
+    with SessionLocal() as db:
+        assert db.query(Offer).filter(Offer.batch_id == 99999).count() == 0
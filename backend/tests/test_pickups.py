@@ -0,0 +1,101 @@
+"""
+Pickups and no-shows never both claim a reservation
+
+A reservation leaves RESERVED exactly once: picked up (its units stay sold
+and count towards impact) or a no-show (its units go back on the batch).
+Each test lets one side run in another session right after the first
+statement of the other, the window a concurrent request would hit, and
+checks the reservation, the stock and the impact rows still agree.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func, select
+
+from database import SessionLocal
+from models import *
+from schemas import PickupBatchCreate, PickupCreate
+import services
+
+QTY_TOTAL = 20
+QTY_RESERVED = 3
+
+@pytest.fixture
+def reservation_id(app_db):
+    """A reservation of QTY_RESERVED units whose pickup window has closed"""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        product = Product(sku=f"RACE{now.timestamp()}", name="Milk", category="Dairy", size="1L",
+                          base_price=2.0, weight_grams=1000)
+        db.add(product)
+        db.flush()
+        batch = Batch(product_id=product.id, qty_total=QTY_TOTAL, qty_available=QTY_TOTAL - QTY_RESERVED,
+                      expiry_ts=now + timedelta(days=1), store_id=1)
+        db.add(batch)
+        db.flush()
+        offer = Offer(batch_id=batch.id, discount_pct=30, start_ts=now - timedelta(hours=2),
+                      end_ts=now + timedelta(hours=2), audience=OfferAudience.PUBLIC)
+        db.add(offer)
+        db.flush()
+        reservation = Reservation(offer_id=offer.id, user_id=1, qty_reserved=QTY_RESERVED,
+                                  pickup_start_ts=now - timedelta(hours=2), pickup_end_ts=now - timedelta(minutes=1),
+                                  status=ReservationStatus.RESERVED)
+        db.add(reservation)
+        db.flush()
+        reservation.confirmation_code = services.confirmation_code_for(reservation.id)
+        db.commit()
+        return reservation.id
+
+def after_first_statement(db, interloper):
+    """Run interloper once, right after db's first ORM statement has run"""
+    @event.listens_for(db, "do_orm_execute")
+    def race(orm_execute_state):
+        event.remove(db, "do_orm_execute", race)
+        result = orm_execute_state.invoke_statement().freeze()
+        interloper()
+        return result()
+
+def outcome(reservation_id):
+    with SessionLocal() as db:
+        reservation = db.get(Reservation, reservation_id)
+        batch = reservation.offer.batch
+        pickups = db.scalar(select(func.count()).select_from(Pickup).where(Pickup.reservation_id == reservation_id))
+        impact = db.scalar(select(func.count()).select_from(Impact).where(Impact.batch_id == batch.id))
+        return reservation.status, batch.qty_available, pickups, impact
+
+def assert_picked_up(reservation_id):
+    assert outcome(reservation_id) == (ReservationStatus.PICKED_UP, QTY_TOTAL - QTY_RESERVED, 1, 1)
+
+def test_pickup_during_no_show_sweep_stays_picked_up(reservation_id):
+    def confirm():
+        with SessionLocal() as other:
+            services.confirm_pickup_service(other, PickupCreate(reservation_id=reservation_id, staff_id=1))
+
+    with SessionLocal() as db:
+        after_first_statement(db, confirm)
+        result = services.handle_no_shows(db)
+    assert result["no_show_count"] == 0
+    assert_picked_up(reservation_id)
+
+def test_no_show_sweep_during_batch_confirm_is_skipped(reservation_id):
+    def sweep():
+        with SessionLocal() as other:
+            services.handle_no_shows(other)
+
+    with SessionLocal() as db:
+        after_first_statement(db, sweep)
+        result = services.confirm_pickups_batch_service(
+            db, PickupBatchCreate(staff_id=1, reservation_ids=[reservation_id]))
+    assert (result.confirmed, result.skipped) == ([], [reservation_id])
+    assert outcome(reservation_id) == (ReservationStatus.NO_SHOW, QTY_TOTAL, 0, 0)
+
+def test_batch_confirm_claims_once(reservation_id):
+    request = PickupBatchCreate(staff_id=1, reservation_ids=[reservation_id, 999999],
+                                confirmation_codes=[services.confirmation_code_for(reservation_id)])
+    with SessionLocal() as db:
+        first = services.confirm_pickups_batch_service(db, request)
+        again = services.confirm_pickups_batch_service(db, request)
+    assert [p.reservation_id for p in first.confirmed] == [reservation_id]
+    assert first.not_found == ["999999"]
+    assert (again.confirmed, again.skipped) == ([], [reservation_id])
+    assert_picked_up(reservation_id)
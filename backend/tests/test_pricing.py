@@ -0,0 +1,136 @@
+"""
+The pricing engine's default curve must not drift from the markdown ladder
+
+pricing.tier_ladder is the NumPy form of services._markdown_discount, the
+SQL tier ladder that apply_markdown_engine prices new offers with. These
+tests seed a throwaway SQLite database with batches expiring across the
+tier boundaries, to the second on either side of each, and check:
+- the ladder in SQL and in NumPy agree on every batch for the same now;
+- repricing right after the markdown engine changes no offer;
+- repricing 7 hours later changes exactly the offers whose batch crossed a
+  tier, to the SQL ladder's discount at that time;
+- repricing never lowers a discount set by hand or by a relist;
+- the sell-through curve never goes below its base, and stays within its
+  cap and on its step.
+"""
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import *
+import pricing
+import services
+
+BOUNDARIES_HOURS = (6, 12, 18)
+
+def seed(engine, n_batches, now):
+    hours = [random.uniform(0.01, 48) for _ in range(n_batches)]
+    # Either side of every boundary, now and after the 7-hour shift
+    for boundary in BOUNDARIES_HOURS:
+        for shift in (0, 7):
+            hours += [boundary + shift - 1 / 3600, boundary + shift + 1 / 3600]
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"id": i, "sku": f"PRICE{i}", "name": f"Product {i}", "category": category, "size": "1",
+             "base_price": 3.0, "weight_grams": 500}
+            for i, category in enumerate(["Dairy", "Bakery", "Produce"], start=1)
+        ])
+        conn.execute(insert(Batch), [
+            {"product_id": random.randint(1, 3), "qty_total": 10, "qty_available": random.randint(0, 10),
+             "expiry_ts": now + timedelta(hours=h), "store_id": 1, "created_at": now - timedelta(hours=24)}
+            for h in hours
+        ])
+
+def sql_ladder(db, now):
+    """Batch id -> services._markdown_discount at now"""
+    return dict(db.execute(select(Batch.id, services._markdown_discount(now))).all())
+
+@pytest.fixture(scope="module")
+def priced(tmp_path_factory):
+    """A session on batches the markdown engine just priced, and the now to compare at"""
+    random.seed(0)
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('pricing') / 'pricing.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    # Offers are priced by the markdown engine at its own utcnow(); boundaries
+    # are a second away, so a later fixed now in the same second is safe
+    start = datetime.utcnow()
+    seed(engine, 1000, start)
+    services.apply_markdown_engine(db)
+    now = datetime.utcnow()
+    assert (now - start).total_seconds() < 1, "markdown run took over a second; boundary checks would be unreliable"
+    yield db, now
+    db.close()
+    engine.dispose()
+
+def offer_batches(db):
+    return dict(db.execute(select(Offer.id, Offer.batch_id)).all())
+
+def test_numpy_ladder_matches_sql(priced):
+    db, now = priced
+    snapshot = pricing.load_snapshot(db, now)
+    batch_of = offer_batches(db)
+    expected = sql_ladder(db, now)
+    ladder = pricing.tier_ladder(snapshot.hours_left, None, None, 1.0)
+    mismatches = [(offer_id, expected[batch_of[offer_id]], got)
+                  for offer_id, got in zip(snapshot.offer_ids.tolist(), ladder.tolist())
+                  if expected[batch_of[offer_id]] != got]
+    assert len(snapshot) and not mismatches
+
+def test_reprice_right_after_markdown_changes_nothing(priced):
+    db, now = priced
+    assert pricing.reprice_offers(db, now=now)["repriced_offers"] == 0
+
+def test_reprice_later_follows_the_ladder(priced):
+    db, now = priced
+    later = now + timedelta(hours=7)
+    batch_of = offer_batches(db)
+    before = dict(db.execute(select(Offer.id, Offer.discount_pct)).all())
+    live = {offer_id for offer_id, in db.execute(
+        select(Offer.id).join(Batch).where(Offer.end_ts > later, Batch.expiry_ts > later))}
+    expected = sql_ladder(db, later)
+    should_change = {offer_id for offer_id in live if expected[batch_of[offer_id]] != before[offer_id]}
+
+    result = pricing.reprice_offers(db, now=later)
+    after = dict(db.execute(select(Offer.id, Offer.discount_pct)).all())
+    changed = {offer_id for offer_id in before if after[offer_id] != before[offer_id]}
+    assert should_change and changed == should_change
+    assert result["repriced_offers"] == len(should_change)
+    assert [offer_id for offer_id in live if after[offer_id] != expected[batch_of[offer_id]]] == []
+
+def test_reprice_keeps_deeper_discounts(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'deeper.db'}")
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    seed(engine, 0, now)
+    db = sessionmaker(bind=engine)()
+    try:
+        # Both batches are 20 hours from expiry, where the ladder says 20%
+        expiry = now + timedelta(hours=20)
+        db.execute(update(Batch).values(expiry_ts=expiry))
+        db.add_all([Offer(batch_id=batch_id, discount_pct=discount, start_ts=now, end_ts=expiry,
+                          audience=OfferAudience.PUBLIC)
+                    for batch_id, discount in ((1, 50), (2, 10))])
+        db.commit()
+        assert pricing.reprice_offers(db, now=now)["repriced_offers"] == 1
+        assert sorted(db.execute(select(Offer.discount_pct)).scalars()) == [20, 50]
+    finally:
+        db.close()
+        engine.dispose()
+
+@pytest.mark.parametrize("pickup_rate", [0.2, 0.5, 0.9, 1.0])
+def test_sell_through_curve_bounds(pickup_rate):
+    hours_left = np.linspace(0, 48, 1000)
+    elapsed = np.random.default_rng(0).uniform(0, 1, 1000)
+    unsold = np.random.default_rng(1).uniform(0, 1, 1000)
+    curve = pricing.sell_through_curve(max_boost=20, max_discount=70, step=5)
+    base = pricing.tier_ladder(hours_left, elapsed, unsold, pickup_rate)
+    discounts = curve(hours_left, elapsed, unsold, pickup_rate)
+    assert not (discounts < np.minimum(base, 70)).any(), "below base"
+    assert not (discounts > 70).any(), "over cap"
+    assert not (discounts % 5).any(), "off step"
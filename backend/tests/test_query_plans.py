@@ -0,0 +1,150 @@
+"""
+No hot service query may fall back to a full table scan
+
+Seeds a throwaway SQLite database, mostly history, runs the service
+functions behind the hot endpoints, captures every SQL statement they issue
+and checks its EXPLAIN QUERY PLAN. A plan step that scans one of the large
+tables without an index fails that scenario, with the statement and plan.
+The 1M-row dataset is marked slow.
+"""
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+import geo
+from models import *
+from schemas import PickupCreate
+import archive
+import services
+
+HOT_TABLES = {"batches", "offers", "reservations", "impact", "pickups", "stores",
+              "batches_archive", "reservations_archive"}
+# Any SCAN step on a large table is a regression, including full index scans
+SCAN = re.compile(r"^SCAN (\w+)")
+
+def seed(engine, n_rows):
+    # Split the row budget roughly the way production data is shaped
+    n_batches, n_offers, n_reservations, n_impact = (int(n_rows * share) for share in (0.2, 0.4, 0.3, 0.1))
+    now = datetime.utcnow()
+    chunk = 50000
+    with engine.begin() as conn:
+        conn.execute(insert(Product), [
+            {"sku": f"PLAN{i:05d}", "name": f"Product {i}", "category": random.choice(["Dairy", "Bakery", "Produce"]),
+             "size": "1 unit", "base_price": 3.0, "weight_grams": 500}
+            for i in range(1, 1001)
+        ])
+        conn.execute(insert(Store), [
+            {"id": i, "name": f"Store {i}", "latitude": lat, "longitude": lon, "geohash": geo.encode(lat, lon)}
+            for i, lat, lon in ((i, random.uniform(40.2, 40.8), random.uniform(-74.8, -74.1)) for i in range(1, 301))
+        ])
+        for start in range(0, n_batches, chunk):
+            # ~2% of batches are still live, the rest is history
+            conn.execute(insert(Batch), [
+                {"product_id": random.randint(1, 1000), "qty_total": 10, "qty_available": 5,
+                 "expiry_ts": now + timedelta(hours=random.uniform(-24 * 90, 0 if random.random() > 0.02 else 48)),
+                 "store_id": random.randint(1, 300), "created_at": now - timedelta(days=random.uniform(0, 90))}
+                for _ in range(min(chunk, n_batches - start))
+            ])
+        for start in range(0, n_offers, chunk):
+            conn.execute(insert(Offer), [
+                {"batch_id": random.randint(1, n_batches), "discount_pct": 30,
+                 "start_ts": now - timedelta(days=random.uniform(0, 90)),
+                 "end_ts": now + timedelta(hours=random.uniform(-24 * 90, 0 if random.random() > 0.02 else 48)),
+                 "audience": random.choice([OfferAudience.NONPROFIT, OfferAudience.PUBLIC])}
+                for _ in range(min(chunk, n_offers - start))
+            ])
+        for start in range(0, n_reservations, chunk):
+            conn.execute(insert(Reservation), [
+                {"offer_id": random.randint(1, n_offers), "user_id": random.randint(1, 50000), "qty_reserved": 1,
+                 "pickup_start_ts": now - timedelta(days=1), "pickup_end_ts": now - timedelta(days=random.uniform(0, 90)),
+                 "status": random.choice([ReservationStatus.PICKED_UP, ReservationStatus.NO_SHOW]),
+                 "confirmation_code": f"S{start + i}"}
+                for i in range(min(chunk, n_reservations - start))
+            ])
+        for start in range(0, n_impact, chunk):
+            conn.execute(insert(Impact), [
+                {"batch_id": random.randint(1, n_batches), "qty_picked_up": 1, "co2e_saved_kg": 0.5,
+                 "revenue_recovered": 1.5}
+                for _ in range(min(chunk, n_impact - start))
+            ])
+    with engine.begin() as conn:
+        # One open reservation to confirm and a couple of fresh no-shows
+        conn.execute(insert(Reservation), [
+            {"offer_id": 1, "user_id": 42, "qty_reserved": 1, "pickup_start_ts": now,
+             "pickup_end_ts": now + timedelta(hours=end), "status": ReservationStatus.RESERVED,
+             "confirmation_code": f"OPEN{end}"}
+            for end in (2, -1, -2)
+        ])
+
+def scenarios(now):
+    """Service calls behind the hot endpoints; each gets a fresh session"""
+    def confirm(db):
+        reservation = db.query(Reservation).filter(Reservation.confirmation_code == "OPEN2").one()
+        services.confirm_pickup_service(db, PickupCreate(reservation_id=reservation.id, staff_id=1))
+    return [
+        ("GET /offers public", lambda db: services.get_offers_for_user(db, "public")),
+        ("GET /offers nonprofit page", lambda db: services.get_offers_for_user(db, "nonprofit", limit=100)),
+        ("GET /offers store", lambda db: services.get_offers_for_user(db, "public", store_id=7)),
+        ("GET /offers/feed store", lambda db: services.get_offer_feed(db, "public", store_id=7, limit=100)),
+        ("GET /offers/search", lambda db: services.search_offers(db, 40.5, -74.45, 5, limit=50)),
+        ("GET /offers/search filtered", lambda db: services.search_offers(
+            db, 40.5, -74.45, 10, category="Dairy", min_discount=20, expiring_within_hours=24)),
+        ("GET /batches store", lambda db: services.get_all_batches(db, store_id=7)),
+        ("GET /batches expiry window", lambda db: services.get_all_batches(
+            db, expires_after=now, expires_before=now + timedelta(hours=6))),
+        ("GET /reservations", lambda db: services.get_user_reservations(db, 42)),
+        ("POST /pickup/confirm", confirm),
+        ("POST /pickup/relist", lambda db: services.handle_no_shows(db)),
+        ("POST /markdown/calculate", lambda db: services.apply_markdown_engine(db)),
+        ("scheduled markdown", lambda db: services.apply_markdown_engine(db, since=now - timedelta(minutes=5))),
+        ("GET /impact", lambda db: services.get_impact_metrics(db)),
+        ("GET /batches store include_archived", lambda db: archive.get_batch_history_rows(db, store_id=7)),
+        ("GET /reservations include_archived", lambda db: archive.get_user_reservation_history_rows(db, 42)),
+        # Last: it moves most of the seeded history out of the hot tables
+        ("POST /archive/run", lambda db: archive.archive_expired(db, max_batches=1000)),
+    ]
+
+SCENARIOS = [name for name, _ in scenarios(datetime.utcnow())]
+
+@pytest.fixture(scope="module", params=[20000, pytest.param(1000000, marks=pytest.mark.slow)],
+                ids=lambda rows: f"{rows}-rows")
+def plans_db(request, tmp_path_factory):
+    """A seeded engine and the statements it ran since the last clear()"""
+    random.seed(0)
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('plans') / 'plans.db'}")
+    Base.metadata.create_all(bind=engine)
+    seed(engine, request.param)
+
+    captured = []
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "INSERT", "DELETE")):
+            captured.append((statement, parameters))
+
+    yield engine, captured
+    engine.dispose()
+
+# In list order: the last scenario archives most of the seeded history
+@pytest.mark.parametrize("name", SCENARIOS)
+def test_service_queries_use_an_index(plans_db, name):
+    engine, captured = plans_db
+    call = dict(scenarios(datetime.utcnow()))[name]
+    captured.clear()
+    db = sessionmaker(bind=engine)()
+    try:
+        call(db)
+    finally:
+        db.close()
+
+    full_scans = []
+    with engine.connect() as conn:
+        for statement, parameters in list(captured):
+            plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+            if any((m := SCAN.match(step)) and m.group(1) in HOT_TABLES for step in plan):
+                full_scans.append("  " + " ".join(statement.split()) + "".join(f"\n    {step}" for step in plan))
+    assert not full_scans, f"{name} scans a large table without an index:\n" + "\n".join(full_scans)
@@ -0,0 +1,107 @@
+"""
+Collection versions for HTTP conditional GET
+
+Every write to products, batches or the impact data calls bump_versions()
+in its own transaction, which advances that collection's counter in
+collection_versions. GET endpoints read the counters behind a response with
+one small query and derive ETag and Last-Modified from them. A client that
+sends back a current ETag (If-None-Match) or date (If-Modified-Since) gets
+304 Not Modified before the listing query runs.
+
+A counter row stays locked until the write that bumped it commits, so each
+collection's counter is split over VERSION_SLOTS rows ("batches",
+"batches:1", ...) and readers sum them. A session bumps one slot, picked at
+random, so writes to different stores rarely wait on each other's row.
+
+Writes that bypass the services (bulk loads, manual SQL) do not bump a
+counter. Call bump_versions() after them, or clients keep their copies.
+"""
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from database import upsert_insert
+from models import CollectionVersion
+
+PRODUCTS = "products"
+BATCHES = "batches"
+IMPACT = "impact"
+
+# 0 makes clients revalidate on every use, which costs one 304 round trip
+MAX_AGE_SECONDS = int(os.getenv("HTTP_CACHE_MAX_AGE_SECONDS", "0"))
+
+# Only affects how writes spread; the readers find every slot whatever its value
+VERSION_SLOTS = int(os.getenv("COLLECTION_VERSION_SLOTS", "16"))
+
+def _slot_name(name: str, slot: int):
+    return f"{name}:{slot}" if slot else name
+
+def bump_versions(db: Session, *collections: str):
+    """Advance each collection's counter; commits with the caller's transaction"""
+    now = datetime.utcnow()
+    # One slot per session: a transaction that bumps again, or bumps several
+    # collections, locks the same rows in the same (sorted) order
+    slot = db.info.setdefault("collection_version_slot", random.randrange(VERSION_SLOTS))
+    # Rows as execute parameters, not a multi-row VALUES: that form has no
+    # cache key and was compiled again on every write. The Core connection
+    # skips the ORM bulk-insert layer a parameter list would go through.
+    stmt = upsert_insert(db, CollectionVersion)
+    db.connection().execute(stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"version": CollectionVersion.version + 1, "updated_at": stmt.excluded.updated_at}
+    ), [{"name": _slot_name(name, slot), "version": 1, "updated_at": now} for name in sorted(set(collections))])
+
+def get_versions(db: Session, collections: Iterable[str]) -> Dict[str, Tuple[int, datetime]]:
+    """(version, updated_at) per collection, over all its slots; collections never written are absent"""
+    collections = list(collections)
+    rows = db.execute(
+        select(CollectionVersion.name, CollectionVersion.version, CollectionVersion.updated_at)
+        .where(or_(CollectionVersion.name.in_(collections),
+                   *(CollectionVersion.name.startswith(f"{name}:") for name in collections)))
+    )
+    versions = {}
+    for slot_name, version, updated_at in rows:
+        name = slot_name.partition(":")[0]
+        total, latest = versions.get(name, (0, updated_at))
+        versions[name] = (total + version, max(latest, updated_at))
+    return versions
+
+def validator_headers(collections: Iterable[str], versions: Dict[str, Tuple[int, datetime]]):
+    """ETag, Last-Modified and Cache-Control for a response built from collections"""
+    tag = "-".join(f"{name}.{versions.get(name, (0, None))[0]}" for name in collections)
+    headers = {
+        "ETag": f'W/"{tag}"',
+        "Cache-Control": f"max-age={MAX_AGE_SECONDS}, must-revalidate" if MAX_AGE_SECONDS else "no-cache",
+    }
+    updated = [updated_at for _, updated_at in versions.values()]
+    if updated:
+        last_modified = max(updated).replace(microsecond=0, tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution: a date is only a safe
+        # validator once a later change can no longer share its second
+        if last_modified + timedelta(seconds=1) <= datetime.now(timezone.utc):
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+def not_modified(request_headers, headers) -> bool:
+    """Whether the client's cached copy matches the validators in headers"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as GET allows: W/ prefixes are ignored
+        etag = headers["ETag"].removeprefix("W/")
+        return if_none_match.strip() == "*" or any(
+            candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None and "Last-Modified" in headers:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(headers["Last-Modified"]) <= since
+    return False